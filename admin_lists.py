@@ -0,0 +1,135 @@
+from collections import namedtuple
+from datetime import date
+from sqlalchemy import func
+from app import db
+from models import User, Student, Teacher, Payment
+from pagination import approximate_total, keyset_page
+from serializers import PAYMENT, STUDENT, TEACHER
+
+# Listagens do painel administrativo (alunos, professores, financeiro),
+# paginadas no servidor. Filtros e ordenação viram SQL; as páginas seguem
+# por cursor (keyset), então a página N custa o mesmo que a primeira. O
+# total exibido é aproximado (contagem guardada por alguns segundos).
+#
+# A mesma consulta atende a página HTML e /admin/list/<nome>, que devolve
+# JSON (itens e as linhas da tabela já renderizadas) para o "Carregar mais".
+
+ADMIN_LISTS = {}
+
+PAYMENT_STATUSES = ('pending', 'paid', 'overdue', 'cancelled')
+
+ListPage = namedtuple('ListPage', 'rows next_cursor total params')
+
+def _prefix(value):
+    """Padrão LIKE para "começa com", escapando os curingas digitados"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{escaped}%'
+
+def _name_prefix(value):
+    return value.strip() or None
+
+def _flag(value):
+    return {'1': True, '0': False}.get(value)
+
+def _status(value):
+    return value if value in PAYMENT_STATUSES else None
+
+def _month(value):
+    """'AAAA-MM' -> primeiro dia do mês"""
+    try:
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+class AdminList:
+    def __init__(self, name, resource, rows_template, sorts, filters, per_page=50):
+        """
+        sorts: {parâmetro: ([(campo, coluna), ...], decrescente)}; o primeiro é
+        o padrão e a última coluna deve ser única (id).
+        filters: {parâmetro: (conversão do texto, função (query, valor) -> query)};
+        valores que a conversão devolve como None são ignorados.
+        """
+        self.name = name
+        self.resource = resource
+        self.rows_template = rows_template
+        self.sorts = sorts
+        self.default_sort = next(iter(sorts))
+        self.filters = filters
+        self.per_page = per_page
+        ADMIN_LISTS[name] = self
+
+    def page(self, args):
+        params = {}
+        query = self.resource.query()
+        for param, (parse, apply) in self.filters.items():
+            value = parse(args.get(param, ''))
+            if value is not None:
+                query = apply(query, value)
+                params[param] = args[param]
+
+        sort = args.get('sort') if args.get('sort') in self.sorts else self.default_sort
+        if sort != self.default_sort:
+            params['sort'] = sort
+        keys, descending = self.sorts[sort]
+        columns = [column for _, column in keys]
+
+        def key(row):
+            return [getattr(row, name) for name, _ in keys]
+
+        try:
+            rows, next_cursor = keyset_page(query, columns, key, self.per_page, args.get('cursor'), descending)
+        except ValueError:
+            # Cursor de outra ordenação ou adulterado: volta ao início
+            rows, next_cursor = keyset_page(query, columns, key, self.per_page, None, descending)
+
+        total = approximate_total((self.name, tuple(sorted(params.items()))), query)
+        return ListPage(rows, next_cursor, total, params)
+
+def _active(column):
+    return lambda query, value: query.filter(column == value)
+
+def _starts_with(column):
+    """
+    "Começa com" sem diferenciar maiúsculas, pelo índice em lower(coluna).
+    No PostgreSQL é um LIKE (índice com text_pattern_ops); o SQLite só usa
+    índice em LIKE com collation NOCASE, então lá vira a faixa equivalente
+    [prefixo, prefixo seguinte), exata na ordem binária dele. O lower() do
+    SQLite só converte letras ASCII, então o prefixo é convertido do mesmo
+    jeito ('Él' continua achando 'Élio'; 'él' não acha, como na coluna).
+    """
+    lowered = func.lower(column)
+
+    def apply(query, value):
+        if db.session.get_bind().dialect.name == 'postgresql':
+            return query.filter(lowered.like(_prefix(value.lower()), escape='\\'))
+        prefix = ''.join(char.lower() if char.isascii() else char for char in value)
+        return query.filter(lowered >= prefix, lowered < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return apply
+
+AdminList('students', STUDENT, 'admin/_student_rows.html', {
+    'name': ([('name', User.full_name), ('id', Student.id)], False),
+    '-name': ([('name', User.full_name), ('id', Student.id)], True),
+    'recent': ([('id', Student.id)], True),
+}, {
+    'q': (_name_prefix, _starts_with(User.full_name)),
+    'active': (_flag, _active(User._is_active)),
+})
+
+AdminList('teachers', TEACHER, 'admin/_teacher_rows.html', {
+    'name': ([('name', User.full_name), ('id', Teacher.id)], False),
+    '-name': ([('name', User.full_name), ('id', Teacher.id)], True),
+    'recent': ([('id', Teacher.id)], True),
+}, {
+    'q': (_name_prefix, _starts_with(User.full_name)),
+    'active': (_flag, _active(User._is_active)),
+})
+
+AdminList('payments', PAYMENT, 'admin/_payment_rows.html', {
+    '-due_date': ([('due_date', Payment.due_date), ('id', Payment.id)], True),
+    'due_date': ([('due_date', Payment.due_date), ('id', Payment.id)], False),
+}, {
+    'status': (_status, lambda query, value: query.filter(Payment.status == value)),
+    'month': (_month, lambda query, value: query.filter(Payment.reference_month == value)),
+    'q': (_name_prefix, _starts_with(User.full_name)),
+})
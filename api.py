@@ -1,13 +1,20 @@
 
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, g, abort
 from flask_login import login_required, current_user
 from functools import wraps
 import jwt
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
 from werkzeug.security import check_password_hash
 from models import *
-from app import db
-from sqlalchemy import and_
+from app import db, csrf
+from sqlalchemy import and_, func
+from sqlalchemy.exc import IntegrityError
+from api_tokens import InvalidToken, epoch_seconds, verify_token
+from pagination import approximate_total, keyset_page
+from table_versions import etag
+from rollups import DashboardCounters, ReportingRollups
+from serializers import COURSE, PAYMENT, STUDENT, STUDENT_DETAIL, STUDENT_ENROLLMENT, STUDENT_PAYMENT
 
 api = Blueprint('api', __name__, url_prefix='/api/v1')
 
@@ -19,20 +26,15 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token é obrigatório'}), 401
         
+        if token.startswith('Bearer '):
+            token = token[7:]
+        
         try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-            user = User.query.get(current_user_id)
-            
-            if not user or not user.is_active:
-                return jsonify({'error': 'Token inválido'}), 401
-                
+            # Usuário do token disponível para as views
+            g.api_user = verify_token(token)
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError:
+        except InvalidToken:
             return jsonify({'error': 'Token inválido'}), 401
         
         return f(*args, **kwargs)
@@ -50,9 +52,12 @@ def get_token():
     user = User.query.filter_by(email=data['email']).first()
     
     if user and user.is_active and check_password_hash(user.password_hash, data['password']):
+        now = datetime.utcnow()
         token = jwt.encode({
             'user_id': user.id,
-            'exp': datetime.utcnow() + timedelta(hours=24)
+            # Com frações de segundo, como as revogações (api_tokens.is_revoked)
+            'iat': epoch_seconds(now),
+            'exp': now + timedelta(hours=24)
         }, current_app.config['SECRET_KEY'], algorithm='HS256')
         
         return jsonify({
@@ -68,27 +73,79 @@ def get_token():
     
     return jsonify({'error': 'Credenciais inválidas'}), 401
 
+def _cursor_args(default_per_page):
+    """per_page limitado e o cursor da requisição (None no modo por página)"""
+    per_page = max(1, min(request.args.get('per_page', default_per_page, type=int), 100))
+    return per_page, request.args.get('cursor')
+
+def _wants_total():
+    return request.args.get('include_total', '').lower() in ('1', 'true')
+
+PAYMENT_STATUSES = ('pending', 'paid', 'overdue', 'cancelled')
+
+def _batch_items(key):
+    """Lista `key` do corpo JSON e a flag atomic, ou uma resposta de erro"""
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else None
+    
+    if not isinstance(items, list) or not items:
+        return None, None, (jsonify({'error': f'{key} deve ser uma lista não vazia'}), 400)
+    
+    max_size = current_app.config.get('API_MAX_BATCH_SIZE', 500)
+    if len(items) > max_size:
+        return None, None, (jsonify({'error': f'Lote maior que o limite de {max_size} itens'}), 413)
+    
+    return items, bool(data.get('atomic')), None
+
+def _can_write():
+    return g.api_user.user_type in ('admin', 'secretary')
+
+def _reject_batch(errors):
+    db.session.rollback()
+    return jsonify({'errors': errors, 'message': 'Nenhum item gravado'}), 422
+
 @api.route('/students', methods=['GET'])
 @token_required
+@etag('students', 'users')
 def api_students():
-    """Listar alunos"""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    """
+    Listar alunos.
+    
+    Com ?cursor= (vazio na primeira página) a paginação é por cursor, em
+    ordem de id e sem COUNT; ?page= continua funcionando para clientes antigos.
+    ?fields=id,name,... limita os campos retornados.
+    """
+    per_page, cursor = _cursor_args(20)
+    try:
+        fields = STUDENT.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    query = STUDENT.query(fields)
+    
+    if cursor is not None:
+        try:
+            students, next_cursor = keyset_page(
+                query, [Student.id], lambda row: [row.id], per_page, cursor
+            )
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        
+        pagination = {'per_page': per_page, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+        if _wants_total():
+            pagination['total'] = approximate_total('students', query)
+        
+        return jsonify({
+            'students': STUDENT.dump(students, fields),
+            'pagination': pagination
+        })
     
-    students = db.session.query(Student, User).join(User).paginate(
+    page = request.args.get('page', 1, type=int)
+    students = query.order_by(Student.id).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'students': [{
-            'id': student.id,
-            'name': user.full_name,
-            'email': user.email,
-            'phone': user.phone,
-            'birth_date': student.birth_date.isoformat() if student.birth_date else None,
-            'registration_date': student.registration_date.isoformat() if student.registration_date else None,
-            'is_active': user.is_active
-        } for student, user in students.items],
+        'students': STUDENT.dump(students.items, fields),
         'pagination': {
             'page': students.page,
             'pages': students.pages,
@@ -99,81 +156,135 @@ def api_students():
 
 @api.route('/students/<int:student_id>', methods=['GET'])
 @token_required
+@etag('students', 'users', 'enrollments', 'courses', 'payments')
 def api_student_detail(student_id):
-    """Detalhes de um aluno"""
-    student = Student.query.get_or_404(student_id)
-    user = User.query.get_or_404(student.user_id)
+    """Detalhes de um aluno (?fields limita os campos do aluno)"""
+    try:
+        fields = STUDENT_DETAIL.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    student = STUDENT_DETAIL.query(fields).filter(Student.id == student_id).first()
+    if student is None:
+        abort(404)
     
     # Buscar matrículas
-    enrollments = db.session.query(Enrollment, Course).join(Course).filter(
-        Enrollment.student_id == student_id
-    ).all()
+    enrollments = STUDENT_ENROLLMENT.query().filter(Enrollment.student_id == student_id).all()
     
     # Buscar pagamentos
-    payments = Payment.query.filter_by(student_id=student_id).order_by(
+    payments = STUDENT_PAYMENT.query().filter(Payment.student_id == student_id).order_by(
         Payment.due_date.desc()
     ).limit(10).all()
     
+    return jsonify(_student_detail_json(student, fields, enrollments, payments))
+
+def _student_detail_json(student, fields, enrollments, payments):
+    return STUDENT_DETAIL.serializer(fields)(student) | {
+        'enrollments': STUDENT_ENROLLMENT.dump(enrollments),
+        'recent_payments': STUDENT_PAYMENT.dump(payments)
+    }
+
+@api.route('/students/batch', methods=['POST'])
+@csrf.exempt
+@token_required
+def api_students_batch():
+    """
+    Detalhes de vários alunos: {"ids": [1, 2, ...], "fields": "id,name"}.
+    
+    Três consultas para o lote todo (alunos, matrículas e os últimos
+    pagamentos de cada aluno). Ids inexistentes voltam em not_found.
+    """
+    ids, _, error = _batch_items('ids')
+    if error:
+        return error
+    if not all(type(student_id) is int for student_id in ids):
+        return jsonify({'error': 'ids deve ser uma lista de inteiros'}), 400
+    ids = list(dict.fromkeys(ids))
+    
+    try:
+        fields = STUDENT_DETAIL.parse_fields(request.get_json().get('fields'))
+    except (ValueError, AttributeError):
+        return jsonify({'error': 'Campos inválidos'}), 400
+    
+    students = {
+        student.id: student
+        for student in STUDENT_DETAIL.query(fields).filter(Student.id.in_(ids))
+    }
+    
+    enrollments = {}
+    for enrollment in STUDENT_ENROLLMENT.query().filter(Enrollment.student_id.in_(students)):
+        enrollments.setdefault(enrollment.student_id, []).append(enrollment)
+    
+    # Os 10 pagamentos mais recentes de cada aluno, como no detalhe individual
+    ranked = db.session.query(
+        Payment.id,
+        func.row_number().over(
+            partition_by=Payment.student_id, order_by=(Payment.due_date.desc(), Payment.id.desc())
+        ).label('position')
+    ).filter(Payment.student_id.in_(students)).subquery()
+    payments = {}
+    for payment in STUDENT_PAYMENT.query().join(ranked, Payment.id == ranked.c.id).filter(
+        ranked.c.position <= 10
+    ).order_by(Payment.due_date.desc(), Payment.id.desc()):
+        payments.setdefault(payment.student_id, []).append(payment)
+    
     return jsonify({
-        'id': student.id,
-        'name': user.full_name,
-        'email': user.email,
-        'phone': user.phone,
-        'birth_date': student.birth_date.isoformat() if student.birth_date else None,
-        'address': student.address,
-        'emergency_contact': student.emergency_contact,
-        'emergency_phone': student.emergency_phone,
-        'registration_date': student.registration_date.isoformat() if student.registration_date else None,
-        'is_active': user.is_active,
-        'enrollments': [{
-            'id': enrollment.id,
-            'course_name': course.name,
-            'course_instrument': course.instrument,
-            'enrollment_date': enrollment.enrollment_date.isoformat(),
-            'status': enrollment.status,
-            'monthly_payment': float(enrollment.monthly_payment or course.monthly_price)
-        } for enrollment, course in enrollments],
-        'recent_payments': [{
-            'id': payment.id,
-            'amount': float(payment.amount),
-            'due_date': payment.due_date.isoformat(),
-            'payment_date': payment.payment_date.isoformat() if payment.payment_date else None,
-            'status': payment.status,
-            'reference_month': payment.reference_month.isoformat()
-        } for payment in payments]
+        'students': [
+            _student_detail_json(students[student_id], fields,
+                                 enrollments.get(student_id, []), payments.get(student_id, []))
+            for student_id in ids if student_id in students
+        ],
+        'not_found': [student_id for student_id in ids if student_id not in students]
     })
 
 @api.route('/payments', methods=['GET'])
 @token_required
+@etag('payments', 'students', 'users')
 def api_payments():
-    """Listar pagamentos"""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 50, type=int), 100)
+    """
+    Listar pagamentos (vencimento mais recente primeiro).
+    
+    Com ?cursor= a paginação é por cursor sobre (due_date, id), sem COUNT;
+    ?page= continua funcionando para clientes antigos. ?fields=id,amount,...
+    limita os campos retornados.
+    """
+    per_page, cursor = _cursor_args(50)
     status = request.args.get('status')
+    try:
+        fields = PAYMENT.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    query = db.session.query(Payment, Student, User).join(
-        Student, Payment.student_id == Student.id
-    ).join(User, Student.user_id == User.id)
+    query = PAYMENT.query(fields)
     
     if status:
         query = query.filter(Payment.status == status)
     
-    payments = query.order_by(Payment.due_date.desc()).paginate(
+    if cursor is not None:
+        try:
+            payments, next_cursor = keyset_page(
+                query, [Payment.due_date, Payment.id], lambda row: [row.due_date, row.id],
+                per_page, cursor, descending=True
+            )
+        except ValueError:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        
+        pagination = {'per_page': per_page, 'next_cursor': next_cursor, 'has_more': next_cursor is not None}
+        if _wants_total():
+            pagination['total'] = approximate_total(('payments', status), query)
+        
+        return jsonify({
+            'payments': PAYMENT.dump(payments, fields),
+            'pagination': pagination
+        })
+    
+    page = request.args.get('page', 1, type=int)
+    payments = query.order_by(Payment.due_date.desc(), Payment.id.desc()).paginate(
         page=page, per_page=per_page, error_out=False
     )
     
     return jsonify({
-        'payments': [{
-            'id': payment.id,
-            'student_name': user.full_name,
-            'student_email': user.email,
-            'amount': float(payment.amount),
-            'due_date': payment.due_date.isoformat(),
-            'payment_date': payment.payment_date.isoformat() if payment.payment_date else None,
-            'status': payment.status,
-            'payment_method': payment.payment_method,
-            'reference_month': payment.reference_month.isoformat()
-        } for payment, student, user in payments.items],
+        'payments': PAYMENT.dump(payments.items, fields),
         'pagination': {
             'page': payments.page,
             'pages': payments.pages,
@@ -182,47 +293,209 @@ def api_payments():
         }
     })
 
+def _parse_date(item, field, required=False):
+    value = item.get(field)
+    if value is None:
+        if required:
+            raise ValueError(f'Campo {field} é obrigatório')
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Campo {field} deve ser uma data AAAA-MM-DD')
+
+def _parse_id(item, field, required=True):
+    value = item.get(field)
+    if value is None and not required:
+        return None
+    if type(value) is not int:
+        raise ValueError(f'Campo {field} deve ser um inteiro')
+    return value
+
+def _parse_text(item, field, column):
+    """Texto opcional; o tamanho máximo é o da coluna (String(n))"""
+    value = item.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'Campo {field} deve ser um texto')
+    length = getattr(column.type, 'length', None)
+    if length is not None and len(value) > length:
+        raise ValueError(f'Campo {field} deve ter no máximo {length} caracteres')
+    return value
+
+def _parse_payment(item):
+    if not isinstance(item, dict):
+        raise ValueError('Item deve ser um objeto')
+    
+    try:
+        amount = Decimal(str(item.get('amount')))
+    except InvalidOperation:
+        raise ValueError('Campo amount deve ser um número')
+    if not amount.is_finite() or amount < 0:
+        raise ValueError('Campo amount deve ser um número não negativo')
+    
+    status = item.get('status', 'pending')
+    if status not in PAYMENT_STATUSES:
+        raise ValueError(f'Status inválido: {status}')
+    
+    return Payment(
+        student_id=_parse_id(item, 'student_id'),
+        enrollment_id=_parse_id(item, 'enrollment_id', required=False),
+        amount=amount,
+        due_date=_parse_date(item, 'due_date', required=True),
+        payment_date=_parse_date(item, 'payment_date') or (date.today() if status == 'paid' else None),
+        status=status,
+        payment_method=_parse_text(item, 'payment_method', Payment.payment_method),
+        reference_month=_parse_date(item, 'reference_month', required=True),
+        notes=_parse_text(item, 'notes', Payment.notes)
+    )
+
+@api.route('/payments/batch', methods=['POST'])
+@csrf.exempt
+@token_required
+def api_create_payments_batch():
+    """
+    Criar vários pagamentos: {"payments": [{...}, ...], "atomic": false}.
+    
+    Os itens válidos são gravados em uma única transação e os inválidos
+    voltam em errors com o índice do item. Com "atomic": true, qualquer erro
+    cancela o lote inteiro.
+    """
+    if not _can_write():
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    items, atomic, error = _batch_items('payments')
+    if error:
+        return error
+    
+    parsed, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, _parse_payment(item)))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    
+    # Alunos, matrículas e mensalidades já existentes do lote, uma consulta cada
+    student_ids = {payment.student_id for _, payment in parsed}
+    enrollment_ids = {payment.enrollment_id for _, payment in parsed if payment.enrollment_id}
+    students = {row.id for row in db.session.query(Student.id).filter(Student.id.in_(student_ids))}
+    enrollments = dict(db.session.query(Enrollment.id, Enrollment.student_id).filter(Enrollment.id.in_(enrollment_ids)))
+    billed = set(db.session.query(Payment.enrollment_id, Payment.reference_month).filter(
+        Payment.enrollment_id.in_(enrollment_ids)
+    ))
+    
+    created = []
+    for index, payment in parsed:
+        if payment.student_id not in students:
+            error = 'Aluno não encontrado'
+        elif payment.enrollment_id and enrollments.get(payment.enrollment_id) != payment.student_id:
+            error = 'Matrícula não encontrada para o aluno'
+        elif payment.enrollment_id and (payment.enrollment_id, payment.reference_month) in billed:
+            error = 'Já existe pagamento para esta matrícula e mês'
+        else:
+            if payment.enrollment_id:
+                billed.add((payment.enrollment_id, payment.reference_month))
+            created.append((index, payment))
+            continue
+        errors.append({'index': index, 'error': error})
+    
+    if errors and atomic:
+        return _reject_batch(sorted(errors, key=lambda e: e['index']))
+    
+    db.session.add_all(payment for _, payment in created)
+    try:
+        db.session.flush()
+        # Ids lidos antes do commit, que expira os objetos
+        created = [{'index': index, 'id': payment.id} for index, payment in created]
+        db.session.commit()
+    except IntegrityError:
+        # Outra transação criou a mesma mensalidade ao mesmo tempo
+        db.session.rollback()
+        return jsonify({'error': 'Conflito ao gravar o lote; nenhum item gravado'}), 409
+    
+    return jsonify({'created': created, 'errors': sorted(errors, key=lambda e: e['index'])})
+
+@api.route('/payments/batch-status', methods=['POST'])
+@csrf.exempt
+@token_required
+def api_update_payments_batch():
+    """
+    Atualizar o status de vários pagamentos: {"updates": [{"id": 1,
+    "status": "paid", "payment_date": "2025-01-10", "payment_method": "pix"},
+    ...], "atomic": false}.
+    
+    Os pagamentos são carregados em uma consulta e gravados em uma única
+    transação. "paid" sem payment_date usa a data de hoje.
+    """
+    if not _can_write():
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    items, atomic, error = _batch_items('updates')
+    if error:
+        return error
+    
+    ids = [item.get('id') for item in items if isinstance(item, dict) and type(item.get('id')) is int]
+    payments = {payment.id: payment for payment in Payment.query.filter(Payment.id.in_(ids))}
+    
+    updated, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Item deve ser um objeto')
+            payment = payments.get(_parse_id(item, 'id'))
+            if payment is None:
+                raise ValueError('Pagamento não encontrado')
+            status = item.get('status')
+            if status not in PAYMENT_STATUSES:
+                raise ValueError(f'Status inválido: {status}')
+            payment_date = _parse_date(item, 'payment_date')
+            payment_method = _parse_text(item, 'payment_method', Payment.payment_method)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        
+        payment.status = status
+        if payment_date or status == 'paid':
+            payment.payment_date = payment_date or payment.payment_date or date.today()
+        if 'payment_method' in item:
+            payment.payment_method = payment_method
+        updated.append({'index': index, 'id': payment.id})
+    
+    if errors and atomic:
+        return _reject_batch(errors)
+    
+    db.session.commit()
+    return jsonify({'updated': updated, 'errors': errors})
+
 @api.route('/courses', methods=['GET'])
 @token_required
+@etag('courses')
 def api_courses():
-    """Listar cursos"""
-    courses = Course.query.filter_by(is_active=True).all()
+    """Listar cursos (?fields limita os campos retornados)"""
+    try:
+        fields = COURSE.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'courses': [{
-            'id': course.id,
-            'name': course.name,
-            'description': course.description,
-            'instrument': course.instrument,
-            'level': course.level,
-            'monthly_price': float(course.monthly_price),
-            'max_students': course.max_students,
-            'teacher_id': course.teacher_id
-        } for course in courses]
-    })
+    courses = COURSE.query(fields).filter(Course.is_active == True).all()
+    
+    return jsonify({'courses': COURSE.dump(courses, fields)})
 
 @api.route('/stats', methods=['GET'])
 @token_required
+@etag('students', 'users', 'courses', 'payments', vary=lambda: datetime.now().date().replace(day=1))
 def api_stats():
     """Estatísticas gerais"""
-    total_students = Student.query.count()
-    active_students = db.session.query(Student).join(User).filter(User.is_active == True).count()
-    total_courses = Course.query.filter_by(is_active=True).count()
-    pending_payments = Payment.query.filter_by(status='pending').count()
-    
-    # Receita do mês atual
-    from sqlalchemy import func, extract
-    current_month_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == 'paid',
-        extract('month', Payment.payment_date) == datetime.now().month,
-        extract('year', Payment.payment_date) == datetime.now().year
-    ).scalar() or 0
+    # Contadores e receita mantidos pelos agregados (rollups.py), sem COUNT/SUM
+    counters = DashboardCounters.current()
+    current_month_revenue = ReportingRollups.revenue_for_month(datetime.now().date())
     
     return jsonify({
-        'total_students': total_students,
-        'active_students': active_students,
-        'total_courses': total_courses,
-        'pending_payments': pending_payments,
+        'total_students': counters.students,
+        'active_students': counters.active_students,
+        'total_courses': counters.active_courses,
+        'pending_payments': counters.pending_payments,
         'current_month_revenue': float(current_month_revenue)
     })
 
@@ -0,0 +1,165 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+import jwt
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from caching import TTLCache
+from models import ApiTokenRevocation, User
+
+# Cache dos tokens da API já verificados. A chave é o SHA-256 do token (o
+# token em si não fica na memória) e o valor é um retrato leve do usuário,
+# válido até o TTL ou a expiração do token, o que vier primeiro.
+#
+# Desativar ou excluir um usuário, mudar o tipo dele (admin, secretaria...)
+# ou a senha grava uma revogação (api_token_revocations) na mesma
+# transação: tokens emitidos antes dela deixam de valer. Cada
+# processo mantém a lista de revogações em memória e a recarrega a cada
+# API_REVOCATION_REFRESH segundos; no processo que fez a alteração ela vale
+# logo após o commit.
+
+ApiUser = namedtuple('ApiUser', 'id full_name email user_type issued_at')
+
+class InvalidToken(Exception):
+    pass
+
+_tokens = TTLCache(max_size=10000, ttl=300)
+_revocations = {}
+_revocations_state = {'loaded_at': None}
+_revocations_lock = threading.Lock()
+
+def token_key(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def epoch_seconds(value):
+    """
+    Segundos desde a época, com frações (microssegundos do datetime). É a
+    resolução do 'iat' dos tokens e das revogações: as duas comparações
+    precisam usar a mesma.
+    """
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+def _refresh_revocations():
+    refresh = current_app.config.get('API_REVOCATION_REFRESH', 5)
+    loaded_at = _revocations_state['loaded_at']
+    if loaded_at is not None and time.monotonic() - loaded_at < refresh:
+        return
+
+    rows = db.session.query(ApiTokenRevocation.user_id, ApiTokenRevocation.revoked_at).all()
+    with _revocations_lock:
+        _revocations.clear()
+        _revocations.update({user_id: epoch_seconds(revoked_at) for user_id, revoked_at in rows})
+        _revocations_state['loaded_at'] = time.monotonic()
+
+def is_revoked(api_user):
+    """
+    Token emitido antes da revogação do usuário. Vale o token com
+    iat >= revoked_at: um emitido depois de reativar o usuário continua
+    válido mesmo no mesmo segundo da revogação. Tokens antigos, com 'iat'
+    em segundos inteiros, emitidos no segundo da revogação contam como
+    anteriores a ela.
+    """
+    revoked_at = _revocations.get(api_user.id)
+    return revoked_at is not None and api_user.issued_at < revoked_at
+
+def verify_token(token):
+    """
+    ApiUser do token, pelo cache ou verificando assinatura e usuário.
+
+    Raises:
+        jwt.ExpiredSignatureError: token expirado
+        InvalidToken: assinatura, usuário ou revogação inválidos
+    """
+    _refresh_revocations()
+    key = token_key(token)
+
+    cached = _tokens.get(key)
+    if cached is not None:
+        api_user, expires_at = cached
+        if expires_at <= time.time():
+            _tokens.pop(key)
+            raise jwt.ExpiredSignatureError('Token expirado')
+        if is_revoked(api_user):
+            _tokens.pop(key)
+            raise InvalidToken('Token revogado')
+        return api_user
+
+    try:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise
+    except jwt.InvalidTokenError as e:
+        raise InvalidToken(str(e))
+
+    user = db.session.get(User, data.get('user_id'))
+    if not user or not user.is_active:
+        raise InvalidToken('Usuário inválido')
+
+    # Tokens antigos, sem 'iat', valem como emitidos no início da época
+    api_user = ApiUser(user.id, user.full_name, user.email, user.user_type, data.get('iat', 0))
+    if is_revoked(api_user):
+        raise InvalidToken('Token revogado')
+
+    expires_at = data.get('exp', float('inf'))
+    ttl = min(current_app.config.get('API_TOKEN_CACHE_TTL', 300), expires_at - time.time())
+    if ttl > 0:
+        _tokens.set(key, (api_user, expires_at), ttl=ttl)
+    return api_user
+
+def _revoke(connection, user_ids, revoked_at):
+    table = ApiTokenRevocation.__table__
+    dialect = connection.dialect.name
+    insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect)
+    rows = [{'user_id': user_id, 'revoked_at': revoked_at} for user_id in user_ids]
+
+    if insert is None:
+        connection.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+        connection.execute(table.insert(), rows)
+        return
+
+    stmt = insert(table)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id'], set_={'revoked_at': stmt.excluded.revoked_at}
+    ), rows)
+
+def _after_flush(session, flush_context):
+    revoked = set()
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            attrs = inspect(obj).attrs
+            # O tipo fica no retrato em cache (permissões de escrita): mudou, revoga
+            if (attrs._is_active.history.has_changes() and not obj._is_active) \
+                    or attrs.user_type.history.has_changes() or attrs.password_hash.history.has_changes():
+                revoked.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            revoked.add(obj.id)
+
+    if revoked:
+        revoked_at = datetime.utcnow()
+        _revoke(session.connection(), revoked, revoked_at)
+        session.info.setdefault('api_revocations', {}).update(
+            {user_id: epoch_seconds(revoked_at) for user_id in revoked}
+        )
+
+def _after_commit(session):
+    revocations = session.info.pop('api_revocations', None)
+    if revocations:
+        with _revocations_lock:
+            _revocations.update(revocations)
+
+def _after_rollback(session):
+    session.info.pop('api_revocations', None)
+
+def register_api_tokens(app):
+    _tokens.max_size = app.config.get('API_TOKEN_CACHE_SIZE', 10000)
+    _tokens.ttl = app.config.get('API_TOKEN_CACHE_TTL', 300)
+
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
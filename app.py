@@ -49,6 +49,50 @@ def create_app():
     app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
     app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
     app.config["MAIL_DEFAULT_SENDER"] = os.environ.get("MAIL_DEFAULT_SENDER", "noreply@solmaior.com")
+    app.config["MAIL_BATCH_SIZE"] = int(os.environ.get("MAIL_BATCH_SIZE", "50"))  # Messages per SMTP connection
+    app.config["MAIL_MAX_PER_SECOND"] = float(os.environ.get("MAIL_MAX_PER_SECOND", "0"))  # 0 = no limit
+    
+    # Email outbox worker configuration
+    app.config["OUTBOX_MAX_ATTEMPTS"] = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+    app.config["OUTBOX_BACKOFF_SECONDS"] = int(os.environ.get("OUTBOX_BACKOFF_SECONDS", "60"))
+    app.config["OUTBOX_WORKER_THREADS"] = int(os.environ.get("OUTBOX_WORKER_THREADS", "4"))
+    app.config["OUTBOX_BATCH_SIZE"] = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+    
+    # Billing configuration
+    app.config["BILLING_CHUNK_SIZE"] = int(os.environ.get("BILLING_CHUNK_SIZE", "500"))
+    
+    # Audit log writer configuration
+    app.config["AUDIT_FLUSH_INTERVAL"] = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1.0"))  # Seconds between writes
+    app.config["AUDIT_FSYNC"] = os.environ.get("AUDIT_FSYNC", "never")  # never, batch
+    app.config["AUDIT_QUEUE_SIZE"] = int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+    app.config["AUDIT_RETENTION_DAYS"] = int(os.environ.get("AUDIT_RETENTION_DAYS", "0"))  # 0 = keep forever
+    
+    # Identity cache (logged-in user and student/teacher profile per process)
+    app.config["IDENTITY_CACHE_SIZE"] = int(os.environ.get("IDENTITY_CACHE_SIZE", "1000"))
+    app.config["IDENTITY_CACHE_TTL"] = int(os.environ.get("IDENTITY_CACHE_TTL", "60"))  # Seconds
+    
+    # API token cache
+    app.config["API_TOKEN_CACHE_SIZE"] = int(os.environ.get("API_TOKEN_CACHE_SIZE", "10000"))
+    app.config["API_TOKEN_CACHE_TTL"] = int(os.environ.get("API_TOKEN_CACHE_TTL", "300"))  # Seconds
+    app.config["API_REVOCATION_REFRESH"] = int(os.environ.get("API_REVOCATION_REFRESH", "5"))  # Seconds
+    app.config["TABLE_VERSION_REFRESH"] = float(os.environ.get("TABLE_VERSION_REFRESH", "1"))  # Seconds between version reads (ETags)
+    app.config["STUDENT_LOOKUP_RELOAD_INTERVAL"] = float(os.environ.get("STUDENT_LOOKUP_RELOAD_INTERVAL", "30"))  # Min seconds between typeahead index reloads for other workers' changes
+    app.config["API_TOTAL_CACHE_TTL"] = int(os.environ.get("API_TOTAL_CACHE_TTL", "60"))  # Approximate totals in cursor mode
+    app.config["API_MAX_BATCH_SIZE"] = int(os.environ.get("API_MAX_BATCH_SIZE", "500"))  # Items per batch request
+    
+    # Schedule conflict detection
+    app.config["EXPERIMENTAL_CLASS_MINUTES"] = int(os.environ.get("EXPERIMENTAL_CLASS_MINUTES", "60"))  # Length assumed for trial classes
+    
+    # Write-behind hit counters (news views, material downloads/previews)
+    app.config["HIT_COUNTER_FLUSH_INTERVAL"] = float(os.environ.get("HIT_COUNTER_FLUSH_INTERVAL", "10"))  # Seconds between writes
+    app.config["HIT_COUNTER_MAX_PENDING"] = int(os.environ.get("HIT_COUNTER_MAX_PENDING", "1000"))  # Distinct rows before an early write
+    
+    # Cache of anonymous public pages (landing, help, contact)
+    app.config["PUBLIC_PAGE_MAX_AGE"] = int(os.environ.get("PUBLIC_PAGE_MAX_AGE", "60"))  # Seconds proxies/browsers may reuse cached public pages
+    
+    # Response compression (gzip, negotiated via Accept-Encoding)
+    app.config["COMPRESS_LEVEL"] = int(os.environ.get("COMPRESS_LEVEL", "6"))  # 1-9, 0 disables compression
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))  # Bytes
     
     # Upload configuration
     app.config["UPLOAD_FOLDER"] = "uploads"
@@ -58,6 +102,9 @@ def create_app():
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
     
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    if app.config["COMPRESS_LEVEL"]:
+        from compression import GzipMiddleware
+        app.wsgi_app = GzipMiddleware(app.wsgi_app, app.config["COMPRESS_LEVEL"], app.config["COMPRESS_MIN_SIZE"])
     
     # Initialize extensions
     db.init_app(app)
@@ -72,8 +119,8 @@ def create_app():
     
     @login_manager.user_loader
     def load_user(user_id):
-        from models import User
-        return User.query.get(int(user_id))
+        from identity import load_identity
+        return load_identity(int(user_id))
     
     # Register blueprints
     from routes import register_blueprints
@@ -83,10 +130,54 @@ def create_app():
     from utils import register_template_filters
     register_template_filters(app)
     
+    # Register CLI commands
+    from commands import register_commands
+    register_commands(app)
+    
+    # Cache the logged-in identity, invalidated when users or profiles change
+    from identity import register_identity
+    register_identity(app)
+    
+    # Cache verified API tokens, revoked when users are deactivated or change role or password
+    from api_tokens import register_api_tokens
+    register_api_tokens(app)
+    
+    # Cache approximate totals for cursor-paginated API lists
+    from pagination import register_pagination
+    register_pagination(app)
+    
+    # Per-table change counters for API ETags
+    from table_versions import register_table_versions
+    register_table_versions(app)
+    
+    # Keep reporting rollups in sync with payments and enrollments
+    from rollups import register_rollups
+    register_rollups(app)
+    
+    # In-process student typeahead index, updated on user and student commits
+    from student_lookup import register_student_lookup
+    register_student_lookup(app)
+    
+    # Keep the admin full-text search index in sync with users, courses and news
+    from search import register_search
+    register_search(app)
+    
+    # Buffer news/material hit counts in memory and write them in batches
+    from hit_counters import register_hit_counters
+    register_hit_counters(app)
+    
+    # Room/teacher interval index for timetable conflict checks
+    from schedule_conflicts import register_schedule_conflicts
+    register_schedule_conflicts(app)
+    
     with app.app_context():
         from models import User, Student, Teacher, Room, Course, Enrollment, Schedule, Payment, Material, ExperimentalClass
         db.create_all()
         
+        # Apply schema changes to tables created before the current models
+        from migrations import upgrade
+        upgrade()
+        
         # Create default admin user if not exists
         admin = User.query.filter_by(email='admin@solmaior.com').first()
         if not admin:
@@ -0,0 +1,349 @@
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import zipfile
+from contextlib import closing
+
+# Índice dos logs de auditoria: um banco SQLite ao lado dos arquivos
+# audit_YYYYMMDD.log com uma linha por registro (dia, posição e tamanho da
+# linha no arquivo, mais os campos filtráveis). As consultas filtram no
+# índice e leem do arquivo só as linhas encontradas. Os arquivos só recebem
+# linhas no final, então o índice guarda quantos bytes de cada arquivo já
+# processou e, antes de cada consulta, indexa apenas o que foi acrescentado
+# nos dias do intervalo consultado.
+#
+# Um dia pode estar em audit_YYYYMMDD.log (dia em andamento), em
+# audit_YYYYMMDD.log.gz (dia fechado) ou como membro do arquivo mensal
+# audit_YYYYMM.zip (ver audit_rotation.py). Posições e tamanhos se referem
+# sempre ao conteúdo descompactado, então compactar não invalida o índice.
+
+INDEX_FILENAME = 'audit_index.sqlite3'
+LOG_FILE_PATTERN = re.compile(r'^audit_(\d{8})\.log(\.gz)?$')
+ARCHIVE_PATTERN = re.compile(r'^audit_(\d{6})\.zip$')
+ARCHIVE_INDEX = 'index.json'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS files ('
+    ' day TEXT PRIMARY KEY, indexed_bytes INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' day TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL,'
+    ' ts TEXT, user_id INTEGER, action TEXT, entity_type TEXT, entity_id TEXT,'
+    ' PRIMARY KEY (day, offset))',
+    'CREATE INDEX IF NOT EXISTS ix_entries_user ON entries (user_id, day, offset)',
+    'CREATE INDEX IF NOT EXISTS ix_entries_action ON entries (action, day, offset)',
+    'CREATE INDEX IF NOT EXISTS ix_entries_entity ON entries (entity_type, entity_id, day, offset)',
+)
+
+READ_CHUNK = 1024 * 1024
+
+def _day(value):
+    return value.strftime('%Y%m%d') if value else None
+
+def encode_cursor(day, offset):
+    return f'{day}-{offset}'
+
+def decode_cursor(cursor):
+    """Cursor opaco 'YYYYMMDD-offset'; ValueError se inválido"""
+    day, _, offset = cursor.partition('-')
+    if len(day) != 8 or not day.isdigit():
+        raise ValueError('Cursor inválido')
+    return day, int(offset)
+
+class AuditIndex:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, INDEX_FILENAME)
+
+    def _connect(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')  # O índice pode ser recriado a partir dos arquivos
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    # ------------------------------------------------------------------
+    # Arquivos
+    # ------------------------------------------------------------------
+
+    def sources(self, first_day=None, last_day=None):
+        """
+        Onde está cada dia do intervalo: {dia: (tipo, caminho, membro)}, com
+        tipo 'log', 'gz' ou 'zip'. Só os nomes dos arquivos são usados para
+        descartar dias fora do intervalo; de um arquivo mensal que cruza o
+        intervalo lê-se apenas o index.json embutido.
+        """
+        if not os.path.exists(self.log_dir):
+            return {}
+
+        # Um dia pode existir em mais de uma forma durante a rotação, ou se
+        # chegarem linhas atrasadas depois de compactado; a forma compactada
+        # mais recente é a que o índice conhece (a rotação seguinte junta o resto)
+        priority = {'gz': 0, 'zip': 1, 'log': 2}
+        found = {}
+
+        def add(day, source):
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                return
+            if day not in found or priority[source[0]] < priority[found[day][0]]:
+                found[day] = source
+
+        for filename in os.listdir(self.log_dir):
+            path = os.path.join(self.log_dir, filename)
+            match = LOG_FILE_PATTERN.match(filename)
+            if match:
+                add(match.group(1), ('gz' if match.group(2) else 'log', path, None))
+                continue
+
+            match = ARCHIVE_PATTERN.match(filename)
+            if not match:
+                continue
+            month = match.group(1)
+            if (first_day and month < first_day[:6]) or (last_day and month > last_day[:6]):
+                continue
+            try:
+                for day, info in read_archive_index(path)['days'].items():
+                    add(day, ('zip', path, info['member']))
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                logging.error(f'Arquivo de auditoria inválido {filename}: {e}')
+
+        return found
+
+    def log_days(self, first_day=None, last_day=None):
+        """Dias com log no intervalo"""
+        return sorted(self.sources(first_day, last_day))
+
+    @staticmethod
+    def source_size(source):
+        """Tamanho descompactado do conteúdo do dia"""
+        kind, path, member = source
+        if kind == 'log':
+            return os.path.getsize(path)
+        if kind == 'gz':
+            # Os 4 últimos bytes do gzip guardam o tamanho original (mod 2^32)
+            with open(path, 'rb') as f:
+                f.seek(-4, os.SEEK_END)
+                return struct.unpack('<I', f.read(4))[0]
+        with zipfile.ZipFile(path) as archive:
+            return archive.getinfo(member).file_size
+
+    @staticmethod
+    def open_source(source):
+        """Conteúdo do dia aberto em modo binário, descompactado sob demanda"""
+        kind, path, member = source
+        if kind == 'log':
+            return open(path, 'rb')
+        if kind == 'gz':
+            return gzip.open(path, 'rb')
+        archive = zipfile.ZipFile(path)
+        try:
+            # O membro aberto mantém o arquivo zip aberto até ser fechado
+            return archive.open(member)
+        finally:
+            archive.close()
+
+    def open_day(self, day):
+        """Log do dia aberto em modo binário (None se não existir)"""
+        source = self.sources(day, day).get(day)
+        return self.open_source(source) if source else None
+
+    # ------------------------------------------------------------------
+    # Indexação
+    # ------------------------------------------------------------------
+
+    def _index_day(self, connection, day, source, indexed_bytes):
+        """Indexa as linhas completas acrescentadas ao arquivo desde a última vez"""
+        with self.open_source(source) as log_file:
+            log_file.seek(indexed_bytes)
+            offset = indexed_bytes
+            pending = b''
+            rows = []
+
+            while True:
+                data = log_file.read(READ_CHUNK)
+                if not data:
+                    break
+                data = pending + data
+                start = 0
+                while True:
+                    end = data.find(b'\n', start)
+                    if end == -1:
+                        break
+                    line = data[start:end + 1]
+                    row = self._entry_row(day, offset, line)
+                    if row:
+                        rows.append(row)
+                    offset += len(line)
+                    start = end + 1
+                pending = data[start:]
+
+                if len(rows) >= 10000:
+                    self._store(connection, day, offset, rows)
+                    rows = []
+
+            # Linha incompleta no final (gravação em andamento) fica para a próxima vez
+            self._store(connection, day, offset, rows)
+
+    @staticmethod
+    def _entry_row(day, offset, line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(entry, dict):
+            return None
+
+        entity_id = entry.get('entity_id')
+        return (
+            day, offset, len(line),
+            entry.get('timestamp'),
+            entry.get('user_id'),
+            entry.get('action'),
+            entry.get('entity_type'),
+            str(entity_id) if entity_id is not None else None
+        )
+
+    @staticmethod
+    def _store(connection, day, indexed_bytes, rows):
+        with connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO entries '
+                '(day, offset, length, ts, user_id, action, entity_type, entity_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            connection.execute(
+                'INSERT INTO files (day, indexed_bytes) VALUES (?, ?) '
+                'ON CONFLICT (day) DO UPDATE SET indexed_bytes = MAX(indexed_bytes, excluded.indexed_bytes)',
+                (day, indexed_bytes)
+            )
+
+    def catch_up(self, connection, sources):
+        """Indexa o que falta dos dias pedidos (só conteúdo que cresceu)"""
+        indexed = dict(connection.execute('SELECT day, indexed_bytes FROM files'))
+        for day, source in sorted(sources.items()):
+            try:
+                if self.source_size(source) > indexed.get(day, 0):
+                    self._index_day(connection, day, source, indexed.get(day, 0))
+            except (OSError, EOFError, KeyError, zipfile.BadZipFile) as e:
+                logging.error(f'Erro ao indexar o log de auditoria de {day}: {e}')
+
+    def forget_missing(self, before):
+        """
+        Remove do índice os dias anteriores a `before` cujo conteúdo não está
+        mais em nenhum arquivo (retenção). Dias ainda guardados num arquivo
+        mensal continuam indexados até o arquivo ser apagado; sem isso a
+        próxima consulta indexaria tudo de novo.
+        """
+        kept = set(self.sources(last_day=before))
+        with closing(self._connect()) as connection:
+            indexed = [day for (day,) in connection.execute('SELECT day FROM files WHERE day < ?', (before,))]
+            missing = [(day,) for day in indexed if day not in kept]
+            with connection:
+                connection.executemany('DELETE FROM entries WHERE day = ?', missing)
+                connection.executemany('DELETE FROM files WHERE day = ?', missing)
+        return [day for (day,) in missing]
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def query(self, start_date=None, end_date=None, user_id=None, action=None,
+              entity_type=None, entity_id=None, limit=100, cursor=None):
+        """
+        Registros mais recentes primeiro. Retorna (registros, próximo cursor);
+        o cursor é None quando não há mais registros.
+        """
+        first_day, last_day = _day(start_date), _day(end_date)
+        if cursor:
+            cursor_day, cursor_offset = decode_cursor(cursor)
+            if not last_day or cursor_day < last_day:
+                last_day = cursor_day
+
+        sources = self.sources(first_day, last_day)
+        if not sources:
+            return [], None
+        days = sorted(sources)
+
+        conditions, params = ['day >= ?', 'day <= ?'], [days[0], days[-1]]
+        if cursor:
+            conditions.append('(day < ? OR (day = ? AND offset < ?))')
+            params += [cursor_day, cursor_day, cursor_offset]
+        if user_id is not None:
+            conditions.append('user_id = ?')
+            params.append(user_id)
+        if action:
+            conditions.append('action = ?')
+            params.append(action)
+        if entity_type:
+            conditions.append('entity_type = ?')
+            params.append(entity_type)
+        if entity_id is not None:
+            conditions.append('entity_id = ?')
+            params.append(str(entity_id))
+
+        with closing(self._connect()) as connection:
+            self.catch_up(connection, sources)
+            rows = connection.execute(
+                f'SELECT day, offset, length FROM entries WHERE {" AND ".join(conditions)} '
+                'ORDER BY day DESC, offset DESC LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+
+        return self._read_entries(rows, sources), next_cursor
+
+    def _read_entries(self, rows, sources):
+        """
+        Lê as linhas indicadas pelo índice, abrindo cada dia uma vez. Dentro
+        do dia a leitura segue a ordem do arquivo, para que dias compactados
+        sejam descompactados uma única vez, do início até a última linha pedida.
+        """
+        by_day = {}
+        for day, offset, length in rows:
+            by_day.setdefault(day, []).append((offset, length))
+
+        lines = {}
+        for day, positions in by_day.items():
+            source = sources.get(day)
+            if source is None:
+                continue
+            try:
+                with self.open_source(source) as log_file:
+                    for offset, length in sorted(positions):
+                        log_file.seek(offset)
+                        lines[(day, offset)] = log_file.read(length)
+            except (OSError, EOFError, zipfile.BadZipFile) as e:
+                logging.error(f'Erro ao ler o log de auditoria de {day}: {e}')
+
+        entries = []
+        for day, offset, length in rows:
+            line = lines.get((day, offset))
+            if line is None:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logging.warning(f'Registro de auditoria ilegível em {day}:{offset}')
+        return entries
+
+    def rebuild(self):
+        """Apaga e recria o índice a partir de todos os arquivos"""
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute('DELETE FROM entries')
+                connection.execute('DELETE FROM files')
+            self.catch_up(connection, self.sources())
+
+def read_archive_index(path):
+    """index.json embutido no arquivo mensal"""
+    with zipfile.ZipFile(path) as archive:
+        return json.loads(archive.read(ARCHIVE_INDEX))
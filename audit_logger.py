@@ -2,8 +2,154 @@
 from datetime import datetime
 from flask import current_app, request
 from flask_login import current_user
+import atexit
 import json
+import logging
 import os
+import queue
+import sqlite3
+import threading
+import time
+
+LOG_DIR = 'logs'
+
+def log_filename(timestamp):
+    """Nome do arquivo do dia a partir do timestamp ISO do registro"""
+    return f"audit_{timestamp[0:4]}{timestamp[5:7]}{timestamp[8:10]}.log"
+
+class AuditSink:
+    """
+    Grava os registros de auditoria em segundo plano.
+
+    log_action só coloca o registro na fila; uma thread do processo junta
+    os registros e grava cada lote com um único os.write por arquivo do
+    dia, em descritores abertos com O_APPEND e mantidos abertos pelo
+    processo. Com O_APPEND cada write vai inteiro para o fim do arquivo,
+    então linhas de workers diferentes não se misturam.
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._files = {}
+        self.flush_interval = 1.0
+        self.fsync = 'never'
+
+    def _ensure_started(self):
+        # Depois de um fork (workers do gunicorn) a thread não existe no filho
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+
+            config = current_app.config
+            self.flush_interval = config.get('AUDIT_FLUSH_INTERVAL', 1.0)
+            self.fsync = config.get('AUDIT_FSYNC', 'never')
+            self._queue = queue.Queue(maxsize=config.get('AUDIT_QUEUE_SIZE', 10000))
+            self._files = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def put(self, entry):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # Fila cheia: grava na própria requisição em vez de perder o registro
+            self._write([entry])
+
+    def flush(self, timeout=5):
+        """Espera a gravação de tudo o que já está na fila deste processo"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def stop(self, timeout=5):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+        for fd in self._files.values():
+            os.close(fd)
+        self._files = {}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+
+            # Junta o que chegar durante o intervalo em um único lote;
+            # flush() e stop() encerram a espera na hora
+            batch, waiters, stopping = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+
+                if stopping or waiters or len(batch) >= self.BATCH_SIZE:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logging.error(f'Audit log writer error: {e}')
+            for waiter in waiters:
+                waiter.set()
+            if stopping:
+                return
+
+    def _file(self, filename):
+        fd = self._files.get(filename)
+        if fd is None:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            # Mantém só o arquivo do dia atual aberto (e o anterior perto da meia-noite)
+            for old in sorted(self._files)[:-1]:
+                os.close(self._files.pop(old))
+            fd = os.open(os.path.join(LOG_DIR, filename), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._files[filename] = fd
+        return fd
+
+    def _write(self, entries):
+        by_file = {}
+        for entry in entries:
+            line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+            by_file.setdefault(log_filename(entry['timestamp']), []).append(line)
+
+        with self._lock:
+            for filename, lines in by_file.items():
+                try:
+                    fd = self._file(filename)
+                    data = ''.join(lines).encode('utf-8')
+                    while data:
+                        written = os.write(fd, data)
+                        data = data[written:]
+                    if self.fsync == 'batch':
+                        os.fsync(fd)
+                except OSError as e:
+                    logging.error(f'Audit log write error ({filename}): {e}')
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.stop)
 
 class AuditLogger:
     @staticmethod
@@ -30,17 +176,8 @@ class AuditLogger:
                 'details': details or {}
             }
             
-            # Criar diretório de logs se não existir
-            log_dir = 'logs'
-            os.makedirs(log_dir, exist_ok=True)
-            
-            # Nome do arquivo baseado na data
-            log_filename = f"audit_{datetime.now().strftime('%Y%m%d')}.log"
-            log_path = os.path.join(log_dir, log_filename)
-            
-            # Escrever no arquivo
-            with open(log_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            # A gravação em arquivo é feita pela thread do AuditSink
+            audit_sink.put(log_entry)
                 
         except Exception as e:
             current_app.logger.error(f'Audit log error: {e}')
@@ -73,51 +210,51 @@ class AuditLogger:
     @staticmethod
     def get_logs(start_date=None, end_date=None, user_id=None, action=None):
         """
-        Recupera logs de auditoria com filtros
+        Recupera logs de auditoria com filtros (os 1000 mais recentes)
+        """
+        logs, _ = AuditLogger.query_logs(start_date=start_date, end_date=end_date,
+                                         user_id=user_id, action=action, limit=1000)
+        return logs
+    
+    @staticmethod
+    def query_logs(start_date=None, end_date=None, user_id=None, action=None,
+                   entity_type=None, entity_id=None, limit=100, cursor=None):
         """
+        Consulta paginada dos logs de auditoria, mais recentes primeiro
+        
+        Returns:
+            tuple: (registros, cursor da próxima página ou None)
+        
+        Raises:
+            ValueError: cursor inválido
+        """
+        from audit_index import AuditIndex
+        
+        audit_sink.flush()
         try:
-            logs = []
-            log_dir = 'logs'
-            
-            if not os.path.exists(log_dir):
-                return logs
-            
-            # Listar arquivos de log
-            log_files = [f for f in os.listdir(log_dir) if f.startswith('audit_') and f.endswith('.log')]
-            log_files.sort(reverse=True)  # Mais recentes primeiro
-            
-            for log_file in log_files:
-                log_path = os.path.join(log_dir, log_file)
-                
-                with open(log_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        try:
-                            log_entry = json.loads(line.strip())
-                            
-                            # Aplicar filtros
-                            if start_date:
-                                log_date = datetime.fromisoformat(log_entry['timestamp']).date()
-                                if log_date < start_date:
-                                    continue
-                            
-                            if end_date:
-                                log_date = datetime.fromisoformat(log_entry['timestamp']).date()
-                                if log_date > end_date:
-                                    continue
-                            
-                            if user_id and log_entry.get('user_id') != user_id:
-                                continue
-                            
-                            if action and log_entry.get('action') != action:
-                                continue
-                            
-                            logs.append(log_entry)
-                            
-                        except json.JSONDecodeError:
-                            continue
-            
-            return logs[:1000]  # Limitar a 1000 registros
-            
-        except Exception as e:
+            return AuditIndex(LOG_DIR).query(
+                start_date=start_date, end_date=end_date, user_id=user_id, action=action,
+                entity_type=entity_type, entity_id=entity_id, limit=limit, cursor=cursor
+            )
+        except (OSError, sqlite3.Error) as e:
             current_app.logger.error(f'Error reading audit logs: {e}')
-            return []
+            return [], None
+    
+    @staticmethod
+    def iter_logs():
+        """
+        Percorre todos os registros de auditoria, do mais antigo ao mais
+        recente, lendo os arquivos linha a linha (para exportação)
+        """
+        from audit_index import AuditIndex
+        
+        audit_sink.flush()
+        
+        # Inclui dias compactados (.log.gz) e arquivados (audit_YYYYMM.zip)
+        for day, source in sorted(AuditIndex(LOG_DIR).sources().items()):
+            with AuditIndex.open_source(source) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
@@ -0,0 +1,148 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from datetime import date, timedelta
+from audit_index import ARCHIVE_INDEX, ARCHIVE_PATTERN, LOG_FILE_PATTERN, AuditIndex, read_archive_index
+
+# Rotação dos logs de auditoria (`flask audit-rotate`, uma vez por dia):
+#   1. dias fechados: audit_YYYYMMDD.log -> audit_YYYYMMDD.log.gz
+#   2. meses fechados: os .log.gz do mês -> audit_YYYYMM.zip, com um
+#      index.json que lista os dias, membros e tamanhos
+#   3. retenção: apaga dias (e meses inteiros) mais antigos que o limite
+# Cada arquivo novo é gravado com nome temporário e renomeado ao final, e o
+# original só é apagado depois disso; uma rotação interrompida pode ser
+# executada de novo.
+
+COPY_BUFFER = 1024 * 1024
+
+def _replace(tmp_path, path):
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class AuditRotation:
+    MIN_IDLE_SECONDS = 600  # Arquivo do dia anterior pode receber as últimas linhas logo após a meia-noite
+
+    @staticmethod
+    def compress_closed_days(log_dir, today):
+        """Compacta os arquivos de dias anteriores a hoje. Retorna os dias compactados."""
+        compressed = []
+        for filename in sorted(os.listdir(log_dir)):
+            match = LOG_FILE_PATTERN.match(filename)
+            if not match or match.group(2) or match.group(1) >= today.strftime('%Y%m%d'):
+                continue
+
+            path = os.path.join(log_dir, filename)
+            if time.time() - os.path.getmtime(path) < AuditRotation.MIN_IDLE_SECONDS:
+                continue
+
+            # Linhas atrasadas de um dia já compactado vão para o final do conteúdo existente
+            day = match.group(1)
+            tmp_path = f'{path}.gz.tmp'
+            with gzip.open(tmp_path, 'wb', compresslevel=9) as target:
+                previous = AuditIndex(log_dir).sources(day, day).get(day)
+                if previous and previous[0] != 'log':
+                    with AuditIndex.open_source(previous) as source:
+                        shutil.copyfileobj(source, target, COPY_BUFFER)
+                with open(path, 'rb') as source:
+                    shutil.copyfileobj(source, target, COPY_BUFFER)
+            _replace(tmp_path, f'{path}.gz')
+            os.remove(path)
+            compressed.append(day)
+
+        return compressed
+
+    @staticmethod
+    def archive_closed_months(log_dir, today):
+        """
+        Junta os dias compactados de meses anteriores ao atual em
+        audit_YYYYMM.zip. Se o arquivo do mês já existe (dias que chegaram
+        depois), ele é regravado com os dias novos. Retorna os meses arquivados.
+        """
+        current_month = today.strftime('%Y%m')
+        by_month = {}
+        for filename in os.listdir(log_dir):
+            match = LOG_FILE_PATTERN.match(filename)
+            if match and match.group(2) and match.group(1)[:6] < current_month:
+                by_month.setdefault(match.group(1)[:6], []).append(match.group(1))
+
+        for month, days in sorted(by_month.items()):
+            path = os.path.join(log_dir, f'audit_{month}.zip')
+            tmp_path = f'{path}.tmp'
+            index = {'month': month, 'days': {}}
+
+            with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+                if os.path.exists(path):
+                    previous = read_archive_index(path)
+                    with zipfile.ZipFile(path) as old:
+                        for day, info in previous['days'].items():
+                            if day in days:
+                                continue
+                            with old.open(info['member']) as source, archive.open(info['member'], 'w') as target:
+                                shutil.copyfileobj(source, target, COPY_BUFFER)
+                            index['days'][day] = info
+
+                for day in sorted(days):
+                    member = f'audit_{day}.log'
+                    lines = size = 0
+                    with gzip.open(os.path.join(log_dir, f'{member}.gz'), 'rb') as source, \
+                            archive.open(member, 'w', force_zip64=True) as target:
+                        while True:
+                            data = source.read(COPY_BUFFER)
+                            if not data:
+                                break
+                            target.write(data)
+                            lines += data.count(b'\n')
+                            size += len(data)
+                    index['days'][day] = {'member': member, 'size': size, 'lines': lines}
+
+                index['days'] = dict(sorted(index['days'].items()))
+                archive.writestr(ARCHIVE_INDEX, json.dumps(index, indent=1))
+
+            _replace(tmp_path, path)
+            for day in days:
+                os.remove(os.path.join(log_dir, f'audit_{day}.log.gz'))
+
+        return sorted(by_month)
+
+    @staticmethod
+    def apply_retention(log_dir, today, retention_days):
+        """Apaga os logs anteriores ao limite de retenção. Retorna os arquivos apagados."""
+        if not retention_days:
+            return []
+
+        cutoff = (today - timedelta(days=retention_days)).strftime('%Y%m%d')
+        removed = []
+        for filename in sorted(os.listdir(log_dir)):
+            match = LOG_FILE_PATTERN.match(filename)
+            if match:
+                expired = match.group(1) < cutoff
+            else:
+                match = ARCHIVE_PATTERN.match(filename)
+                # Um arquivo mensal só sai quando o mês inteiro expirou
+                expired = bool(match) and f'{match.group(1)}31' < cutoff
+            if expired:
+                os.remove(os.path.join(log_dir, filename))
+                removed.append(filename)
+
+        AuditIndex(log_dir).forget_missing(cutoff)
+        return removed
+
+    @staticmethod
+    def rotate(log_dir, retention_days=0, today=None):
+        today = today or date.today()
+        if not os.path.exists(log_dir):
+            return {'compressed': [], 'archived': [], 'removed': []}
+
+        result = {
+            'compressed': AuditRotation.compress_closed_days(log_dir, today),
+            'archived': AuditRotation.archive_closed_months(log_dir, today),
+            'removed': AuditRotation.apply_retention(log_dir, today, retention_days)
+        }
+        logging.info(f"Rotação de auditoria: {len(result['compressed'])} dias compactados, "
+                     f"{len(result['archived'])} meses arquivados, {len(result['removed'])} arquivos removidos")
+        return result
@@ -0,0 +1,136 @@
+"""
+Benchmark da compressão gzip das respostas.
+
+Gera as páginas administrativas maiores (alunos, financeiro, calendário),
+uma página da API de pagamentos e a exportação CSV de pagamentos sobre um
+banco sintético, e passa cada corpo pelo GzipMiddleware em vários níveis.
+Mostra o tamanho original e comprimido, o tempo de CPU gasto na compressão
+e o tempo de transferência economizado em um link lento (2 Mbit/s por
+padrão, o Wi-Fi da escola em horário de aula).
+
+Uso:
+    python benchmarks/bench_compression.py [--students 500] [--levels 1,6,9] [--mbps 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['COMPRESS_LEVEL'] = '0'  # Corpos originais; a compressão é medida à parte
+
+from sqlalchemy import insert, select
+from werkzeug.security import generate_password_hash
+from app import app, db
+from models import User, Student, Teacher, Course, Enrollment, Schedule, Room, Payment
+from compression import GzipMiddleware
+
+REPEAT = 20
+
+def seed(students):
+    db.session.execute(insert(User), [
+        {'username': f'aluno{i}', 'email': f'aluno{i}@example.com', 'password_hash': 'x',
+         'user_type': 'student', 'full_name': f'Aluno Exemplo {i}', 'phone': '(11) 99999-0000', '_is_active': True}
+        for i in range(students)
+    ])
+    user_ids = db.session.execute(select(User.id).where(User.user_type == 'student')).scalars().all()
+    db.session.execute(insert(Student), [{'user_id': uid, 'birth_date': date(2000, 1, 1)} for uid in user_ids])
+    student_ids = db.session.execute(select(Student.id)).scalars().all()
+
+    teacher_user = User(username='prof', email='prof@example.com', password_hash='x', user_type='teacher',
+                        full_name='Professor Exemplo')
+    db.session.add(teacher_user)
+    db.session.flush()
+    teacher = Teacher(user_id=teacher_user.id)
+    room = Room(name='Sala 1', capacity=10)
+    db.session.add_all([teacher, room])
+    db.session.flush()
+    course = Course(name='Violão', instrument='violão', monthly_price=200, max_students=students, teacher_id=teacher.id)
+    db.session.add(course)
+    db.session.flush()
+
+    db.session.execute(insert(Enrollment), [
+        {'student_id': sid, 'course_id': course.id, 'status': 'active'} for sid in student_ids
+    ])
+    db.session.execute(insert(Schedule), [
+        {'course_id': course.id, 'teacher_id': teacher.id, 'room_id': room.id, 'day_of_week': day,
+         'start_time': dtime(8 + hour), 'end_time': dtime(9 + hour), 'is_active': True}
+        for day in range(6) for hour in range(10)
+    ])
+    db.session.execute(Payment.__table__.insert(), [
+        {'student_id': sid, 'amount': 200, 'status': 'pending', 'due_date': date(2025, month, 10),
+         'reference_month': date(2025, month, 1)}
+        for sid in student_ids for month in range(1, 13)
+    ])
+    admin = User.query.filter_by(email='admin@solmaior.com').first()
+    admin.password_hash = generate_password_hash('admin')
+    db.session.commit()
+    return admin.id
+
+def bodies(admin_id):
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+
+    token = client.post('/api/v1/auth/token', json={'email': 'admin@solmaior.com', 'password': 'admin'}).get_json()['token']
+    api_headers = {'Authorization': f'Bearer {token}'}
+
+    pages = {}
+    for label, url, headers in [
+        ('admin/students', '/admin/students', {}),
+        ('admin/finances', '/admin/finances', {}),
+        ('admin/calendar', '/admin/calendar', {}),
+        ('api payments 100', '/api/v1/payments?per_page=100', api_headers),
+        ('csv payments', '/admin/export-report/payments', {}),
+    ]:
+        response = client.get(url, headers=headers)
+        pages[label] = (response.headers['Content-Type'], b''.join(response.response))
+    return pages
+
+def compress(body, content_type, level, chunk_size=None):
+    """Passa o corpo pelo middleware; chunk_size simula uma resposta em streaming"""
+    def wsgi_app(environ, start_response):
+        headers = [('Content-Type', content_type)]
+        if chunk_size is None:
+            headers.append(('Content-Length', str(len(body))))
+            start_response('200 OK', headers)
+            return [body]
+        start_response('200 OK', headers)
+        return (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+    middleware = GzipMiddleware(wsgi_app, level=level)
+    environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+    return b''.join(middleware(environ, lambda status, headers, exc_info=None: None))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--levels', default='1,6,9')
+    parser.add_argument('--mbps', type=float, default=2.0)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+    bytes_per_second = args.mbps * 1e6 / 8
+
+    with app.app_context():
+        pages = bodies(seed(args.students))
+
+    print(f"{'resposta':<18} {'nível':>5} {'original':>10} {'gzip':>10} {'razão':>7} {'CPU':>9} {'economia no link':>17}")
+    for label, (content_type, body) in pages.items():
+        chunk_size = 64 * 1024 if label.startswith('csv') else None
+        for level in levels:
+            start = time.process_time()
+            for _ in range(REPEAT):
+                compressed = compress(body, content_type, level, chunk_size)
+            cpu = (time.process_time() - start) / REPEAT
+            saved = (len(body) - len(compressed)) / bytes_per_second
+            print(f'{label:<18} {level:>5} {len(body) / 1024:>8.0f} KB {len(compressed) / 1024:>7.1f} KB '
+                  f'{len(body) / len(compressed):>6.1f}x {cpu * 1000:>6.2f} ms {saved * 1000:>13.0f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark da exportação de pagamentos em CSV.
+
+Cria uma tabela de pagamentos sintética (1.000.000 de linhas por padrão)
+e consome a resposta de /admin/export-report/payments em streaming,
+medindo tempo, tamanho gerado e pico de memória Python (tracemalloc).
+Com --legacy, mede também a exportação antiga (.all() + StringIO) para
+comparação; use um volume menor, pois ela carrega tudo em memória.
+
+Uso:
+    python benchmarks/bench_export.py [--rows 1000000] [--legacy]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from io import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import insert, select
+from app import app, db
+from models import User, Student, Payment
+from csv_export import CSVExporter
+
+STUDENTS = 1000
+INSERT_BATCH = 50000
+
+def seed(rows):
+    db.session.execute(insert(User), [
+        {'username': f'aluno{i}', 'email': f'aluno{i}@example.com', 'password_hash': 'x',
+         'user_type': 'student', 'full_name': f'Aluno {i}', '_is_active': True}
+        for i in range(STUDENTS)
+    ])
+    user_ids = db.session.execute(select(User.id).where(User.user_type == 'student')).scalars().all()
+    db.session.execute(insert(Student), [{'user_id': uid} for uid in user_ids])
+    student_ids = db.session.execute(select(Student.id)).scalars().all()
+
+    # Insere direto pelo Core, sem os eventos do ORM
+    table = Payment.__table__
+    for start in range(0, rows, INSERT_BATCH):
+        batch = []
+        for i in range(start, min(start + INSERT_BATCH, rows)):
+            month = date(2000 + i // 12 % 25, i % 12 + 1, 1)
+            batch.append({'student_id': student_ids[i % STUDENTS], 'amount': 200, 'status': 'pending',
+                          'due_date': month.replace(day=10), 'reference_month': month})
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+def legacy_export():
+    """Exportação anterior: carrega todos os objetos e monta o CSV inteiro em memória"""
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Aluno', 'Valor', 'Vencimento', 'Status', 'Mês Referência'])
+    payments = db.session.query(Payment, Student, User).join(
+        Student, Payment.student_id == Student.id
+    ).join(User, Student.user_id == User.id).all()
+    for payment, student, user in payments:
+        writer.writerow([
+            user.full_name,
+            f'R$ {payment.amount:.2f}',
+            payment.due_date.strftime('%d/%m/%Y'),
+            payment.status,
+            payment.reference_month.strftime('%m/%Y')
+        ])
+    return [output.getvalue()]
+
+def measure(label, produce):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = chunks = 0
+    for chunk in produce():
+        size += len(chunk)
+        chunks += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<10} {elapsed:>8.2f} s {size / 1e6:>9.1f} MB {chunks:>8} {peak / 1e6:>10.1f} MB')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(args.rows)
+        print(f'{args.rows} pagamentos criados em {time.perf_counter() - start:.1f} s\n')
+
+        print(f"{'método':<10} {'tempo':>10} {'csv':>12} {'pedaços':>8} {'pico mem.':>13}")
+
+        with app.test_request_context():
+            measure('streaming', lambda: CSVExporter.generate('payments'))
+            if args.legacy:
+                measure('legado', legacy_export)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark de uso de índices nas consultas mais frequentes.
+
+Roda EXPLAIN em cada consulta "quente" (relatórios, resumo financeiro,
+lembretes de pagamento, dashboards) e verifica se o plano usa o índice
+esperado.
+
+Uso:
+    python benchmarks/bench_indexes.py                  # SQLite temporário com dados sintéticos
+    DATABASE_URL=postgresql://... python benchmarks/bench_indexes.py
+
+Com um DATABASE_URL externo nenhum dado é inserido; no PostgreSQL o
+EXPLAIN roda com enable_seqscan desligado para mostrar que o índice é
+utilizável mesmo em tabelas pequenas (onde o planner prefere seq scan).
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as dtime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 'DATABASE_URL' not in os.environ
+if SEED:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import func, select, insert, text
+from app import app, db
+from models import User, Student, Teacher, Course, Room, Enrollment, Schedule, Payment, News
+from admin_lists import _starts_with
+
+STUDENTS = int(os.environ.get('BENCH_STUDENTS', 5000))
+MONTHS = int(os.environ.get('BENCH_MONTHS', 12))
+
+def seed():
+    today = date.today()
+    db.session.execute(insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+         'user_type': 'student' if i < STUDENTS else 'teacher', 'full_name': f'Pessoa {i}', '_is_active': True}
+        for i in range(STUDENTS + 20)
+    ])
+    user_ids = [row[0] for row in db.session.execute(select(User.id).where(User.username.like('user%')).order_by(User.id))]
+    db.session.execute(insert(Student), [{'user_id': uid} for uid in user_ids[:STUDENTS]])
+    db.session.execute(insert(Teacher), [{'user_id': uid} for uid in user_ids[STUDENTS:]])
+    teacher_ids = [row[0] for row in db.session.execute(select(Teacher.id))]
+    db.session.execute(insert(Room), [{'name': f'Sala {i}'} for i in range(10)])
+    db.session.execute(insert(Course), [
+        {'name': f'Curso {i}', 'monthly_price': 200, 'max_students': 1000, 'teacher_id': teacher_ids[i % len(teacher_ids)]}
+        for i in range(40)
+    ])
+    student_ids = [row[0] for row in db.session.execute(select(Student.id))]
+    course_ids = [row[0] for row in db.session.execute(select(Course.id))]
+    room_ids = [row[0] for row in db.session.execute(select(Room.id))]
+
+    db.session.execute(insert(Enrollment), [
+        {'student_id': sid, 'course_id': course_ids[i % len(course_ids)], 'status': 'active',
+         'enrollment_date': today - timedelta(days=i % 365), 'monthly_payment': 200}
+        for i, sid in enumerate(student_ids)
+    ])
+    db.session.execute(insert(Schedule), [
+        {'course_id': course_ids[i % len(course_ids)], 'teacher_id': teacher_ids[i % len(teacher_ids)],
+         'room_id': room_ids[i % len(room_ids)], 'day_of_week': i % 6,
+         'start_time': dtime(8 + i % 10), 'end_time': dtime(9 + i % 10)}
+        for i in range(400)
+    ])
+
+    statuses = ['paid'] * 8 + ['pending', 'overdue']
+    for m in range(MONTHS):
+        reference = (today.replace(day=1) - timedelta(days=30 * m)).replace(day=1)
+        db.session.execute(insert(Payment), [
+            {'student_id': sid, 'amount': 200, 'reference_month': reference,
+             'due_date': reference.replace(day=10), 'status': statuses[(sid + m) % len(statuses)],
+             'payment_date': reference.replace(day=8) if statuses[(sid + m) % len(statuses)] == 'paid' else None}
+            for sid in student_ids
+        ])
+
+    db.session.execute(insert(News), [
+        {'title': f'Notícia {i}', 'content': 'Conteúdo', 'author_id': user_ids[0],
+         'is_public': i % 3 != 0, 'publish_date': datetime.now() - timedelta(days=i)}
+        for i in range(2000)
+    ])
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+def hot_queries():
+    today = date.today()
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+    return [
+        ('lembretes: vencem em 3 dias', 'ix_payments_status_due_date',
+         select(Payment.id).where(Payment.status == 'pending', Payment.due_date == today + timedelta(days=3))),
+        ('inadimplência: vencidos', 'ix_payments_status_due_date',
+         select(func.sum(Payment.amount)).where(Payment.status.in_(['pending', 'overdue']), Payment.due_date < today)),
+        # Qualquer índice com prefixo status serve para a contagem
+        ('dashboard: pendentes', ('ix_payments_status_due_date', 'ix_payments_status_payment_date'),
+         select(func.count()).select_from(Payment).where(Payment.status == 'pending')),
+        ('receita do mês', 'ix_payments_status_payment_date',
+         select(func.sum(Payment.amount)).where(Payment.status == 'paid', Payment.payment_date >= month_start,
+                                                Payment.payment_date < next_month_start)),
+        ('mensalidade do aluno no mês', 'ix_payments_student_reference',
+         select(Payment.id).where(Payment.student_id == 1, Payment.reference_month == month_start)),
+        ('vagas ocupadas no curso', 'ix_enrollments_course_status',
+         select(func.count()).select_from(Enrollment).where(Enrollment.course_id == 1, Enrollment.status == 'active')),
+        ('matrícula ativa do aluno', 'ix_enrollments_student_status',
+         select(Enrollment.id).where(Enrollment.student_id == 1, Enrollment.course_id == 1, Enrollment.status == 'active')),
+        ('agenda do professor', 'ix_schedules_teacher_day_start',
+         select(Schedule.id).where(Schedule.teacher_id == 1).order_by(Schedule.day_of_week, Schedule.start_time)),
+        ('perfil de aluno por usuário', 'ix_students_user_id',
+         select(Student.id).where(Student.user_id == 1)),
+        ('perfil de professor por usuário', 'ix_teachers_user_id',
+         select(Teacher.id).where(Teacher.user_id == 1)),
+        # Mesmo filtro das listas do painel (admin_lists._starts_with)
+        ('lista de alunos: nome começa com', 'ix_users_full_name_lower',
+         _starts_with(User.full_name)(select(User.id), 'Pessoa 12')),
+        ('notícias públicas recentes', 'ix_news_public_publish',
+         select(News.id).where(News.is_public == True).order_by(News.publish_date.desc()).limit(6)),
+    ]
+
+def explain(connection, stmt):
+    dialect = connection.dialect
+    compiled = stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+
+    if dialect.name == 'sqlite':
+        # O plano não depende dos valores; datas viram texto como no driver
+        values = tuple(
+            params[name].isoformat() if isinstance(params[name], (date, datetime)) else params[name]
+            for name in compiled.positiontup
+        )
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), values).fetchall()
+        return '\n'.join(str(row[-1]) for row in rows)
+
+    if dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), params).fetchall()
+        return '\n'.join(row[0] for row in rows)
+
+    raise SystemExit(f'Banco não suportado: {dialect.name}')
+
+def timed(connection, stmt, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        connection.execute(stmt).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    with app.app_context():
+        if SEED:
+            print(f'Gerando dados sintéticos ({STUDENTS} alunos, {MONTHS} meses de mensalidades)...')
+            seed()
+
+        failures = 0
+        with db.engine.connect() as connection:
+            print(f'Banco: {connection.dialect.name}\n')
+            queries = hot_queries()
+            for label, index_names, stmt in queries:
+                if isinstance(index_names, str):
+                    index_names = (index_names,)
+                with connection.begin():
+                    plan = explain(connection, stmt)
+                    elapsed = timed(connection, stmt)
+                used = next((name for name in index_names if name in plan), None)
+                failures += used is None
+                print(f"[{'OK ' if used else 'FALHOU'}] {label:<32} {used or index_names[0]:<34} {elapsed:8.3f} ms")
+                if not used:
+                    print('         ' + plan.replace('\n', '\n         '))
+
+        print(f'\n{len(queries) - failures}/{len(queries)} consultas usam o índice esperado')
+        return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark do envio de lembretes de pagamento.
+
+Mede quantas consultas SQL NotificationService.check_and_send_payment_reminders
+executa para volumes crescentes de pagamentos. O envio de e-mail fica
+suprimido (MAIL_SUPPRESS_SEND), então só o custo de banco é medido.
+
+Uso:
+    python benchmarks/bench_reminders.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import delete, insert, select
+from app import app, db
+from models import User, Student, Payment
+from notification_service import NotificationService
+
+SIZES = [int(n) for n in os.environ.get('BENCH_SIZES', '100,1000,5000').split(',')]
+
+def seed(students):
+    today = date.today()
+    db.session.execute(delete(Payment))
+    db.session.execute(delete(Student))
+    db.session.execute(delete(User).where(User.user_type == 'student'))
+
+    db.session.execute(insert(User), [
+        {'username': f'aluno{i}', 'email': f'aluno{i}@example.com', 'password_hash': 'x',
+         'user_type': 'student', 'full_name': f'Aluno {i}', '_is_active': True}
+        for i in range(students)
+    ])
+    user_ids = db.session.execute(select(User.id).where(User.user_type == 'student')).scalars().all()
+    db.session.execute(insert(Student), [{'user_id': uid} for uid in user_ids])
+    student_ids = db.session.execute(select(Student.id)).scalars().all()
+
+    # Por aluno: um pagamento vencendo em 3 dias e dois meses em atraso
+    rows = []
+    for sid in student_ids:
+        rows.append({'student_id': sid, 'amount': 200, 'status': 'pending',
+                     'due_date': today + timedelta(days=3), 'reference_month': today.replace(day=1)})
+        for months_ago in (1, 2):
+            reference = (today.replace(day=1) - timedelta(days=28 * months_ago)).replace(day=1)
+            rows.append({'student_id': sid, 'amount': 200, 'status': 'pending',
+                         'due_date': reference.replace(day=10), 'reference_month': reference})
+    db.session.execute(insert(Payment), rows)
+    db.session.commit()
+    return len(rows)
+
+def main():
+    app.config['MAIL_SUPPRESS_SEND'] = True
+
+    with app.app_context():
+        print(f"{'alunos':>8} {'pagamentos':>11} {'e-mails':>8} {'consultas':>10} {'tempo':>10}")
+        query_counts = set()
+        for students in SIZES:
+            payments = seed(students)
+            start = time.perf_counter()
+            result = NotificationService.check_and_send_payment_reminders()
+            elapsed = time.perf_counter() - start
+            emails = result['warning_sent'] + result['overdue_sent']
+            query_counts.add(result['queries'])
+            print(f"{students:>8} {payments:>11} {emails:>8} {result['queries']:>10} {elapsed * 1000:>8.1f} ms")
+
+        constant = len(query_counts) == 1
+        print('\nNúmero de consultas constante' if constant else '\nNúmero de consultas varia com o volume!')
+        return 0 if constant else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
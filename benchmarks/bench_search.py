@@ -0,0 +1,84 @@
+"""
+Benchmark da busca textual do painel administrativo.
+
+Cria um banco sintético com muitos usuários (nomes com acentos) e
+notícias longas, recria o índice de busca e compara, para algumas
+buscas típicas, o tempo do índice (SearchIndex.search, já com trechos
+destacados) com o de uma varredura LIKE '%termo%' nas tabelas de origem,
+que nem ignora acentos.
+
+Uso:
+    python benchmarks/bench_search.py [--users 20000] [--news 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import insert, or_
+from app import app, db
+from models import User, News
+from search import SearchIndex
+
+FIRST_NAMES = ['João', 'Maria', 'José', 'Ana', 'Márcia', 'Antônio', 'Luís', 'Conceição', 'Sérgio', 'Lúcia']
+LAST_NAMES = ['Silva', 'Souza', 'Araújo', 'Gonçalves', 'Ávila', 'Conceição', 'Peçanha', 'Brandão', 'Simões']
+WORDS = ['aula', 'recital', 'piano', 'violão', 'matrícula', 'férias', 'apresentação', 'música', 'escola', 'horário']
+
+QUERIES = ['joao', 'araujo gon', 'marcia avila', '99999', 'recital piano', 'ferias']
+REPEAT = 50
+
+def seed(users, news):
+    random.seed(1)
+    db.session.execute(insert(User), [
+        {'username': f'u{i}', 'email': f'u{i}@example.com', 'password_hash': 'x', 'user_type': 'student',
+         'full_name': f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)} {random.choice(LAST_NAMES)}',
+         'phone': f'(11) 9{random.randint(1000, 9999)}-{random.randint(1000, 9999)}', '_is_active': True}
+        for i in range(users)
+    ])
+    db.session.execute(insert(News), [
+        {'title': f'Notícia {i} - {random.choice(WORDS)}', 'author_id': 1,
+         'content': ' '.join(random.choice(WORDS) for _ in range(300))}
+        for i in range(news)
+    ])
+    # Inserções em massa não passam pelo flush do ORM
+    start = time.perf_counter()
+    SearchIndex.rebuild()
+    db.session.commit()
+    return time.perf_counter() - start
+
+def like_scan(value):
+    pattern = f'%{value}%'
+    users = User.query.filter(or_(User.full_name.ilike(pattern), User.email.ilike(pattern),
+                                  User.phone.ilike(pattern))).limit(20).all()
+    news = News.query.filter(or_(News.title.ilike(pattern), News.content.ilike(pattern))).limit(20).all()
+    return users + news
+
+def measure(func, value):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        results = func(value)
+    return (time.perf_counter() - start) / REPEAT * 1000, len(results)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--news', type=int, default=2000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        rebuild = seed(args.users, args.news)
+        print(f'{args.users} usuários, {args.news} notícias; índice recriado em {rebuild:.2f} s\n')
+        print(f"{'busca':<16} {'índice':>10} {'result.':>8} {'LIKE':>10} {'result.':>8}")
+        for value in QUERIES:
+            indexed, found = measure(SearchIndex.search, value)
+            scanned, scan_found = measure(like_scan, value)
+            print(f'{value:<16} {indexed:>7.2f} ms {found:>8} {scanned:>7.2f} ms {scan_found:>8}')
+
+if __name__ == '__main__':
+    main()
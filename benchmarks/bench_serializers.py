@@ -0,0 +1,135 @@
+"""
+Benchmark dos serializadores da API.
+
+Compara, para páginas grandes de alunos e de pagamentos, a serialização
+antiga (entidades completas do ORM + dict montado à mão) com a dos
+recursos de serializers.py (só as colunas da resposta + função compilada).
+Mede tempo de CPU por linha e pico de memória Python (tracemalloc) por
+página. Os alunos têm endereço e observações médicas preenchidos, como
+em produção.
+
+Uso:
+    python benchmarks/bench_serializers.py [--students 5000] [--payments 50000] [--page 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import insert, select
+from app import app, db
+from models import User, Student, Payment
+from serializers import PAYMENT, STUDENT
+
+LONG_TEXT = 'Texto longo de exemplo. ' * 40
+
+def seed(students, payments):
+    db.session.execute(insert(User), [
+        {'username': f'aluno{i}', 'email': f'aluno{i}@example.com', 'password_hash': 'x',
+         'user_type': 'student', 'full_name': f'Aluno {i}', 'phone': '(11) 99999-0000', '_is_active': True}
+        for i in range(students)
+    ])
+    user_ids = db.session.execute(select(User.id).where(User.user_type == 'student')).scalars().all()
+    db.session.execute(insert(Student), [
+        {'user_id': uid, 'birth_date': date(2000, 1, 1), 'address': LONG_TEXT, 'medical_info': LONG_TEXT,
+         'notes': LONG_TEXT}
+        for uid in user_ids
+    ])
+    student_ids = db.session.execute(select(Student.id)).scalars().all()
+
+    rows = []
+    for i in range(payments):
+        month = date(2000 + i // 12 % 25, i % 12 + 1, 1)
+        rows.append({'student_id': student_ids[i % len(student_ids)], 'amount': 200, 'status': 'pending',
+                     'due_date': month.replace(day=10), 'reference_month': month, 'notes': LONG_TEXT})
+    db.session.execute(Payment.__table__.insert(), rows)
+    db.session.commit()
+
+def legacy_students(limit):
+    students = db.session.query(Student, User).join(User).order_by(Student.id).limit(limit).all()
+    return [{
+        'id': student.id,
+        'name': user.full_name,
+        'email': user.email,
+        'phone': user.phone,
+        'birth_date': student.birth_date.isoformat() if student.birth_date else None,
+        'registration_date': student.registration_date.isoformat() if student.registration_date else None,
+        'is_active': user.is_active
+    } for student, user in students]
+
+def legacy_payments(limit):
+    payments = db.session.query(Payment, Student, User).join(
+        Student, Payment.student_id == Student.id
+    ).join(User, Student.user_id == User.id).order_by(Payment.due_date.desc(), Payment.id.desc()).limit(limit).all()
+    return [{
+        'id': payment.id,
+        'student_name': user.full_name,
+        'student_email': user.email,
+        'amount': float(payment.amount),
+        'due_date': payment.due_date.isoformat(),
+        'payment_date': payment.payment_date.isoformat() if payment.payment_date else None,
+        'status': payment.status,
+        'payment_method': payment.payment_method,
+        'reference_month': payment.reference_month.isoformat()
+    } for payment, student, user in payments]
+
+def projected_students(limit, fields=None):
+    return STUDENT.dump(STUDENT.query(fields).order_by(Student.id).limit(limit).all(), fields)
+
+def projected_payments(limit, fields=None):
+    rows = PAYMENT.query(fields).order_by(Payment.due_date.desc(), Payment.id.desc()).limit(limit).all()
+    return PAYMENT.dump(rows, fields)
+
+def measure(label, produce, limit, repeat):
+    # Cada página em uma sessão limpa, como em uma requisição
+    db.session.remove()
+    produce(limit)
+    db.session.remove()
+
+    start = time.process_time()
+    for _ in range(repeat):
+        produce(limit)
+        db.session.remove()
+    cpu = (time.process_time() - start) / (repeat * limit)
+
+    tracemalloc.start()
+    result = produce(limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+
+    print(f'{label:<38} {cpu * 1e6:>10.1f} µs {peak / 1e6:>10.2f} MB {len(result):>7}')
+    return cpu, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--payments', type=int, default=50000)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    with app.app_context():
+        start = time.perf_counter()
+        seed(args.students, args.payments)
+        print(f'{args.students} alunos e {args.payments} pagamentos criados em {time.perf_counter() - start:.1f} s\n')
+
+        print(f"{'página de ' + str(args.page):<38} {'CPU/linha':>13} {'pico mem.':>13} {'linhas':>7}")
+        for name, legacy, projected, fields in [
+            ('alunos', legacy_students, projected_students, ('id', 'name')),
+            ('pagamentos', legacy_payments, projected_payments, ('id', 'amount', 'status')),
+        ]:
+            old_cpu, old_peak = measure(f'{name}: ORM + dict', legacy, args.page, args.repeat)
+            new_cpu, new_peak = measure(f'{name}: serializador', projected, args.page, args.repeat)
+            measure(f'{name}: ?fields={",".join(fields)}', lambda limit: projected(limit, fields), args.page, args.repeat)
+            print(f'{"":<38} {old_cpu / new_cpu:>12.1f}x {old_peak / new_peak:>12.1f}x\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+import logging
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import and_, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from app import db
+from models import BillingRun, Course, Enrollment, Payment
+from rollups import DashboardCounters, ReportingRollups
+
+class BillingService:
+    DUE_DAY = 10  # Vencimento padrão: dia 10 do mês
+
+    @staticmethod
+    def missing_payments(reference_month, due_date, created_at, first_enrollment_id=None, last_enrollment_id=None):
+        """
+        SELECT das mensalidades que faltam para o mês de referência.
+
+        Uma linha por matrícula ativa sem pagamento (enrollment_id,
+        reference_month). Matrículas cujo aluno já tem um pagamento avulso
+        (sem matrícula) no mês ficam de fora, como no faturamento por aluno
+        anterior, para não cobrar o mesmo mês duas vezes.
+        """
+        existing = aliased(Payment)
+        amount = func.coalesce(Enrollment.monthly_payment, Course.monthly_price)
+        notes = literal(f"Mensalidade {reference_month.strftime('%m/%Y')} - ") + Course.name
+
+        legacy_payment = exists().where(
+            Payment.student_id == Enrollment.student_id,
+            Payment.reference_month == reference_month,
+            Payment.enrollment_id == None
+        )
+
+        query = select(
+            Enrollment.student_id,
+            Enrollment.id,
+            amount,
+            literal(due_date, db.Date),
+            literal('pending'),
+            literal(reference_month, db.Date),
+            notes,
+            literal(created_at, db.DateTime)
+        ).join(
+            Course, Enrollment.course_id == Course.id
+        ).outerjoin(
+            existing, and_(existing.enrollment_id == Enrollment.id, existing.reference_month == reference_month)
+        ).where(
+            Enrollment.status == 'active',
+            existing.id == None,
+            amount != None,
+            ~legacy_payment
+        )
+
+        if first_enrollment_id is not None:
+            query = query.where(Enrollment.id >= first_enrollment_id)
+        if last_enrollment_id is not None:
+            query = query.where(Enrollment.id <= last_enrollment_id)
+
+        return query
+
+    @staticmethod
+    def _insert_payments(query):
+        """INSERT ... SELECT que ignora linhas já existentes (índice único matrícula/mês)"""
+        columns = ['student_id', 'enrollment_id', 'amount', 'due_date', 'status', 'reference_month', 'notes', 'created_at']
+        dialect = db.session.get_bind().dialect.name
+
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(Payment).from_select(columns, query)
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(Payment).from_select(columns, query)
+        else:
+            return insert(Payment).from_select(columns, query)
+
+        return stmt.on_conflict_do_nothing(index_elements=['enrollment_id', 'reference_month'])
+
+    @staticmethod
+    def generate_monthly_payments(year, month, due_day=None, first_enrollment_id=None, last_enrollment_id=None):
+        """
+        Gera as mensalidades do mês para todas as matrículas ativas (ou para
+        uma faixa de ids de matrícula) com um único INSERT ... SELECT.
+
+        Executar de novo para o mesmo mês não cria duplicatas. Não faz
+        commit; retorna a quantidade de mensalidades criadas.
+        """
+        reference_month = date(year, month, 1)
+        due_date = date(year, month, due_day or BillingService.DUE_DAY)
+        created_at = datetime.utcnow()
+
+        query = BillingService.missing_payments(
+            reference_month, due_date, created_at,
+            first_enrollment_id=first_enrollment_id,
+            last_enrollment_id=last_enrollment_id
+        )
+        result = db.session.execute(BillingService._insert_payments(query))
+
+        created = max(result.rowcount or 0, 0)
+        if created:
+            # O INSERT ... SELECT não passa pelos eventos de flush
+            ReportingRollups.record_billed_payments(reference_month, created_at,
+                                                    first_enrollment_id, last_enrollment_id)
+            DashboardCounters.add(db.session.connection(), pending_payments=created)
+
+        logging.info(f'Faturamento {month:02d}/{year}: {created} mensalidades criadas')
+        return created
+
+    @staticmethod
+    def start_run(year, month, due_day=None, chunk_size=None, user_id=None):
+        """
+        Cria uma execução de faturamento para o mês, ou retoma a execução
+        ainda não concluída (pendente, em andamento ou com falha) do mesmo mês.
+        """
+        reference_month = date(year, month, 1)
+
+        run = BillingRun.query.filter(
+            BillingRun.reference_month == reference_month,
+            BillingRun.status.in_(['pending', 'running', 'failed'])
+        ).order_by(BillingRun.id.desc()).first()
+
+        if run:
+            if run.status == 'failed':
+                run.status = 'running'
+                run.error = None
+                db.session.commit()
+            return run
+
+        max_enrollment_id = db.session.query(func.max(Enrollment.id)).scalar() or 0
+        total = db.session.query(func.count(Enrollment.id)).filter(
+            Enrollment.status == 'active',
+            Enrollment.id <= max_enrollment_id
+        ).scalar()
+
+        run = BillingRun(
+            reference_month=reference_month,
+            due_date=date(year, month, due_day or BillingService.DUE_DAY),
+            chunk_size=chunk_size or current_app.config.get('BILLING_CHUNK_SIZE', 500),
+            status='pending',
+            last_enrollment_id=0,
+            max_enrollment_id=max_enrollment_id,
+            total_enrollments=total,
+            processed_enrollments=0,
+            created_payments=0,
+            created_by_id=user_id
+        )
+        db.session.add(run)
+        db.session.commit()
+        return run
+
+    @staticmethod
+    def process_chunk(run):
+        """
+        Processa a próxima faixa de matrículas da execução e faz commit.
+
+        A faixa vai de last_enrollment_id (exclusivo) até o id da
+        chunk_size-ésima matrícula ativa seguinte. O avanço do cursor é
+        gravado na mesma transação das mensalidades e só se o cursor não
+        tiver sido movido por outro processo, então uma faixa nunca é
+        contabilizada duas vezes. Retorna True quando a execução terminou.
+        """
+        if run.status == 'completed':
+            return True
+
+        first_id = run.last_enrollment_id + 1
+
+        try:
+            upper_id = db.session.query(Enrollment.id).filter(
+                Enrollment.status == 'active',
+                Enrollment.id >= first_id,
+                Enrollment.id <= run.max_enrollment_id
+            ).order_by(Enrollment.id).offset(run.chunk_size - 1).limit(1).scalar()
+
+            finished = upper_id is None or upper_id >= run.max_enrollment_id
+            if finished:
+                upper_id = run.max_enrollment_id
+
+            processed = db.session.query(func.count(Enrollment.id)).filter(
+                Enrollment.status == 'active',
+                Enrollment.id >= first_id,
+                Enrollment.id <= upper_id
+            ).scalar()
+
+            created = BillingService.generate_monthly_payments(
+                run.reference_month.year, run.reference_month.month,
+                due_day=run.due_date.day,
+                first_enrollment_id=first_id,
+                last_enrollment_id=upper_id
+            )
+
+            now = datetime.utcnow()
+            values = {
+                'last_enrollment_id': upper_id,
+                'processed_enrollments': BillingRun.processed_enrollments + processed,
+                'created_payments': BillingRun.created_payments + created,
+                'status': 'completed' if finished else 'running',
+                'started_at': func.coalesce(BillingRun.started_at, now),
+            }
+            if finished:
+                values['finished_at'] = now
+
+            result = db.session.execute(
+                update(BillingRun).where(
+                    BillingRun.id == run.id,
+                    BillingRun.last_enrollment_id == run.last_enrollment_id
+                ).values(**values)
+            )
+
+            if result.rowcount == 0:
+                # Outro processo já avançou esta faixa
+                db.session.rollback()
+            else:
+                db.session.commit()
+
+            db.session.refresh(run)
+            return run.status == 'completed'
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f'Erro na execução de faturamento {run.id}: {e}')
+            run.status = 'failed'
+            run.error = str(e)
+            db.session.commit()
+            raise
+
+    @staticmethod
+    def run_to_completion(run, progress_callback=None):
+        """Processa todas as faixas restantes, cada uma em sua transação"""
+        while not BillingService.process_chunk(run):
+            if progress_callback:
+                progress_callback(run)
+        if progress_callback:
+            progress_callback(run)
+        return run
+
+    @staticmethod
+    def run_progress(run):
+        """Dados de progresso da execução (para o endpoint JSON)"""
+        percent = 100 if run.status == 'completed' else (
+            int(run.processed_enrollments * 100 / run.total_enrollments) if run.total_enrollments else 0
+        )
+
+        return {
+            'id': run.id,
+            'reference_month': run.reference_month.isoformat(),
+            'due_date': run.due_date.isoformat(),
+            'status': run.status,
+            'total_enrollments': run.total_enrollments,
+            'processed_enrollments': run.processed_enrollments,
+            'created_payments': run.created_payments,
+            'percent': percent,
+            'error': run.error,
+            'started_at': run.started_at.isoformat() if run.started_at else None,
+            'finished_at': run.finished_at.isoformat() if run.finished_at else None
+        }
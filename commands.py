@@ -0,0 +1,100 @@
+import click
+
+def register_commands(app):
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Aplica as migrações de esquema pendentes."""
+        from migrations import upgrade
+
+        applied = upgrade()
+        if applied:
+            for name in applied:
+                click.echo(f'Aplicada: {name}')
+        else:
+            click.echo('Nenhuma migração pendente.')
+
+    @app.cli.command('billing-run')
+    @click.option('--year', type=int, required=True)
+    @click.option('--month', type=int, required=True)
+    @click.option('--chunk-size', type=int, default=None, help='Matrículas por transação')
+    def billing_run(year, month, chunk_size):
+        """Gera (ou retoma) o faturamento mensal em faixas de matrículas."""
+        from billing_service import BillingService
+
+        run = BillingService.start_run(year, month, chunk_size=chunk_size)
+        click.echo(f'Execução {run.id} - {month:02d}/{year}')
+
+        def report(run):
+            click.echo(f'  {run.processed_enrollments}/{run.total_enrollments} matrículas, '
+                       f'{run.created_payments} mensalidades criadas')
+
+        BillingService.run_to_completion(run, progress_callback=report)
+        click.echo('Concluído.')
+
+    @app.cli.command('outbox-worker')
+    @click.option('--threads', type=int, default=None, help='Conexões SMTP simultâneas')
+    @click.option('--batch-size', type=int, default=None, help='Mensagens reservadas por lote')
+    @click.option('--interval', type=float, default=5, help='Segundos entre verificações da fila vazia')
+    @click.option('--once', is_flag=True, help='Esvazia a fila uma vez e termina')
+    def outbox_worker(threads, batch_size, interval, once):
+        """Envia os e-mails pendentes da outbox."""
+        from outbox_service import OutboxService
+
+        sent, failed = OutboxService.run_worker(threads=threads, batch_size=batch_size,
+                                                poll_interval=interval, once=once)
+        click.echo(f'{sent} e-mails enviados, {failed} falhas.')
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups():
+        """Recalcula as tabelas de agregação dos relatórios."""
+        from app import db
+        from rollups import ReportingRollups
+
+        ReportingRollups.rebuild()
+        db.session.commit()
+        click.echo('Agregados dos relatórios recalculados.')
+
+    @app.cli.command('reconcile-counters')
+    def reconcile_counters():
+        """Confere os contadores do painel com COUNTs reais e corrige divergências."""
+        from app import db
+        from rollups import DashboardCounters
+
+        drift = DashboardCounters.reconcile()
+        db.session.commit()
+        for name, (stored, live) in drift.items():
+            click.echo(f'{name}: {stored} -> {live}')
+        click.echo(f'{len(drift)} contadores corrigidos.' if drift else 'Contadores corretos.')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Recria o índice da busca textual do painel administrativo."""
+        from app import db
+        from search import SearchIndex
+
+        SearchIndex.rebuild()
+        db.session.commit()
+        click.echo('Índice de busca recriado.')
+
+    @app.cli.command('audit-reindex')
+    def audit_reindex():
+        """Recria o índice dos logs de auditoria."""
+        from audit_index import AuditIndex
+        from audit_logger import LOG_DIR
+
+        AuditIndex(LOG_DIR).rebuild()
+        click.echo('Índice de auditoria recriado.')
+
+    @app.cli.command('audit-rotate')
+    @click.option('--retention-days', type=int, default=None, help='Dias de logs mantidos (0 = todos)')
+    def audit_rotate(retention_days):
+        """Compacta, arquiva por mês e aplica a retenção dos logs de auditoria."""
+        from audit_logger import LOG_DIR
+        from audit_rotation import AuditRotation
+
+        if retention_days is None:
+            retention_days = app.config.get('AUDIT_RETENTION_DAYS', 0)
+
+        result = AuditRotation.rotate(LOG_DIR, retention_days=retention_days)
+        click.echo(f"{len(result['compressed'])} dias compactados, {len(result['archived'])} meses arquivados, "
+                   f"{len(result['removed'])} arquivos removidos.")
@@ -0,0 +1,148 @@
+import zlib
+from werkzeug.http import parse_accept_header
+
+# Compressão gzip das respostas, negociada pelo Accept-Encoding. Comprime
+# HTML, JSON, CSV e outros formatos de texto a partir de um tamanho mínimo;
+# arquivos enviados com send_file/send_from_directory (materiais, uploads,
+# estáticos) passam direto, pois em geral já são compactados (pdf, mp3,
+# mp4, imagens, docx) e aceitam requisições parciais (Range).
+#
+# Respostas em streaming (sem Content-Length, como as exportações CSV) são
+# comprimidas pedaço a pedaço com Z_SYNC_FLUSH: cada pedaço chega ao
+# cliente assim que é gerado, sem acumular a resposta em memória.
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'application/xhtml+xml', 'image/svg+xml',
+}
+
+def accepts_gzip(environ):
+    return parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', '')).quality('gzip') > 0
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+class _Body:
+    """Corpo da resposta que repassa close() ao corpo original (fim do contexto do Flask)"""
+    def __init__(self, chunks, original):
+        self.chunks = chunks
+        self.original = original
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        close = getattr(self.original, 'close', None)
+        if close is not None:
+            close()
+
+class GzipMiddleware:
+    def __init__(self, app, level=6, min_size=1024):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'HEAD' or not accepts_gzip(environ):
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def capture(status, headers, exc_info=None):
+            state.update(status=status, headers=headers, exc_info=exc_info)
+            # write() legado do WSGI não é usado pelo Flask
+            return lambda data: None
+
+        body = self.app(environ, capture)
+        return _Body(self._generate(body, state, start_response), body)
+
+    def _should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if _header(headers, 'Content-Encoding') or _header(headers, 'Accept-Ranges') == 'bytes':
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+
+        content_type = (_header(headers, 'Content-Type') or '').split(';', 1)[0].strip().lower()
+        if not (content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES):
+            return False
+
+        length = _header(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def _compressed_headers(self, headers):
+        result = []
+        vary = None
+        for key, value in headers:
+            lower = key.lower()
+            if lower == 'content-length':
+                continue
+            if lower == 'vary':
+                vary = value
+                continue
+            if lower == 'etag' and not value.startswith('W/'):
+                # O corpo muda com a codificação: o ETag passa a ser fraco
+                value = f'W/{value}'
+            result.append((key, value))
+
+        result.append(('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding'))
+        result.append(('Content-Encoding', 'gzip'))
+        return result
+
+    def _generate(self, body, state, start_response):
+        chunks = iter(body)
+        buffered = []
+        size = 0
+        exhausted = False
+
+        def read():
+            nonlocal size, exhausted
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            elif chunk:
+                buffered.append(chunk)
+                size += len(chunk)
+
+        # start_response pode ser chamado só quando o corpo começa a ser lido
+        while 'status' not in state and not exhausted:
+            read()
+
+        status, headers = state['status'], state['headers']
+        compress = self._should_compress(status, headers)
+        streaming = _header(headers, 'Content-Length') is None
+
+        if compress and streaming:
+            # Sem tamanho declarado: decide pelo início do corpo
+            while size < self.min_size and not exhausted:
+                read()
+            compress = size >= self.min_size
+
+        if not compress:
+            start_response(status, headers, state['exc_info'])
+            yield from buffered
+            yield from chunks
+            return
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        headers = self._compressed_headers(headers)
+
+        if not streaming or exhausted:
+            # Corpo inteiro disponível: um único bloco, com Content-Length
+            data = compressor.compress(b''.join(buffered + list(chunks))) + compressor.flush()
+            start_response(status, headers + [('Content-Length', str(len(data)))], state['exc_info'])
+            yield data
+            return
+
+        start_response(status, headers, state['exc_info'])
+        yield compressor.compress(b''.join(buffered)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
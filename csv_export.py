@@ -0,0 +1,171 @@
+import csv
+import json
+from io import StringIO
+from sqlalchemy import func, select
+from app import db
+from models import (User, Student, Course, Enrollment, Payment, PaymentTransaction,
+                    ExperimentalClass, Teacher)
+
+# Relatórios exportáveis em CSV. Cada relatório é uma função registrada com
+# @csv_report que devolve um iterável de linhas; as consultas projetam só as
+# colunas usadas e são lidas do banco em lotes (cursor no servidor), então a
+# memória não cresce com o número de linhas.
+EXPORTS = {}
+
+YIELD_PER = 1000            # Linhas buscadas por vez no cursor
+CHUNK_SIZE = 64 * 1024      # Caracteres acumulados antes de enviar um pedaço da resposta
+
+def csv_report(name, header):
+    """Registra um relatório exportável com o cabeçalho dado"""
+    def decorator(func):
+        EXPORTS[name] = (header, func)
+        return func
+    return decorator
+
+# Formatação das colunas
+def _text(value):
+    return '' if value is None else value
+
+def _money(value):
+    return f'R$ {value:.2f}' if value is not None else ''
+
+def _date(value):
+    return value.strftime('%d/%m/%Y') if value else ''
+
+def _datetime(value):
+    return value.strftime('%d/%m/%Y %H:%M') if value else ''
+
+def _month(value):
+    return value.strftime('%m/%Y') if value else ''
+
+def _active(value):
+    return 'Ativo' if value else 'Inativo'
+
+def stream_query(query, *formatters):
+    """Executa a consulta com cursor no servidor e formata cada linha"""
+    result = db.session.execute(query.execution_options(yield_per=YIELD_PER, stream_results=True))
+    for row in result:
+        yield [format_value(value) for format_value, value in zip(formatters, row)]
+
+@csv_report('students', ['Nome', 'Email', 'Telefone', 'Data Nascimento', 'Status'])
+def students_report():
+    query = select(
+        User.full_name, User.email, User.phone, Student.birth_date, User._is_active
+    ).join(User, Student.user_id == User.id).order_by(Student.id)
+    return stream_query(query, _text, _text, _text, _date, _active)
+
+@csv_report('payments', ['Aluno', 'Valor', 'Vencimento', 'Status', 'Mês Referência'])
+def payments_report():
+    query = select(
+        User.full_name, Payment.amount, Payment.due_date, Payment.status, Payment.reference_month
+    ).join(
+        Student, Payment.student_id == Student.id
+    ).join(
+        User, Student.user_id == User.id
+    ).order_by(Payment.id)
+    return stream_query(query, _text, _money, _date, _text, _month)
+
+@csv_report('enrollments', ['Aluno', 'Curso', 'Data Matrícula', 'Status', 'Mensalidade', 'Desconto (%)'])
+def enrollments_report():
+    query = select(
+        User.full_name,
+        Course.name,
+        Enrollment.enrollment_date,
+        Enrollment.status,
+        func.coalesce(Enrollment.monthly_payment, Course.monthly_price),
+        Enrollment.discount_percentage
+    ).join(
+        Student, Enrollment.student_id == Student.id
+    ).join(
+        User, Student.user_id == User.id
+    ).join(
+        Course, Enrollment.course_id == Course.id
+    ).order_by(Enrollment.id)
+    return stream_query(query, _text, _text, _date, _text, _money, _text)
+
+@csv_report('transactions', ['Transação', 'Aluno', 'Método', 'Valor', 'Parcelas', 'Status', 'Criada em', 'Concluída em'])
+def transactions_report():
+    query = select(
+        PaymentTransaction.transaction_id,
+        User.full_name,
+        PaymentTransaction.payment_method,
+        PaymentTransaction.amount,
+        PaymentTransaction.installments,
+        PaymentTransaction.status,
+        PaymentTransaction.created_at,
+        PaymentTransaction.completed_at
+    ).join(
+        Payment, PaymentTransaction.payment_id == Payment.id
+    ).join(
+        Student, Payment.student_id == Student.id
+    ).join(
+        User, Student.user_id == User.id
+    ).order_by(PaymentTransaction.id)
+    return stream_query(query, _text, _text, _text, _money, _text, _text, _datetime, _datetime)
+
+@csv_report('experimental_classes', ['Nome', 'Email', 'Telefone', 'Idade', 'Instrumento', 'Nível',
+                                     'Data Preferida', 'Horário Preferido', 'Status', 'Agendada para',
+                                     'Professor', 'Solicitada em'])
+def experimental_classes_report():
+    query = select(
+        ExperimentalClass.name,
+        ExperimentalClass.email,
+        ExperimentalClass.phone,
+        ExperimentalClass.age,
+        ExperimentalClass.instrument,
+        ExperimentalClass.experience_level,
+        ExperimentalClass.preferred_date,
+        ExperimentalClass.preferred_time,
+        ExperimentalClass.status,
+        ExperimentalClass.scheduled_date,
+        User.full_name,
+        ExperimentalClass.created_at
+    ).outerjoin(
+        Teacher, ExperimentalClass.teacher_id == Teacher.id
+    ).outerjoin(
+        User, Teacher.user_id == User.id
+    ).order_by(ExperimentalClass.id)
+    return stream_query(query, _text, _text, _text, _text, _text, _text,
+                        _date, _text, _text, _datetime, _text, _datetime)
+
+@csv_report('audit', ['Data/Hora', 'Usuário', 'Ação', 'Entidade', 'ID', 'IP', 'Detalhes'])
+def audit_report():
+    from audit_logger import AuditLogger
+
+    for entry in AuditLogger.iter_logs():
+        yield [
+            entry.get('timestamp', ''),
+            entry.get('user_name') or '',
+            entry.get('action') or '',
+            entry.get('entity_type') or '',
+            _text(entry.get('entity_id')),
+            entry.get('ip_address') or '',
+            json.dumps(entry.get('details') or {}, ensure_ascii=False)
+        ]
+
+class CSVExporter:
+    @staticmethod
+    def available_reports():
+        return sorted(EXPORTS)
+
+    @staticmethod
+    def generate(name):
+        """
+        Gera o CSV do relatório em pedaços de até CHUNK_SIZE caracteres.
+
+        Deve ser consumido dentro do contexto da requisição
+        (stream_with_context), pois as consultas usam a sessão do banco.
+        """
+        header, rows = EXPORTS[name]
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+
+        for row in rows():
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
@@ -0,0 +1,155 @@
+import atexit
+import logging
+import os
+import threading
+from flask import current_app
+from sqlalchemy import bindparam, func
+from app import db
+from models import Material, News
+
+# Contadores de acesso (visualizações de notícias, downloads e
+# visualizações de materiais) gravados em segundo plano. Cada acesso só
+# soma 1 num dicionário do processo; uma thread grava os acumulados a cada
+# HIT_COUNTER_FLUSH_INTERVAL segundos com um UPDATE ... SET n = n + :delta
+# por linha, todos na mesma transação. Assim uma página lida não vira uma
+# escrita disputando a mesma linha, e workers diferentes não se atrapalham:
+# cada um soma a sua parte.
+#
+# O que ainda não foi gravado entra na leitura feita pelas páginas do
+# painel (filtro `hits`), então quem está no mesmo processo vê o número já
+# atualizado. Ao encerrar o processo o restante é gravado (atexit).
+
+# nome: (modelo, coluna)
+COUNTERS = {
+    'news_views': (News, 'views_count'),
+    'material_downloads': (Material, 'download_count'),
+    'material_previews': (Material, 'preview_count'),
+}
+
+class HitCounters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}    # (nome, id) -> acessos ainda não gravados
+        self._flushing = {}   # lote sendo gravado agora
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._app = None
+        self.flush_interval = 10.0
+        self.max_pending = 1000
+
+    def _ensure_started(self):
+        # Depois de um fork (workers do gunicorn) a thread não existe no filho
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+
+            config = current_app.config
+            self.flush_interval = config.get('HIT_COUNTER_FLUSH_INTERVAL', 10.0)
+            self.max_pending = config.get('HIT_COUNTER_MAX_PENDING', 1000)
+            self._app = current_app._get_current_object()
+            # Contagens herdadas do processo pai são gravadas por ele
+            self._pending, self._flushing = {}, {}
+            self._wake = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='hit-counter-writer', daemon=True)
+            self._thread.start()
+
+    def increment(self, name, ref_id, amount=1):
+        if name not in COUNTERS:
+            raise KeyError(name)
+        self._ensure_started()
+        with self._lock:
+            key = (name, ref_id)
+            self._pending[key] = self._pending.get(key, 0) + amount
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def pending(self, name, ref_id):
+        """Acessos deste processo ainda não gravados no banco"""
+        with self._lock:
+            key = (name, ref_id)
+            return self._pending.get(key, 0) + self._flushing.get(key, 0)
+
+    def flush(self):
+        """Grava os acumulados deste processo. Retorna o número de linhas atualizadas."""
+        if self._pid != os.getpid():
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return 0
+
+            try:
+                with self._app.app_context():
+                    self._write(batch)
+            except Exception as e:
+                logging.error(f'Hit counter write error: {e}')
+                # Devolve o lote para a próxima tentativa
+                with self._lock:
+                    for key, amount in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + amount
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            return len(batch)
+
+    @staticmethod
+    def _write(batch):
+        by_counter = {}
+        for (name, ref_id), amount in batch.items():
+            by_counter.setdefault(name, []).append({'ref_id': ref_id, 'delta': amount})
+
+        with db.engine.begin() as connection:
+            for name in sorted(by_counter):
+                model, column = COUNTERS[name]
+                table = model.__table__
+                # COALESCE: linhas antigas podem ter a coluna nula
+                stmt = table.update().where(table.c.id == bindparam('ref_id')).values(
+                    {column: func.coalesce(table.c[column], 0) + bindparam('delta')}
+                )
+                # Sempre na mesma ordem de ids: workers gravando ao mesmo tempo não se travam
+                connection.execute(stmt, sorted(by_counter[name], key=lambda row: row['ref_id']))
+
+    def stop(self, timeout=5):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        thread, self._thread = self._thread, None
+        self._wake.set()
+        thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while self._thread is not None:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+hit_counters = HitCounters()
+atexit.register(hit_counters.stop)
+
+def count_hit(name, ref_id):
+    """Registra um acesso; a gravação no banco fica para a thread do processo"""
+    try:
+        hit_counters.increment(name, ref_id)
+    except Exception as e:
+        current_app.logger.error(f'Hit counter error: {e}')
+
+def hits(obj, column):
+    """Valor gravado da coluna mais os acessos deste processo ainda não gravados"""
+    stored = getattr(obj, column) or 0
+    for name, (model, counter_column) in COUNTERS.items():
+        if isinstance(obj, model) and counter_column == column:
+            return stored + hit_counters.pending(name, obj.id)
+    return stored
+
+def register_hit_counters(app):
+    app.add_template_filter(hits, 'hits')
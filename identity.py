@@ -0,0 +1,135 @@
+from collections import namedtuple
+from flask import g
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from caching import TTLCache
+from models import User, Student, Teacher
+from table_versions import table_versions
+
+# Identidade do usuário logado: as colunas do User e do perfil de
+# aluno/professor são lidas uma vez e guardadas por processo como
+# dicionários simples (nenhuma instância do ORM fica no cache). A cada
+# requisição as instâncias são remontadas e anexadas à sessão como já
+# carregadas, sem consultar o banco, e os ids de perfil ficam em
+# g.student_id / g.teacher_id.
+#
+# Cada entrada guarda as versões de users, students e teachers
+# (table_versions.py) de quando foi lida; se alguma avançou, a entrada é
+# relida. Assim um usuário desativado ou com o tipo alterado em outro
+# worker perde a identidade em cache em até TABLE_VERSION_REFRESH
+# segundos. Neste processo a entrada é descartada logo no commit.
+
+_identities = TTLCache()
+
+PROFILE_MODELS = {'student': Student, 'teacher': Teacher}
+WATCHED_TABLES = ('users', 'students', 'teachers')
+
+Identity = namedtuple('Identity', 'versions user profile_model profile')
+
+def _load(user_id):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+
+    profile_model = PROFILE_MODELS.get(user.user_type)
+    profile = profile_model.query.filter_by(user_id=user.id).first() if profile_model else None
+    return user, profile
+
+def _columns(obj):
+    """Valores das colunas do objeto (retrato para o cache)"""
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+def _instance(model, values):
+    """Instância da sessão atual para o retrato em cache, sem consultar o banco"""
+    if values is None:
+        return None
+    existing = db.session.identity_map.get(db.session.identity_key(model, values['id']))
+    if existing is not None:
+        return existing
+
+    obj = model(**values)
+    # Marca como lido do banco (sem histórico de alteração) e anexa à sessão
+    make_transient_to_detached(obj)
+    db.session.add(obj)
+    return obj
+
+def _set_profile(profile):
+    g.student = profile if isinstance(profile, Student) else None
+    g.teacher = profile if isinstance(profile, Teacher) else None
+    g.student_id = g.student.id if g.student else None
+    g.teacher_id = g.teacher.id if g.teacher else None
+
+def load_identity(user_id):
+    """User da requisição (para o user_loader), com o perfil em g"""
+    versions = table_versions(*WATCHED_TABLES)
+    identity = _identities.get(user_id)
+
+    if identity is None or identity.versions != versions:
+        loaded = _load(user_id)
+        if loaded is None:
+            _identities.pop(user_id)
+            return None
+        user, profile = loaded
+        _identities.set(user_id, Identity(
+            versions, _columns(user), type(profile) if profile is not None else None,
+            _columns(profile) if profile is not None else None
+        ))
+        _set_profile(profile)
+        return user
+
+    user = _instance(User, identity.user)
+    profile = _instance(identity.profile_model, identity.profile) if identity.profile_model else None
+    _set_profile(profile)
+    return user
+
+def _ensure_loaded():
+    # O user_loader só roda no primeiro acesso a current_user
+    return current_user.is_authenticated
+
+def current_student():
+    return g.get('student') if _ensure_loaded() else None
+
+def current_student_id():
+    return g.get('student_id') if _ensure_loaded() else None
+
+def current_teacher():
+    return g.get('teacher') if _ensure_loaded() else None
+
+def current_teacher_id():
+    return g.get('teacher_id') if _ensure_loaded() else None
+
+def invalidate_identity(user_id):
+    _identities.pop(user_id)
+
+def _affected_user_ids(obj):
+    if isinstance(obj, User):
+        return {obj.id}
+    if isinstance(obj, (Student, Teacher)):
+        # Inclui o usuário anterior se o perfil mudou de dono
+        history = inspect(obj).attrs.user_id.history
+        return {obj.user_id, *history.deleted}
+    return set()
+
+def _after_flush(session, flush_context):
+    affected = session.info.setdefault('identity_user_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        affected.update(_affected_user_ids(obj))
+
+def _after_commit(session):
+    for user_id in session.info.pop('identity_user_ids', ()):
+        if user_id is not None:
+            invalidate_identity(user_id)
+
+def _after_rollback(session):
+    session.info.pop('identity_user_ids', None)
+
+def register_identity(app):
+    _identities.max_size = app.config.get('IDENTITY_CACHE_SIZE', 1000)
+    _identities.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
@@ -0,0 +1,127 @@
+import logging
+import warnings
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from app import db
+
+# db.create_all() só cria tabelas que ainda não existem: índices, colunas e
+# restrições adicionados depois a tabelas já criadas precisam de uma migração.
+# Cada migração roda uma única vez e fica registrada em schema_migrations.
+MIGRATIONS = []
+
+# A reflexão (checkfirst, colunas existentes) não lê índices de expressão
+# como ix_users_full_name_lower e avisa a cada tabela users inspecionada
+warnings.filterwarnings('ignore', message='Skipped unsupported reflection of expression-based index')
+
+def migration(name):
+    """Registra uma função de migração (aplicada na ordem de declaração)"""
+    def decorator(func):
+        MIGRATIONS.append((name, func))
+        return func
+    return decorator
+
+def _create_indexes(connection, model, *names):
+    """Cria os índices do modelo (todos ou só os nomeados) que ainda não existem"""
+    for index in model.__table__.indexes:
+        if not names or index.name in names:
+            index.create(connection, checkfirst=True)
+
+@migration('001_hot_path_indexes')
+def hot_path_indexes(connection):
+    from models import Student, Teacher, Enrollment, Schedule, Payment, News
+    _create_indexes(connection, Student, 'ix_students_user_id')
+    _create_indexes(connection, Teacher, 'ix_teachers_user_id')
+    _create_indexes(connection, Enrollment, 'ix_enrollments_course_status', 'ix_enrollments_student_status')
+    _create_indexes(connection, Schedule, 'ix_schedules_teacher_day_start')
+    _create_indexes(connection, Payment, 'ix_payments_status_due_date', 'ix_payments_status_payment_date',
+                    'ix_payments_student_reference')
+    _create_indexes(connection, News, 'ix_news_public_publish')
+
+def _add_column(connection, model, column_name):
+    """Adiciona uma coluna declarada no modelo, se ainda não existir"""
+    table = model.__table__
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    if column_name in existing:
+        return
+
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}'
+    for fk in column.foreign_keys:
+        ddl += f' REFERENCES {fk.column.table.name} ({fk.column.name})'
+    connection.execute(text(ddl))
+
+@migration('002_payment_enrollment')
+def payment_enrollment(connection):
+    from models import Payment
+    _add_column(connection, Payment, 'enrollment_id')
+    _create_indexes(connection, Payment, 'uq_payments_enrollment_reference')
+
+@migration('003_reporting_rollups')
+def reporting_rollups(connection):
+    # As tabelas já foram criadas pelo create_all; preenche com os dados existentes
+    from rollups import ReportingRollups
+    ReportingRollups.rebuild(connection)
+
+@migration('004_payment_keyset_indexes')
+def payment_keyset_indexes(connection):
+    from models import Payment
+    _create_indexes(connection, Payment, 'ix_payments_due_date_id', 'ix_payments_status_due_date_id')
+
+@migration('005_user_name_index')
+def user_name_index(connection):
+    from models import User
+    _create_indexes(connection, User, 'ix_users_full_name')
+
+@migration('006_search_index')
+def search_index(connection):
+    from search import SearchIndex
+    SearchIndex.create(connection)
+    SearchIndex.rebuild(connection)
+
+@migration('007_dashboard_counters')
+def dashboard_counters(connection):
+    # A tabela já foi criada pelo create_all; grava as contagens atuais
+    from rollups import DashboardCounters
+    DashboardCounters.reconcile(connection)
+
+@migration('008_material_hit_counters')
+def material_hit_counters(connection):
+    from models import Material
+    _add_column(connection, Material, 'download_count')
+    _add_column(connection, Material, 'preview_count')
+
+@migration('009_user_name_lower_index')
+def user_name_lower_index(connection):
+    from models import User
+    # Índice de expressão: a reflexão não o enxerga, então checkfirst não serve
+    index = next(index for index in User.__table__.indexes if index.name == 'ix_users_full_name_lower')
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+def upgrade():
+    """Aplica as migrações pendentes. Retorna a lista das migrações aplicadas."""
+    applied = []
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)'
+        ))
+        done = {row[0] for row in connection.execute(text('SELECT name FROM schema_migrations'))}
+
+    for name, func in MIGRATIONS:
+        if name in done:
+            continue
+
+        with db.engine.begin() as connection:
+            func(connection)
+            connection.execute(
+                text('INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)'),
+                {'name': name, 'applied_at': datetime.utcnow()}
+            )
+
+        logging.info(f'Migração aplicada: {name}')
+        applied.append(name)
+
+    return applied
@@ -11,7 +11,7 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     user_type = db.Column(db.String(20), nullable=False)  # admin, secretary, teacher, student
-    full_name = db.Column(db.String(200), nullable=False)
+    full_name = db.Column(db.String(200), nullable=False, index=True)  # Listas ordenadas por nome
     phone = db.Column(db.String(20))
     _is_active = db.Column('is_active', db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -31,11 +31,16 @@ class User(UserMixin, db.Model):
     student_profile = db.relationship('Student', backref='user', uselist=False, cascade='all, delete-orphan')
     teacher_profile = db.relationship('Teacher', backref='user', uselist=False, cascade='all, delete-orphan')
 
+# Filtro "nome começa com" das listas (lower(full_name)); no PostgreSQL
+# text_pattern_ops deixa o LIKE 'abc%' usar o índice com qualquer collation
+db.Index('ix_users_full_name_lower', db.func.lower(User.full_name).label('full_name_lower'),
+         postgresql_ops={'full_name_lower': 'text_pattern_ops'})
+
 class Student(db.Model):
     __tablename__ = 'students'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     birth_date = db.Column(db.Date)
     address = db.Column(db.Text)
     emergency_contact = db.Column(db.String(100))
@@ -59,7 +64,7 @@ class Teacher(db.Model):
     __tablename__ = 'teachers'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     specialization = db.Column(db.String(200))
     hourly_rate = db.Column(db.Numeric(10, 2))
     bank_name = db.Column(db.String(100))
@@ -118,6 +123,12 @@ class Course(db.Model):
 
 class Enrollment(db.Model):
     __tablename__ = 'enrollments'
+    __table_args__ = (
+        # Alunos de um curso / vagas ocupadas (course_students, enroll_student, relatórios)
+        db.Index('ix_enrollments_course_status', 'course_id', 'status'),
+        # Matrículas de um aluno (dashboard, materiais, controle de acesso)
+        db.Index('ix_enrollments_student_status', 'student_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
@@ -130,6 +141,10 @@ class Enrollment(db.Model):
 
 class Schedule(db.Model):
     __tablename__ = 'schedules'
+    __table_args__ = (
+        # Agenda do professor ordenada por dia/horário
+        db.Index('ix_schedules_teacher_day_start', 'teacher_id', 'day_of_week', 'start_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
@@ -142,9 +157,23 @@ class Schedule(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Pendentes/vencidos por data (lembretes, inadimplência, dashboard)
+        db.Index('ix_payments_status_due_date', 'status', 'due_date'),
+        # Receita por período (status='paid' filtrado por payment_date)
+        db.Index('ix_payments_status_payment_date', 'status', 'payment_date'),
+        # Histórico do aluno e verificação de mensalidade do mês
+        db.Index('ix_payments_student_reference', 'student_id', 'reference_month'),
+        # Uma mensalidade por matrícula e mês (torna a geração idempotente)
+        db.Index('uq_payments_enrollment_reference', 'enrollment_id', 'reference_month', unique=True),
+        # Paginação por cursor da API (due_date, id), com e sem filtro de status
+        db.Index('ix_payments_due_date_id', 'due_date', 'id'),
+        db.Index('ix_payments_status_due_date_id', 'status', 'due_date', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    enrollment_id = db.Column(db.Integer, db.ForeignKey('enrollments.id'))  # Mensalidades geradas automaticamente
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     due_date = db.Column(db.Date, nullable=False)
     payment_date = db.Column(db.Date)
@@ -153,6 +182,31 @@ class Payment(db.Model):
     reference_month = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    enrollment = db.relationship('Enrollment', backref='payments')
+
+class BillingRun(db.Model):
+    __tablename__ = 'billing_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reference_month = db.Column(db.Date, nullable=False, index=True)
+    due_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    chunk_size = db.Column(db.Integer, nullable=False)
+    last_enrollment_id = db.Column(db.Integer, default=0)  # Última matrícula processada (cursor)
+    max_enrollment_id = db.Column(db.Integer, default=0)   # Limite fixado ao criar a execução
+    total_enrollments = db.Column(db.Integer, default=0)
+    processed_enrollments = db.Column(db.Integer, default=0)
+    created_payments = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    # Relationships
+    created_by = db.relationship('User', foreign_keys=[created_by_id])
 
 class Material(db.Model):
     __tablename__ = 'materials'
@@ -167,6 +221,8 @@ class Material(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     is_public = db.Column(db.Boolean, default=False)
+    download_count = db.Column(db.Integer, default=0)  # Gravados pelo hit_counters
+    preview_count = db.Column(db.Integer, default=0)
     
     # Relationships
     uploaded_by = db.relationship('User', foreign_keys=[uploaded_by_id], backref='uploaded_materials')
@@ -204,6 +260,10 @@ class PaymentTransaction(db.Model):
 
 class News(db.Model):
     __tablename__ = 'news'
+    __table_args__ = (
+        # Notícias públicas mais recentes (landing page)
+        db.Index('ix_news_public_publish', 'is_public', 'publish_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -246,3 +306,77 @@ class ExperimentalClass(db.Model):
     
     def __init__(self, **kwargs):
         super(ExperimentalClass, self).__init__(**kwargs)
+
+class OutboxEmail(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # Próximas mensagens a enviar (worker)
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # Lista JSON
+    sender = db.Column(db.String(120))
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)  # Em 'sending': fim da reserva do worker
+    claim_token = db.Column(db.String(36))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class ApiTokenRevocation(db.Model):
+    __tablename__ = 'api_token_revocations'
+    
+    # Tokens da API do usuário emitidos antes de revoked_at deixam de valer
+    user_id = db.Column(db.Integer, primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    
+    # Incrementado a cada transação que altera a tabela (ETags da API)
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Tabelas de agregação dos relatórios (mantidas por rollups.py)
+class RevenueRollup(db.Model):
+    __tablename__ = 'rollup_monthly_revenue'
+    
+    month = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês da data de pagamento
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+
+class EnrollmentRollup(db.Model):
+    __tablename__ = 'rollup_monthly_enrollments'
+    
+    month = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês da matrícula
+    enrollments_count = db.Column(db.Integer, nullable=False, default=0)
+
+class StudentDebtRollup(db.Model):
+    __tablename__ = 'rollup_student_debt'
+    
+    student_id = db.Column(db.Integer, primary_key=True)
+    due_month = db.Column(db.Date, primary_key=True)  # Primeiro dia do mês de vencimento
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # Pagamentos pending/overdue
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+
+class CourseEnrollmentRollup(db.Model):
+    __tablename__ = 'rollup_course_enrollments'
+    
+    course_id = db.Column(db.Integer, primary_key=True)
+    active_count = db.Column(db.Integer, nullable=False, default=0)
+
+class DashboardCounter(db.Model):
+    __tablename__ = 'rollup_dashboard_counters'
+    
+    # Linha única (id = 1) com as contagens do painel
+    id = db.Column(db.Integer, primary_key=True)
+    students = db.Column(db.Integer, nullable=False, default=0)
+    active_students = db.Column(db.Integer, nullable=False, default=0)  # Alunos com usuário ativo
+    teachers = db.Column(db.Integer, nullable=False, default=0)
+    active_courses = db.Column(db.Integer, nullable=False, default=0)
+    pending_payments = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime)
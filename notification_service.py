@@ -1,90 +1,174 @@
 
 import logging
 from datetime import date, timedelta
+from itertools import groupby
+from sqlalchemy import select, update
 from app import db
 from models import Payment, Student, User
-from utils import send_email
+from rollups import DashboardCounters
+from utils import send_email, send_bulk_emails, QueryCounter
 
 class NotificationService:
+    REMINDER_BATCH_SIZE = 500  # Linhas buscadas por vez do cursor
+
     @staticmethod
-    def send_payment_reminder(payment_id, reminder_type='warning'):
-        """Envia lembrete de pagamento"""
-        payment = Payment.query.get(payment_id)
-        if not payment:
-            return False
-            
-        student = Student.query.get(payment.student_id)
-        user = User.query.get(student.user_id)
-        
+    def _reminder_message(full_name, payments, reminder_type):
+        """Monta assunto e corpo do lembrete para um aluno (um ou mais pagamentos)"""
         if reminder_type == 'warning':
             subject = f'Lembrete: Pagamento vence em 3 dias - Escola Sol Maior'
-            template = 'email/payment_warning.html'
+            intro = 'Seu pagamento vence em 3 dias.' if len(payments) == 1 else 'Seus pagamentos vencem em 3 dias.'
         elif reminder_type == 'overdue':
             subject = f'Pagamento em atraso - Escola Sol Maior'
-            template = 'email/payment_overdue.html'
+            intro = 'Seu pagamento está em atraso.' if len(payments) == 1 else f'Você tem {len(payments)} pagamentos em atraso.'
         else:
             subject = f'Lembrete de pagamento - Escola Sol Maior'
-            template = 'email/payment_reminder.html'
-            
-        try:
-            send_email(
-                subject=subject,
-                body=f'''
-                Olá {user.full_name},
+            intro = 'Você tem pagamentos em aberto.'
+
+        details = '\n'.join(
+            f"                Valor: R$ {amount:.2f} - Vencimento: {due_date.strftime('%d/%m/%Y')} - "
+            f"Referência: {reference_month.strftime('%m/%Y')}"
+            for amount, due_date, reference_month in payments
+        )
 
-                {'Seu pagamento vence em 3 dias.' if reminder_type == 'warning' else 'Seu pagamento está em atraso.'}
+        body = f'''
+                Olá {full_name},
+
+                {intro}
                 
-                Valor: R$ {payment.amount:.2f}
-                Vencimento: {payment.due_date.strftime('%d/%m/%Y')}
-                Referência: {payment.reference_month.strftime('%m/%Y')}
+{details}
                 
                 Por favor, regularize sua situação o mais breve possível.
                 
                 Atenciosamente,
                 Escola Sol Maior
-                ''',
-                recipients=[user.email]
-            )
+                '''
+        return subject, body
+
+    @staticmethod
+    def send_payment_reminder(payment_id, reminder_type='warning'):
+        """Envia lembrete de pagamento"""
+        row = db.session.query(Payment, User.full_name, User.email).join(
+            Student, Payment.student_id == Student.id
+        ).join(
+            User, Student.user_id == User.id
+        ).filter(Payment.id == payment_id).first()
+
+        if not row:
+            return False
+
+        payment, full_name, email = row
+        subject, body = NotificationService._reminder_message(
+            full_name, [(payment.amount, payment.due_date, payment.reference_month)], reminder_type
+        )
+
+        try:
+            send_email(subject=subject, body=body, recipients=[email])
             
             # Log da notificação
-            logging.info(f'Notificação enviada para {user.email} - Pagamento {payment.id}')
+            logging.info(f'Notificação enviada para {email} - Pagamento {payment.id}')
             return True
             
         except Exception as e:
             logging.error(f'Erro ao enviar notificação: {e}')
             return False
-    
+
+    @staticmethod
+    def _stream_reminders(*criteria):
+        """
+        Uma consulta com join para a classe de lembrete, agrupada por aluno:
+        [(student_id, nome, email, pagamentos)].
+
+        O resultado é lido inteiro, em lotes do cursor, numa conexão própria
+        que é fechada antes do envio: os e-mails (SMTP, lento) não mantêm
+        cursor nem transação abertos no banco. Na memória fica só uma tupla
+        curta por pagamento.
+        """
+        stmt = select(
+            Payment.student_id,
+            User.full_name,
+            User.email,
+            Payment.amount,
+            Payment.due_date,
+            Payment.reference_month
+        ).join(
+            Student, Payment.student_id == Student.id
+        ).join(
+            User, Student.user_id == User.id
+        ).where(*criteria).order_by(
+            Payment.student_id, Payment.due_date
+        ).execution_options(yield_per=NotificationService.REMINDER_BATCH_SIZE)
+
+        students = []
+        with db.engine.connect() as connection:
+            rows = connection.execute(stmt)
+            for student_id, group in groupby(rows, key=lambda row: row.student_id):
+                group = list(group)
+                students.append((student_id, group[0].full_name, group[0].email, [
+                    (row.amount, row.due_date, row.reference_month) for row in group
+                ]))
+        return students
+
+    @staticmethod
+    def _send_reminders(reminder_type, *criteria):
+        """Envia um e-mail por aluno. Retorna (e-mails enviados, pagamentos cobertos)"""
+        counts = {'payments': 0}
+
+        def messages():
+            for student_id, full_name, email, payments in NotificationService._stream_reminders(*criteria):
+                counts['payments'] += len(payments)
+                subject, body = NotificationService._reminder_message(full_name, payments, reminder_type)
+                yield {'subject': subject, 'body': body, 'recipients': [email]}
+
+        # Uma conexão SMTP para vários e-mails
+        results = send_bulk_emails(messages())
+        for result in results:
+            if result['success']:
+                logging.info(f'Notificação enviada para {result["recipients"][0]}')
+            else:
+                logging.error(f'Erro ao enviar notificação para {result["recipients"][0]}: {result["error"]}')
+
+        emails_sent = sum(1 for result in results if result['success'])
+        return emails_sent, counts['payments']
+
     @staticmethod
     def check_and_send_payment_reminders():
-        """Verifica e envia lembretes automáticos"""
+        """
+        Verifica e envia lembretes automáticos.
+
+        O número de consultas é constante: uma por classe de lembrete mais
+        um UPDATE para marcar os vencidos, independente de quantos
+        pagamentos existam.
+        """
         today = date.today()
-        
-        # Pagamentos que vencem em 3 dias
-        warning_date = today + timedelta(days=3)
-        warning_payments = Payment.query.filter(
-            Payment.status == 'pending',
-            Payment.due_date == warning_date
-        ).all()
-        
-        for payment in warning_payments:
-            NotificationService.send_payment_reminder(payment.id, 'warning')
-        
-        # Pagamentos vencidos
-        overdue_payments = Payment.query.filter(
-            Payment.status == 'pending',
-            Payment.due_date < today
-        ).all()
-        
-        for payment in overdue_payments:
-            # Atualizar status para vencido
-            payment.status = 'overdue'
-            NotificationService.send_payment_reminder(payment.id, 'overdue')
-        
-        db.session.commit()
-        
+
+        with QueryCounter(db.engine) as counter:
+            # Pagamentos que vencem em 3 dias
+            warning_date = today + timedelta(days=3)
+            warning_sent, warning_payments = NotificationService._send_reminders(
+                'warning',
+                Payment.status == 'pending',
+                Payment.due_date == warning_date
+            )
+
+            # Pagamentos vencidos
+            overdue_criteria = (Payment.status == 'pending', Payment.due_date < today)
+            overdue_sent, overdue_payments = NotificationService._send_reminders('overdue', *overdue_criteria)
+
+            # Atualizar status para vencido em um único UPDATE
+            result = db.session.execute(
+                update(Payment).where(*overdue_criteria).values(status='overdue'),
+                execution_options={'synchronize_session': False}
+            )
+            # O UPDATE em massa não passa pelos eventos de flush
+            DashboardCounters.add(db.session.connection(), pending_payments=-max(result.rowcount or 0, 0))
+            db.session.commit()
+
         return {
-            'warning_sent': len(warning_payments),
-            'overdue_sent': len(overdue_payments)
+            'warning_sent': warning_sent,
+            'overdue_sent': overdue_sent,
+            'warning_payments': warning_payments,
+            'overdue_payments': overdue_payments,
+            'queries': counter.count
         }
     
     @staticmethod
@@ -0,0 +1,163 @@
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, select, update
+from app import db
+from models import OutboxEmail
+from utils import send_bulk_emails
+
+class OutboxService:
+    LEASE_SECONDS = 300      # Tempo de reserva de uma mensagem por um worker
+    MAX_BACKOFF_SECONDS = 6 * 3600
+
+    @staticmethod
+    def enqueue_email(subject, body, recipients, sender=None):
+        """
+        Grava o e-mail na outbox dentro da transação atual.
+
+        Não faz commit: a mensagem só passa a existir junto com a alteração
+        de negócio que a originou, e o envio acontece no worker.
+        """
+        message = OutboxEmail(
+            subject=subject,
+            body=body,
+            recipients=json.dumps(recipients if isinstance(recipients, list) else [recipients]),
+            sender=sender,
+            status='pending',
+            attempts=0,
+            next_attempt_at=datetime.utcnow()
+        )
+        db.session.add(message)
+        return message
+
+    @staticmethod
+    def claim_batch(limit):
+        """
+        Reserva até `limit` mensagens prontas para envio.
+
+        Mensagens em 'sending' cuja reserva expirou (worker interrompido)
+        voltam a ser elegíveis. A reserva é um único UPDATE marcado com um
+        token, então dois workers nunca pegam a mesma mensagem.
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+
+        ready = or_(
+            OutboxEmail.status == 'pending',
+            OutboxEmail.status == 'sending'
+        )
+        candidates = select(OutboxEmail.id).where(
+            ready,
+            OutboxEmail.next_attempt_at <= now
+        ).order_by(OutboxEmail.next_attempt_at, OutboxEmail.id).limit(limit)
+
+        db.session.execute(
+            update(OutboxEmail).where(
+                OutboxEmail.id.in_(candidates.scalar_subquery()),
+                ready,
+                OutboxEmail.next_attempt_at <= now
+            ).values(
+                status='sending',
+                claim_token=token,
+                next_attempt_at=now + timedelta(seconds=OutboxService.LEASE_SECONDS)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
+        return OutboxEmail.query.filter_by(claim_token=token, status='sending').order_by(OutboxEmail.id).all()
+
+    @staticmethod
+    def _send_slice(app, messages):
+        """Envia uma fatia das mensagens em uma conexão SMTP (executa em thread)"""
+        with app.app_context():
+            return send_bulk_emails(messages)
+
+    @staticmethod
+    def process_batch(threads=None, batch_size=None):
+        """Envia um lote da outbox. Retorna (enviadas, com falha)."""
+        config = current_app.config
+        threads = threads or config.get('OUTBOX_WORKER_THREADS', 4)
+        batch_size = batch_size or config.get('OUTBOX_BATCH_SIZE', 50)
+
+        batch = OutboxService.claim_batch(batch_size)
+        if not batch:
+            return 0, 0
+
+        payloads = [{
+            'subject': message.subject,
+            'body': message.body,
+            'recipients': json.loads(message.recipients),
+            'sender': message.sender
+        } for message in batch]
+
+        # Cada thread usa sua própria conexão SMTP
+        slices = [list(range(i, len(batch), threads)) for i in range(min(threads, len(batch)))]
+        app = current_app._get_current_object()
+        results = [None] * len(batch)
+
+        with ThreadPoolExecutor(max_workers=len(slices)) as executor:
+            futures = {
+                executor.submit(OutboxService._send_slice, app, [payloads[i] for i in indexes]): indexes
+                for indexes in slices
+            }
+            for future, indexes in futures.items():
+                try:
+                    for index, result in zip(indexes, future.result()):
+                        results[index] = result
+                except Exception as e:
+                    for index in indexes:
+                        results[index] = {'success': False, 'error': str(e)}
+
+        sent = failed = 0
+        now = datetime.utcnow()
+        max_attempts = config.get('OUTBOX_MAX_ATTEMPTS', 5)
+        backoff = config.get('OUTBOX_BACKOFF_SECONDS', 60)
+
+        for message, result in zip(batch, results):
+            message.attempts = (message.attempts or 0) + 1
+            message.claim_token = None
+
+            if result['success']:
+                message.status = 'sent'
+                message.sent_at = now
+                message.last_error = None
+                sent += 1
+                continue
+
+            failed += 1
+            message.last_error = result['error']
+            if message.attempts >= max_attempts:
+                # Dead letter: fica registrada para análise e reenvio manual
+                message.status = 'dead'
+                logging.error(f'E-mail {message.id} descartado após {message.attempts} tentativas: {result["error"]}')
+            else:
+                delay = min(backoff * 2 ** (message.attempts - 1), OutboxService.MAX_BACKOFF_SECONDS)
+                message.status = 'pending'
+                message.next_attempt_at = now + timedelta(seconds=delay)
+
+        db.session.commit()
+        return sent, failed
+
+    @staticmethod
+    def run_worker(threads=None, batch_size=None, poll_interval=5, once=False):
+        """Esvazia a outbox continuamente (ou uma vez, com once=True)"""
+        total_sent = total_failed = 0
+
+        while True:
+            sent, failed = OutboxService.process_batch(threads=threads, batch_size=batch_size)
+            total_sent += sent
+            total_failed += failed
+
+            if sent or failed:
+                logging.info(f'Outbox: {sent} enviados, {failed} com falha')
+                continue  # Pode haver mais mensagens prontas
+
+            if once:
+                return total_sent, total_failed
+
+            time.sleep(poll_interval)
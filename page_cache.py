@@ -0,0 +1,89 @@
+import hashlib
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from caching import TTLCache
+from table_versions import table_versions
+
+# Cache das páginas públicas (início, ajuda, contato) para visitantes não
+# logados. O HTML renderizado fica em memória por processo, com chave no
+# caminho e na versão da tabela news: uma notícia criada, editada ou
+# removida muda a versão e as páginas são renderizadas de novo (nos outros
+# workers em até TABLE_VERSION_REFRESH segundos). A query string não entra
+# na chave, então links de campanha (?utm_...) usam a mesma entrada.
+#
+# O token CSRF é da sessão do visitante e não pode ir para o cache: ele é
+# trocado por um marcador ao guardar a página. Páginas compartilhadas saem
+# sem token (não têm formulário) e podem ser guardadas pelo proxy e pelo
+# navegador (Cache-Control public); nas demais o marcador é trocado pelo
+# token de quem pediu a página.
+
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+
+_pages = TTLCache(max_size=100, ttl=3600)
+
+def _cacheable():
+    # Mensagens flash pendentes são da sessão do visitante
+    return (request.method in ('GET', 'HEAD') and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+def _render(view, args, kwargs):
+    response = make_response(view(*args, **kwargs))
+    if response.status_code != 200 or response.mimetype != 'text/html':
+        return response, None
+
+    body = response.get_data(as_text=True).replace(generate_csrf(), CSRF_PLACEHOLDER)
+    return response, body
+
+def _etag(body):
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:20]
+
+def public_page(shared=True):
+    """
+    Serve a view pelo cache para visitantes não logados. shared=False para
+    páginas com formulário: o HTML é reaproveitado, mas a resposta leva o
+    token da sessão e não é guardada por caches compartilhados.
+    """
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            if not _cacheable():
+                return view(*args, **kwargs)
+
+            key = (request.path, table_versions('news'))
+            page = _pages.get(key)
+            if page is None:
+                response, body = _render(view, args, kwargs)
+                if body is None:
+                    return response
+                if shared:
+                    body = body.replace(CSRF_PLACEHOLDER, '')
+                page = (body, _etag(body))
+                _pages.set(key, page)
+
+            body, tag = page
+            # session.modified: a renderização gravou o segredo CSRF na sessão (Set-Cookie)
+            if shared and not session.modified:
+                response = make_response(body)
+                response.cache_control.public = True
+                response.cache_control.max_age = current_app.config.get('PUBLIC_PAGE_MAX_AGE', 60)
+            else:
+                if not shared:
+                    body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+                tag = _etag(body)
+                response = make_response(body)
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+
+            # A versão logada das mesmas URLs é outra (menu do usuário)
+            response.vary.add('Cookie')
+            # Fraco também no 304: o gzip troca o ETag do 200 por W/"..."
+            response.set_etag(tag, weak=True)
+            return response.make_conditional(request)
+        return decorated
+    return decorator
+
+def invalidate_public_pages():
+    """Descarta as páginas deste processo (os demais seguem a versão de news)"""
+    _pages.clear()
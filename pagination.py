@@ -0,0 +1,81 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import tuple_
+from caching import TTLCache
+
+# Paginação por cursor (keyset) para as listagens da API. Em vez de OFFSET e
+# COUNT(*), cada página continua a partir da chave de ordenação do último
+# item, ex.: (due_date, id); com um índice nessa ordem o custo por página é
+# o mesmo na primeira e na milésima página. O cursor é opaco para o cliente
+# (base64 dos valores da chave).
+
+_totals = TTLCache(max_size=1000, ttl=60)
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _python_value(value, python_type):
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    if not isinstance(value, python_type):
+        raise ValueError('Tipo inválido no cursor')
+    return value
+
+def encode_cursor(values):
+    data = json.dumps([_json_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, columns):
+    """Valores da chave gravados no cursor. Levanta ValueError se o cursor não vale para essas colunas."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(data, list) or len(data) != len(columns):
+        raise ValueError('Cursor inválido')
+    try:
+        return [_python_value(value, column.type.python_type) for value, column in zip(data, columns)]
+    except (TypeError, ArithmeticError):
+        raise ValueError('Cursor inválido')
+
+def keyset_page(query, columns, key, per_page, cursor=None, descending=False):
+    """
+    Uma página de `query` ordenada por `columns` (a última deve ser única,
+    normalmente o id). `key(row)` devolve os valores dessas colunas para um
+    item do resultado. Retorna (itens, próximo cursor); o cursor é None na
+    última página.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        position = tuple_(*columns)
+        query = query.filter(position < tuple_(*values) if descending else position > tuple_(*values))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
+
+def approximate_total(cache_key, query):
+    """COUNT(*) da consulta, guardado por alguns segundos (aproximado entre páginas)"""
+    total = _totals.get(cache_key)
+    if total is None:
+        total = query.order_by(None).count()
+        _totals.set(cache_key, total)
+    return total
+
+def register_pagination(app):
+    _totals.ttl = app.config.get('API_TOTAL_CACHE_TTL', 60)
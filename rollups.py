@@ -0,0 +1,515 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import delete, event, func, inspect, literal, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import (Course, CourseEnrollmentRollup, DashboardCounter, Enrollment, EnrollmentRollup, Payment,
+                    RevenueRollup, Student, StudentDebtRollup, Teacher, User)
+
+# Agregados dos relatórios administrativos, mantidos na mesma transação das
+# alterações em Payment e Enrollment. Cada objeto inserido, alterado ou
+# removido em um flush gera deltas (valor anterior com sinal negativo, valor
+# novo com sinal positivo) que são somados às linhas das tabelas rollup_*.
+# Operações em massa que não passam pelo ORM (faturamento) registram os seus
+# deltas explicitamente; `flask rebuild-rollups` recalcula tudo do zero.
+#
+# Os contadores do painel (DashboardCounters) seguem a mesma ideia em uma
+# única linha; `flask reconcile-counters`, agendado no cron, compara com
+# COUNTs reais e corrige o que tiver divergido.
+
+OPEN_STATUSES = ('pending', 'overdue')
+
+PAYMENT_FIELDS = ('student_id', 'amount', 'due_date', 'payment_date', 'status')
+ENROLLMENT_FIELDS = ('course_id', 'enrollment_date', 'status')
+
+ROLLUP_MODELS = (RevenueRollup, EnrollmentRollup, StudentDebtRollup, CourseEnrollmentRollup)
+
+def month_start(value):
+    return value.replace(day=1) if value else None
+
+class ReportingRollups:
+
+    # ------------------------------------------------------------------
+    # Deltas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _new_deltas():
+        return defaultdict(lambda: defaultdict(lambda: [0, 0]))
+
+    @staticmethod
+    def _add_payment(deltas, values, sign):
+        amount = Decimal(str(values['amount'] or 0))
+        status = values['status'] or 'pending'
+
+        if status == 'paid' and values['payment_date']:
+            row = deltas[RevenueRollup][(month_start(values['payment_date']),)]
+            row[0] += sign * amount
+            row[1] += sign
+
+        if status in OPEN_STATUSES and values['student_id'] and values['due_date']:
+            row = deltas[StudentDebtRollup][(values['student_id'], month_start(values['due_date']))]
+            row[0] += sign * amount
+            row[1] += sign
+
+    @staticmethod
+    def _add_enrollment(deltas, values, sign):
+        enrollment_date = values['enrollment_date'] or date.today()
+        deltas[EnrollmentRollup][(month_start(enrollment_date),)][0] += sign
+
+        if (values['status'] or 'active') == 'active' and values['course_id']:
+            deltas[CourseEnrollmentRollup][(values['course_id'],)][0] += sign
+
+    @staticmethod
+    def _current_values(obj, fields):
+        state = inspect(obj)
+        return {field: state.dict.get(field) for field in fields}
+
+    @staticmethod
+    def _previous_values(obj, fields):
+        """Valores como estavam no banco antes do flush"""
+        state = inspect(obj)
+        values = {}
+        for field in fields:
+            history = state.attrs[field].history
+            if history.deleted:
+                values[field] = history.deleted[0]
+            elif history.unchanged:
+                values[field] = history.unchanged[0]
+            else:
+                values[field] = state.dict.get(field)
+        return values
+
+    @staticmethod
+    def _changed(obj, fields):
+        state = inspect(obj)
+        return any(state.attrs[field].history.has_changes() for field in fields)
+
+    @staticmethod
+    def collect_flush_deltas(session):
+        """Deltas dos objetos Payment/Enrollment do flush atual"""
+        deltas = ReportingRollups._new_deltas()
+        tracked = (
+            (Payment, PAYMENT_FIELDS, ReportingRollups._add_payment),
+            (Enrollment, ENROLLMENT_FIELDS, ReportingRollups._add_enrollment),
+        )
+
+        for model, fields, add in tracked:
+            for obj in session.new:
+                if isinstance(obj, model):
+                    add(deltas, ReportingRollups._current_values(obj, fields), 1)
+
+            for obj in session.dirty:
+                if isinstance(obj, model) and ReportingRollups._changed(obj, fields):
+                    add(deltas, ReportingRollups._previous_values(obj, fields), -1)
+                    add(deltas, ReportingRollups._current_values(obj, fields), 1)
+
+            for obj in session.deleted:
+                if isinstance(obj, model):
+                    add(deltas, ReportingRollups._previous_values(obj, fields), -1)
+
+        return deltas
+
+    # ------------------------------------------------------------------
+    # Gravação
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _upsert(connection, table, keys, value_columns):
+        dialect = connection.dialect.name
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(table)
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(table)
+        else:
+            return None
+
+        return stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: table.c[column] + stmt.excluded[column] for column in value_columns}
+        )
+
+    @staticmethod
+    def apply(connection, deltas):
+        """Soma os deltas às tabelas de agregação (INSERT ... ON CONFLICT DO UPDATE)"""
+        for model, rows in deltas.items():
+            table = model.__table__
+            keys = [column.name for column in table.primary_key.columns]
+            value_columns = [column.name for column in table.columns if not column.primary_key]
+
+            params = [
+                dict(zip(keys, key), **dict(zip(value_columns, values)))
+                for key, values in rows.items() if any(values)
+            ]
+            if not params:
+                continue
+
+            stmt = ReportingRollups._upsert(connection, table, keys, value_columns)
+            if stmt is not None:
+                connection.execute(stmt, params)
+            else:
+                for row in params:
+                    where = [table.c[key] == row[key] for key in keys]
+                    result = connection.execute(update(table).where(*where).values(
+                        **{column: table.c[column] + row[column] for column in value_columns}
+                    ))
+                    if result.rowcount == 0:
+                        connection.execute(table.insert().values(**row))
+
+            if model is StudentDebtRollup:
+                # Alunos sem débito em um mês não precisam de linha
+                student_ids = {key[0] for key in rows}
+                connection.execute(delete(table).where(
+                    table.c.student_id.in_(student_ids),
+                    table.c.payments_count <= 0
+                ))
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        deltas = ReportingRollups.collect_flush_deltas(session)
+        if deltas:
+            ReportingRollups.apply(session.connection(), deltas)
+
+    @staticmethod
+    def record_billed_payments(reference_month, created_at, first_enrollment_id=None, last_enrollment_id=None):
+        """
+        Registra nos agregados as mensalidades criadas pelo INSERT ... SELECT
+        do faturamento, que não passa pelos eventos do ORM.
+        """
+        query = select(
+            Payment.student_id,
+            Payment.due_date,
+            func.sum(Payment.amount),
+            func.count(Payment.id)
+        ).where(
+            Payment.reference_month == reference_month,
+            Payment.created_at == created_at,
+            Payment.enrollment_id != None,
+            Payment.status.in_(OPEN_STATUSES)
+        ).group_by(Payment.student_id, Payment.due_date)
+
+        if first_enrollment_id is not None:
+            query = query.where(Payment.enrollment_id >= first_enrollment_id)
+        if last_enrollment_id is not None:
+            query = query.where(Payment.enrollment_id <= last_enrollment_id)
+
+        deltas = ReportingRollups._new_deltas()
+        for student_id, due_date, amount, count in db.session.execute(query):
+            row = deltas[StudentDebtRollup][(student_id, month_start(due_date))]
+            row[0] += Decimal(str(amount or 0))
+            row[1] += count
+
+        ReportingRollups.apply(db.session.connection(), deltas)
+
+    @staticmethod
+    def rebuild(connection=None):
+        """Recalcula todos os agregados a partir de payments e enrollments"""
+        connection = connection or db.session.connection()
+
+        for model in ROLLUP_MODELS:
+            connection.execute(delete(model.__table__))
+
+        deltas = ReportingRollups._new_deltas()
+
+        # Agrupamento por dia no banco; por mês aqui (evita extract() específico de cada banco)
+        revenue = select(Payment.payment_date, func.sum(Payment.amount), func.count(Payment.id)).where(
+            Payment.status == 'paid',
+            Payment.payment_date != None
+        ).group_by(Payment.payment_date)
+        for payment_date, amount, count in connection.execute(revenue):
+            row = deltas[RevenueRollup][(month_start(payment_date),)]
+            row[0] += Decimal(str(amount or 0))
+            row[1] += count
+
+        debt = select(Payment.student_id, Payment.due_date, func.sum(Payment.amount), func.count(Payment.id)).where(
+            Payment.status.in_(OPEN_STATUSES)
+        ).group_by(Payment.student_id, Payment.due_date)
+        for student_id, due_date, amount, count in connection.execute(debt):
+            row = deltas[StudentDebtRollup][(student_id, month_start(due_date))]
+            row[0] += Decimal(str(amount or 0))
+            row[1] += count
+
+        enrollments = select(Enrollment.enrollment_date, func.count(Enrollment.id)).group_by(Enrollment.enrollment_date)
+        for enrollment_date, count in connection.execute(enrollments):
+            deltas[EnrollmentRollup][(month_start(enrollment_date or date.today()),)][0] += count
+
+        active = select(Enrollment.course_id, func.count(Enrollment.id)).where(
+            Enrollment.status == 'active'
+        ).group_by(Enrollment.course_id)
+        for course_id, count in connection.execute(active):
+            deltas[CourseEnrollmentRollup][(course_id,)][0] += count
+
+        ReportingRollups.apply(connection, deltas)
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def revenue_for_month(day):
+        row = db.session.get(RevenueRollup, month_start(day))
+        return row.total if row else 0
+
+    @staticmethod
+    def revenue_by_month(first_month, last_month):
+        """Linhas (month, total) de first_month até last_month, inclusive"""
+        return db.session.query(RevenueRollup.month, RevenueRollup.total).filter(
+            RevenueRollup.month >= month_start(first_month),
+            RevenueRollup.month <= month_start(last_month),
+            RevenueRollup.payments_count > 0
+        ).order_by(RevenueRollup.month).all()
+
+    @staticmethod
+    def enrollments_by_month(months):
+        """Dicionário {primeiro dia do mês: matrículas} para os meses pedidos"""
+        months = [month_start(month) for month in months]
+        rows = db.session.query(EnrollmentRollup.month, EnrollmentRollup.enrollments_count).filter(
+            EnrollmentRollup.month.in_(months)
+        ).all()
+        counts = dict(rows)
+        return {month: counts.get(month, 0) for month in months}
+
+    @staticmethod
+    def revenue_totals():
+        """(valor, quantidade) de todos os pagamentos recebidos"""
+        amount, count = db.session.query(
+            func.coalesce(func.sum(RevenueRollup.total), 0),
+            func.coalesce(func.sum(RevenueRollup.payments_count), 0)
+        ).one()
+        return amount, count
+
+    @staticmethod
+    def open_payments_totals():
+        """(valor, quantidade) de todos os pagamentos em aberto"""
+        amount, count = db.session.query(
+            func.coalesce(func.sum(StudentDebtRollup.amount), 0),
+            func.coalesce(func.sum(StudentDebtRollup.payments_count), 0)
+        ).one()
+        return amount, count
+
+    @staticmethod
+    def _overdue_rows(today):
+        """
+        Débito vencido por aluno: meses anteriores saem da tabela agregada,
+        o mês atual (vencimentos até ontem) é calculado na hora.
+        """
+        current_month = month_start(today)
+        closed = select(
+            StudentDebtRollup.student_id.label('student_id'),
+            StudentDebtRollup.amount.label('amount'),
+            StudentDebtRollup.payments_count.label('payments_count')
+        ).where(StudentDebtRollup.due_month < current_month)
+
+        live = select(
+            Payment.student_id.label('student_id'),
+            Payment.amount.label('amount'),
+            literal(1).label('payments_count')
+        ).where(
+            Payment.status.in_(OPEN_STATUSES),
+            Payment.due_date >= current_month,
+            Payment.due_date < today
+        )
+        return union_all(closed, live).subquery()
+
+    @staticmethod
+    def overdue_totals(today):
+        """(valor, quantidade) dos pagamentos em aberto vencidos antes de `today`"""
+        rows = ReportingRollups._overdue_rows(today)
+        amount, count = db.session.query(
+            func.coalesce(func.sum(rows.c.amount), 0),
+            func.coalesce(func.sum(rows.c.payments_count), 0)
+        ).one()
+        return amount, count
+
+    @staticmethod
+    def top_debtors(today, limit=5):
+        """(nome, débito vencido, pagamentos vencidos) dos maiores devedores"""
+        rows = ReportingRollups._overdue_rows(today)
+        total_debt = func.sum(rows.c.amount)
+        return db.session.query(
+            User.full_name,
+            total_debt.label('total_debt'),
+            func.sum(rows.c.payments_count).label('overdue_count')
+        ).join(
+            Student, Student.id == rows.c.student_id
+        ).join(
+            User, User.id == Student.user_id
+        ).group_by(User.id, User.full_name).order_by(total_debt.desc()).limit(limit).all()
+
+    @staticmethod
+    def course_enrollment_stats():
+        """(curso, mensalidade, matrículas ativas, receita potencial) por curso"""
+        return db.session.query(
+            Course.name,
+            Course.monthly_price,
+            CourseEnrollmentRollup.active_count.label('total_enrollments'),
+            (CourseEnrollmentRollup.active_count * Course.monthly_price).label('potential_revenue')
+        ).join(
+            CourseEnrollmentRollup, CourseEnrollmentRollup.course_id == Course.id
+        ).filter(
+            CourseEnrollmentRollup.active_count > 0
+        ).order_by(Course.name).all()
+
+COUNTER_COLUMNS = ('students', 'active_students', 'teachers', 'active_courses', 'pending_payments')
+
+class DashboardCounters:
+
+    @staticmethod
+    def _previous(obj, field):
+        return ReportingRollups._previous_values(obj, (field,))[field]
+
+    @staticmethod
+    def _active_users(session, user_ids):
+        """{user_id: ativo} para os usuários dos alunos inseridos/removidos no flush"""
+        if not user_ids:
+            return {}
+        rows = session.connection().execute(select(User.id, User._is_active).where(User.id.in_(user_ids)))
+        active = {user_id: is_active is not False for user_id, is_active in rows}
+        # Usuário removido no mesmo flush: vale o estado anterior
+        for obj in session.deleted:
+            if isinstance(obj, User) and obj.id in user_ids:
+                active[obj.id] = DashboardCounters._previous(obj, '_is_active') is not False
+        return active
+
+    @staticmethod
+    def collect_flush_deltas(session):
+        """Variação de cada contador causada pelo flush atual"""
+        deltas = dict.fromkeys(COUNTER_COLUMNS, 0)
+        student_users = []
+
+        for obj in session.new:
+            if isinstance(obj, Student):
+                deltas['students'] += 1
+                student_users.append((obj.user_id, 1))
+            elif isinstance(obj, Teacher):
+                deltas['teachers'] += 1
+            elif isinstance(obj, Course):
+                deltas['active_courses'] += obj.is_active is not False
+            elif isinstance(obj, Payment):
+                deltas['pending_payments'] += (obj.status or 'pending') == 'pending'
+
+        for obj in session.deleted:
+            if isinstance(obj, Student):
+                deltas['students'] -= 1
+                student_users.append((DashboardCounters._previous(obj, 'user_id'), -1))
+            elif isinstance(obj, Teacher):
+                deltas['teachers'] -= 1
+            elif isinstance(obj, Course):
+                deltas['active_courses'] -= DashboardCounters._previous(obj, 'is_active') is not False
+            elif isinstance(obj, Payment):
+                deltas['pending_payments'] -= (DashboardCounters._previous(obj, 'status') or 'pending') == 'pending'
+
+        toggled_users = {}
+        for obj in session.dirty:
+            if isinstance(obj, Course) and ReportingRollups._changed(obj, ('is_active',)):
+                deltas['active_courses'] += (obj.is_active is not False) - (DashboardCounters._previous(obj, 'is_active') is not False)
+            elif isinstance(obj, Payment) and ReportingRollups._changed(obj, ('status',)):
+                deltas['pending_payments'] += (obj.status == 'pending') - (DashboardCounters._previous(obj, 'status') == 'pending')
+            elif isinstance(obj, Student) and ReportingRollups._changed(obj, ('user_id',)):
+                # Perfil trocou de usuário
+                student_users.append((DashboardCounters._previous(obj, 'user_id'), -1))
+                student_users.append((obj.user_id, 1))
+            elif isinstance(obj, User) and ReportingRollups._changed(obj, ('_is_active',)):
+                change = (obj._is_active is not False) - (DashboardCounters._previous(obj, '_is_active') is not False)
+                if change:
+                    toggled_users[obj.id] = change
+
+        if student_users:
+            active = DashboardCounters._active_users(session, {user_id for user_id, _ in student_users})
+            deltas['active_students'] += sum(sign for user_id, sign in student_users if active.get(user_id))
+
+        if toggled_users:
+            # Alunos (já gravados) dos usuários ativados/desativados, exceto os inseridos neste flush
+            new_students = {obj.id for obj in session.new if isinstance(obj, Student)}
+            query = select(Student.user_id, func.count(Student.id)).where(
+                Student.user_id.in_(toggled_users), Student.id.notin_(new_students)
+            ).group_by(Student.user_id)
+            for user_id, count in session.connection().execute(query):
+                deltas['active_students'] += toggled_users[user_id] * count
+
+        return {name: delta for name, delta in deltas.items() if delta}
+
+    @staticmethod
+    def add(connection, **deltas):
+        """Soma os deltas à linha dos contadores (UPDATE ... SET x = x + delta)"""
+        deltas = {name: delta for name, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        table = DashboardCounter.__table__
+        connection.execute(update(table).where(table.c.id == 1).values(
+            **{name: table.c[name] + delta for name, delta in deltas.items()}
+        ))
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        DashboardCounters.add(session.connection(), **DashboardCounters.collect_flush_deltas(session))
+
+    @staticmethod
+    def live_counts(connection=None):
+        """Os mesmos números calculados com COUNT nas tabelas"""
+        connection = connection or db.session.connection()
+        query = select(
+            select(func.count(Student.id)).scalar_subquery(),
+            select(func.count(Student.id)).join(User, Student.user_id == User.id).where(
+                User._is_active == True
+            ).scalar_subquery(),
+            select(func.count(Teacher.id)).scalar_subquery(),
+            select(func.count(Course.id)).where(Course.is_active == True).scalar_subquery(),
+            select(func.count(Payment.id)).where(Payment.status == 'pending').scalar_subquery(),
+        )
+        return dict(zip(COUNTER_COLUMNS, connection.execute(query).one()))
+
+    @staticmethod
+    def reconcile(connection=None):
+        """
+        Regrava os contadores a partir das contagens reais. Retorna
+        {contador: (valor gravado, valor real)} dos que estavam divergentes.
+        """
+        connection = connection or db.session.connection()
+        table = DashboardCounter.__table__
+        # Trava a linha antes de contar: um +1 de outra transação espera este
+        # commit (e entra depois do valor absoluto) ou já está na contagem
+        stored = connection.execute(
+            select(*(table.c[name] for name in COUNTER_COLUMNS)).where(table.c.id == 1).with_for_update()
+        ).first()
+        live = DashboardCounters.live_counts(connection)
+
+        values = dict(live, reconciled_at=datetime.utcnow())
+        if stored is None:
+            connection.execute(table.insert().values(id=1, **values))
+            return {name: (None, count) for name, count in live.items()}
+
+        connection.execute(update(table).where(table.c.id == 1).values(**values))
+        return {
+            name: (stored_count, live[name])
+            for name, stored_count in zip(COUNTER_COLUMNS, stored) if stored_count != live[name]
+        }
+
+    @staticmethod
+    def current():
+        """Linha dos contadores (criada na primeira leitura, se faltar)"""
+        counters = db.session.get(DashboardCounter, 1)
+        if counters is None:
+            DashboardCounters.reconcile()
+            db.session.commit()
+            counters = db.session.get(DashboardCounter, 1)
+        return counters
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+def register_rollups(app):
+    """Liga a manutenção dos agregados aos flushes da sessão"""
+    if event.contains(db.session, 'after_flush', ReportingRollups._after_flush):
+        return
+
+    # Garante que o valor anterior esteja carregado quando o atributo muda,
+    # mesmo em objetos expirados, para o delta negativo ficar correto
+    for model, fields in ((Payment, PAYMENT_FIELDS), (Enrollment, ENROLLMENT_FIELDS),
+                          (Course, ('is_active',)), (User, ('_is_active',)), (Student, ('user_id',))):
+        for field in fields:
+            event.listen(getattr(model, field), 'set', _load_previous_value, active_history=True, retval=True)
+
+    event.listen(db.session, 'after_flush', ReportingRollups._after_flush)
+    event.listen(db.session, 'after_flush', DashboardCounters._after_flush)
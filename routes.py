@@ -9,16 +9,28 @@ from app import db, csrf
 from models import User, Student, Teacher, Room, Course, Enrollment, Schedule, Payment, Material, ExperimentalClass, News, PaymentTransaction
 from mercado_pago import mp_api
 from forms import *
-from utils import send_email, allowed_file
+from utils import allowed_file
 from audit_logger import AuditLogger
+from outbox_service import OutboxService
+from rollups import DashboardCounters, ReportingRollups
+from identity import current_student, current_teacher
+from admin_lists import ADMIN_LISTS, PAYMENT_STATUSES
+from search import SearchIndex
+from student_lookup import lookup_students
+from page_cache import invalidate_public_pages, public_page
+from hit_counters import count_hit
+from schedule_conflicts import describe_conflicts, experimental_class_conflicts, lock_resources, schedule_conflicts
 import json # Import json module
 
+# Linhas de pagamentos em aberto listadas nos relatórios (os totais vêm dos agregados)
+REPORT_PENDING_LIMIT = 50
+
 # Create blueprints
 main = Blueprint('main', __name__)
 auth = Blueprint('auth', __name__, url_prefix='/auth')
 admin = Blueprint('admin', __name__, url_prefix='/admin')
 student_bp = Blueprint('student', __name__, url_prefix='/student')
-teacher_bp = Blueprint('teacher', __name__, url_for='/teacher')
+teacher_bp = Blueprint('teacher', __name__, url_prefix='/teacher')
 public = Blueprint('public', __name__, url_prefix='/public')
 
 def register_blueprints(app):
@@ -107,17 +119,14 @@ def dashboard():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    # Dashboard statistics
-    total_students = Student.query.count()
-    total_teachers = Teacher.query.count()
-    total_courses = Course.query.filter_by(is_active=True).count()
-    pending_payments = Payment.query.filter_by(status='pending').count()
+    # Dashboard statistics (contadores mantidos a cada flush, uma linha)
+    counters = DashboardCounters.current()
 
     return render_template('admin/dashboard.html',
-                         total_students=total_students,
-                         total_teachers=total_teachers,
-                         total_courses=total_courses,
-                         pending_payments=pending_payments)
+                         total_students=counters.students,
+                         total_teachers=counters.teachers,
+                         total_courses=counters.active_courses,
+                         pending_payments=counters.pending_payments)
 
 @admin.route('/students')
 @login_required
@@ -126,8 +135,8 @@ def students():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    students = db.session.query(Student, User).join(User, Student.user_id == User.id).all()
-    return render_template('admin/students.html', students=students)
+    listing = ADMIN_LISTS['students'].page(request.args)
+    return render_template('admin/students.html', listing=listing)
 
 @admin.route('/student/add', methods=['GET', 'POST'])
 @login_required
@@ -259,8 +268,8 @@ def teachers():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    teachers = db.session.query(Teacher, User).join(User, Teacher.user_id == User.id).all()
-    return render_template('admin/teachers.html', teachers=teachers)
+    listing = ADMIN_LISTS['teachers'].page(request.args)
+    return render_template('admin/teachers.html', listing=listing)
 
 @admin.route('/teacher/add', methods=['GET', 'POST'])
 @login_required
@@ -525,6 +534,23 @@ def schedule():
     schedules = db.session.query(Schedule, Course, Teacher, User, Room).join(Course, Schedule.course_id == Course.id).join(Teacher, Schedule.teacher_id == Teacher.id).join(User, Teacher.user_id == User.id).join(Room, Schedule.room_id == Room.id).all()
     return render_template('admin/schedule.html', schedules=schedules)
 
+def _schedule_slot_is_free(form, schedule=None):
+    """Confere o período do formulário e os conflitos com a grade; avisa por flash"""
+    if form.end_time.data <= form.start_time.data:
+        flash('O horário de término deve ser depois do início.', 'danger')
+        return False
+    if schedule is not None and not schedule.is_active:
+        return True
+
+    # Gravações concorrentes do mesmo professor ou sala verificam uma de cada vez, até o commit
+    lock_resources(form.teacher_id.data, form.room_id.data)
+    conflicts = schedule_conflicts(form.teacher_id.data, form.room_id.data, form.day_of_week.data,
+                                   form.start_time.data, form.end_time.data,
+                                   exclude_id=schedule.id if schedule else None)
+    for message in describe_conflicts(conflicts):
+        flash(message, 'danger')
+    return not conflicts
+
 @admin.route('/schedule/add', methods=['GET', 'POST'])
 @login_required
 def add_schedule():
@@ -543,7 +569,7 @@ def add_schedule():
     form.teacher_id.choices = [(0, 'Selecione um professor')] + [(t.Teacher.id, t.User.full_name) for t in teachers]
     form.room_id.choices = [(0, 'Selecione uma sala')] + [(r.id, r.name) for r in rooms]
 
-    if form.validate_on_submit():
+    if form.validate_on_submit() and _schedule_slot_is_free(form):
         schedule = Schedule()
         schedule.course_id = form.course_id.data
         schedule.teacher_id = form.teacher_id.data
@@ -579,7 +605,7 @@ def edit_schedule(schedule_id):
     form.teacher_id.choices = [(0, 'Selecione um professor')] + [(t.Teacher.id, t.User.full_name) for t in teachers]
     form.room_id.choices = [(0, 'Selecione uma sala')] + [(r.id, r.name) for r in rooms]
 
-    if form.validate_on_submit():
+    if form.validate_on_submit() and _schedule_slot_is_free(form, schedule):
         schedule.course_id = form.course_id.data
         schedule.teacher_id = form.teacher_id.data
         schedule.room_id = form.room_id.data
@@ -614,8 +640,91 @@ def finances():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    payments = db.session.query(Payment, Student, User).join(Student, Payment.student_id == Student.id).join(User, Student.user_id == User.id).all()
-    return render_template('admin/finances.html', payments=payments, date=date)
+    listing = ADMIN_LISTS['payments'].page(request.args)
+
+    # Totais dos cartões pelas tabelas agregadas, sem percorrer os pagamentos
+    paid_amount, paid_count = ReportingRollups.revenue_totals()
+    open_amount, open_count = ReportingRollups.open_payments_totals()
+    overdue_amount, overdue_count = ReportingRollups.overdue_totals(date.today())
+
+    return render_template('admin/finances.html', listing=listing, date=date,
+                           paid_amount=paid_amount, paid_count=paid_count,
+                           pending_count=open_count - overdue_count, overdue_count=overdue_count,
+                           statuses=PAYMENT_STATUSES)
+
+@admin.route('/list/<list_name>')
+@login_required
+def admin_list(list_name):
+    """Página seguinte de uma listagem administrativa, em JSON (Carregar mais)"""
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    admin_list = ADMIN_LISTS.get(list_name)
+    if admin_list is None:
+        return jsonify({'error': 'Listagem não encontrada'}), 404
+
+    listing = admin_list.page(request.args)
+    return jsonify({
+        'items': admin_list.resource.dump(listing.rows),
+        'html': render_template(admin_list.rows_template, rows=listing.rows),
+        'next_cursor': listing.next_cursor,
+        'total': listing.total
+    })
+
+SEARCH_RESULT_URLS = {
+    'student': ('admin.view_student', 'student_id'),
+    'teacher': ('admin.view_teacher', 'teacher_id'),
+    'course': ('admin.view_course', 'course_id'),
+    'news': ('admin.news_view', 'news_id'),
+}
+
+@admin.route('/search')
+@login_required
+def search():
+    """Busca textual em pessoas, cursos e notícias, por relevância"""
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+
+    results = []
+    for result in SearchIndex.search(query, limit):
+        endpoint, param = SEARCH_RESULT_URLS.get(result.kind, (None, None))
+        results.append({
+            'kind': result.kind,
+            'id': result.id,
+            'title': str(result.title),
+            'snippet': str(result.snippet),
+            'url': url_for(endpoint, **{param: result.id}) if endpoint else None
+        })
+
+    return jsonify({'query': query, 'results': results})
+
+def _student_choices(student_id=None):
+    """Opções do campo de aluno: só o selecionado; os demais vêm da busca (student_lookup)"""
+    choices = [(0, 'Selecione um aluno')]
+    if student_id:
+        student = db.session.query(Student.id, User.full_name).join(
+            User, Student.user_id == User.id
+        ).filter(Student.id == student_id).first()
+        if student:
+            choices.append((student.id, student.full_name))
+    return choices
+
+@admin.route('/api/students/lookup')
+@login_required
+def student_lookup():
+    """Alunos ativos cujo nome ou e-mail começa com o texto digitado"""
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    students = lookup_students(request.args.get('q', ''), limit)
+    return jsonify({'students': [
+        {'id': student_id, 'name': name, 'email': email, 'phone': phone}
+        for student_id, name, email, phone in students
+    ]})
 
 @admin.route('/payment/add', methods=['GET', 'POST'])
 @login_required
@@ -625,10 +734,7 @@ def add_payment():
         return redirect(url_for('main.index'))
 
     form = PaymentForm()
-
-    # Populate student choices
-    students = db.session.query(Student, User).join(User, Student.user_id == User.id).all()
-    form.student_id.choices = [(0, 'Selecione um aluno')] + [(s.Student.id, s.User.full_name) for s in students]
+    form.student_id.choices = _student_choices(request.form.get('student_id', type=int))
 
     if form.validate_on_submit():
         payment = Payment()
@@ -657,10 +763,7 @@ def edit_payment(payment_id):
 
     payment = Payment.query.get_or_404(payment_id)
     form = PaymentForm(obj=payment)
-
-    # Populate student choices
-    students = db.session.query(Student, User).join(User, Student.user_id == User.id).all()
-    form.student_id.choices = [(0, 'Selecione um aluno')] + [(s.Student.id, s.User.full_name) for s in students]
+    form.student_id.choices = _student_choices(request.form.get('student_id', type=int) or payment.student_id)
 
     if form.validate_on_submit():
         payment.student_id = form.student_id.data
@@ -714,7 +817,7 @@ def student_dashboard():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     if not student:
         flash('Perfil de aluno não encontrado.', 'danger')
         return redirect(url_for('main.index'))
@@ -734,7 +837,7 @@ def materials():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     if not student:
         flash('Perfil de aluno não encontrado.', 'danger')
         return redirect(url_for('main.index'))
@@ -756,7 +859,7 @@ def teacher_dashboard():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_teacher()
     if not teacher:
         flash('Perfil de professor não encontrado.', 'danger')
         return redirect(url_for('main.index'))
@@ -771,6 +874,7 @@ def teacher_dashboard():
 
 # Public routes
 @public.route('/')
+@public_page()
 def landing():
     # Get latest 3 public news for homepage
     featured_news = News.query.filter_by(is_public=True, featured=True).order_by(News.publish_date.desc()).limit(1).all()
@@ -778,13 +882,21 @@ def landing():
 
     return render_template('public/landing.html', featured_news=featured_news, recent_news=recent_news)
 
+@public.route('/news/<int:news_id>')
+def news_detail(news_id):
+    # Fora do cache de páginas: cada leitura conta uma visualização
+    news_article = News.query.filter_by(id=news_id, is_public=True).first_or_404()
+    count_hit('news_views', news_article.id)
+    return render_template('public/news_detail.html', news=news_article)
+
 @public.route('/contact', methods=['GET', 'POST'])
+@public_page(shared=False)
 def contact():
     form = ContactForm()
     if form.validate_on_submit():
-        # Send email notification
+        # Queue email notification (sent by the outbox worker)
         try:
-            send_email(
+            OutboxService.enqueue_email(
                 subject=f'Contato do site: {form.subject.data}',
                 body=f'''
                 Nome: {form.name.data}
@@ -796,8 +908,10 @@ def contact():
                 ''',
                 recipients=['admin@solmaior.com']
             )
+            db.session.commit()
             flash('Mensagem enviada com sucesso! Entraremos em contato em breve.', 'success')
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f'Error sending contact email: {e}')
             flash('Erro ao enviar mensagem. Tente novamente.', 'danger')
 
@@ -825,13 +939,11 @@ def experimental_class():
         )
 
         db.session.add(experimental_class)
-        db.session.commit()
 
-        # Send email notification to admin
-        try:
-            send_email(
-                subject='Nova Solicitação de Aula Experimental - Sol Maior',
-                body=f'''
+        # Queue email notification to admin in the same transaction
+        OutboxService.enqueue_email(
+            subject='Nova Solicitação de Aula Experimental - Sol Maior',
+            body=f'''
                 Nova solicitação de aula experimental recebida:
 
                 Nome: {form.name.data}
@@ -849,10 +961,9 @@ def experimental_class():
                 Acesse o painel administrativo para agendar a aula:
                 {request.url_root}admin/experimental-classes
                 ''',
-                recipients=['admin@solmaior.com']
-            )
-        except Exception as e:
-            current_app.logger.error(f'Error sending experimental class notification: {e}')
+            recipients=['admin@solmaior.com']
+        )
+        db.session.commit()
 
         flash('Solicitação enviada com sucesso! Entraremos em contato em até 24 horas.', 'success')
         return redirect(url_for('public.experimental_class'))
@@ -860,6 +971,7 @@ def experimental_class():
     return render_template('public/experimental_class.html', form=form)
 
 @public.route('/help')
+@public_page()
 def help():
     return render_template('public/help.html')
 
@@ -928,7 +1040,7 @@ def pay_online(payment_id):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_student()
     if not student:
         flash('Perfil de aluno não encontrado.', 'danger')
         return redirect(url_for('main.index'))
@@ -1030,7 +1142,7 @@ def course_materials(course_id):
 
     # Check if teacher is accessing their own course
     if current_user.user_type == 'teacher':
-        teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+        teacher = current_teacher()
         if not teacher or course.teacher_id != teacher.id:
             flash('Você só pode acessar materiais dos seus próprios cursos.', 'danger')
             return redirect(url_for('teacher.teacher_dashboard'))
@@ -1274,11 +1386,10 @@ def quick_enroll():
         flash('Matrícula realizada com sucesso!', 'success')
         return redirect(url_for('admin.view_student', student_id=student_id))
 
-    # GET request - show form
-    students = db.session.query(Student, User).join(User, Student.user_id == User.id).filter(User.is_active == True).all()
+    # GET request - show form (os alunos vêm da busca, student_lookup)
     courses = Course.query.filter_by(is_active=True).all()
 
-    return render_template('admin/quick_enroll.html', students=students, courses=courses, datetime=datetime)
+    return render_template('admin/quick_enroll.html', courses=courses, datetime=datetime)
 
 @admin.route('/reports')
 @login_required
@@ -1287,8 +1398,6 @@ def reports():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    from sqlalchemy import func, extract
-
     # Estatísticas gerais
     total_students = Student.query.count()
     active_students = db.session.query(Student).join(User).filter(User.is_active == True).count()
@@ -1313,81 +1422,44 @@ def reports():
         Course.is_active == True
     ).all()
 
-    # Análise de inadimplência
+    # Análise de inadimplência (totais das tabelas de agregação)
     today = datetime.now().date()
-    pending_payments = db.session.query(Payment, Student, User).join(
-        Student, Payment.student_id == Student.id
-    ).join(
-        User, Student.user_id == User.id
-    ).filter(Payment.status == 'pending').all()
+    open_amount, open_count = ReportingRollups.open_payments_totals()
+    lost_revenue, overdue_count = ReportingRollups.overdue_totals(today)
 
-    overdue_payments = db.session.query(Payment, Student, User).join(
+    # Lista só os pagamentos em aberto mais antigos; o total vem do agregado
+    pending_payments = db.session.query(Payment, Student, User).join(
         Student, Payment.student_id == Student.id
     ).join(
         User, Student.user_id == User.id
     ).filter(
-        Payment.status.in_(['pending', 'overdue']),
-        Payment.due_date < today
-    ).all()
+        Payment.status.in_(['pending', 'overdue'])
+    ).order_by(Payment.due_date, Payment.id).limit(REPORT_PENDING_LIMIT).all()
 
     # Taxa de inadimplência
     total_payments = Payment.query.count()
-    overdue_count = len(overdue_payments)
     default_rate = (overdue_count / total_payments * 100) if total_payments > 0 else 0
 
-    # Receita mensal
-    current_month_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == 'paid',
-        extract('month', Payment.payment_date) == datetime.now().month,
-        extract('year', Payment.payment_date) == datetime.now().year
-    ).scalar() or 0
+    # Receita do mês atual
+    current_month_revenue = ReportingRollups.revenue_for_month(today)
 
-    # Receita perdida por inadimplência
-    lost_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status.in_(['pending', 'overdue']),
-        Payment.due_date < today
-    ).scalar() or 0
-
-    # Matrículas por curso com detalhes financeiros
-    enrollment_stats = db.session.query(
-        Course.name,
-        Course.monthly_price,
-        func.count(Enrollment.id).label('total_enrollments'),
-        func.sum(Course.monthly_price).label('potential_revenue')
-    ).join(
-        Enrollment, Course.id == Enrollment.course_id
-    ).filter(
-        Enrollment.status == 'active'
-    ).group_by(Course.id, Course.name, Course.monthly_price).all()
+    # Matrículas ativas por curso com receita potencial
+    enrollment_stats = ReportingRollups.course_enrollment_stats()
 
     # Análise de crescimento (últimos 12 meses)
-    growth_data = []
+    months = []
+    month = today.replace(day=1)
     for i in range(12):
-        target_date = datetime.now() - timedelta(days=30*i)
-        enrollments_count = Enrollment.query.filter(
-            extract('month', Enrollment.enrollment_date) == target_date.month,
-            extract('year', Enrollment.enrollment_date) == target_date.year
-        ).count()
-        growth_data.append({
-            'month': target_date.strftime('%m/%Y'),
-            'enrollments': enrollments_count
-        })
+        months.append(month)
+        month = (month - timedelta(days=1)).replace(day=1)
+    enrollments_by_month = ReportingRollups.enrollments_by_month(months)
+    growth_data = [{
+        'month': month.strftime('%m/%Y'),
+        'enrollments': enrollments_by_month[month]
+    } for month in months]
 
     # Top 5 alunos inadimplentes
-    top_defaulters = db.session.query(
-        User.full_name,
-        func.sum(Payment.amount).label('total_debt'),
-        func.count(Payment.id).label('overdue_count')
-    ).join(
-        Student, User.id == Student.user_id
-    ).join(
-        Payment, Student.id == Payment.student_id
-    ).filter(
-        Payment.status.in_(['pending', 'overdue']),
-        Payment.due_date < today
-    ).group_by(User.id, User.full_name).order_by(
-        func.sum(Payment.amount).desc()
-    ).limit(5).all()
+    top_defaulters = ReportingRollups.top_debtors(today, limit=5)
 
     return render_template('admin/reports.html',
                          total_students=total_students,
@@ -1398,7 +1470,9 @@ def reports():
                          students_without_enrollment=students_without_enrollment,
                          courses_without_teacher=courses_without_teacher,
                          pending_payments=pending_payments,
-                         overdue_payments=overdue_payments,
+                         pending_count=open_count,
+                         pending_amount=open_amount,
+                         overdue_count=overdue_count,
                          default_rate=default_rate,
                          current_month_revenue=current_month_revenue,
                          lost_revenue=lost_revenue,
@@ -1414,35 +1488,29 @@ def financial_summary():
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
 
-    # Receita por mês (últimos 12 meses)
-    monthly_revenue = db.session.query(
-        extract('year', Payment.payment_date).label('year'),
-        extract('month', Payment.payment_date).label('month'),
-        func.sum(Payment.amount).label('total')
-    ).filter(
-        Payment.status == 'paid',
-        Payment.payment_date >= datetime.now().replace(year=datetime.now().year-1)
-    ).group_by(
-        extract('year', Payment.payment_date),
-        extract('month', Payment.payment_date)
-    ).order_by('year', 'month').all()
+    today = datetime.now().date()
 
-    # Inadimplência
+    # Receita por mês (últimos 12 meses)
+    first_month = today.replace(year=today.year - 1, day=1)
+    monthly_revenue = [{
+        'year': month.year,
+        'month': month.month,
+        'total': total
+    } for month, total in ReportingRollups.revenue_by_month(first_month, today)]
+
+    # Inadimplência: lista dos vencidos mais antigos, total pelo agregado
     overdue_payments = db.session.query(Payment, Student, User).join(
         Student, Payment.student_id == Student.id
     ).join(
         User, Student.user_id == User.id
     ).filter(
-        Payment.status == 'pending',
-        Payment.due_date < datetime.now().date()
-    ).all()
+        Payment.status.in_(['pending', 'overdue']),
+        Payment.due_date < today
+    ).order_by(Payment.due_date, Payment.id).limit(REPORT_PENDING_LIMIT).all()
 
-    overdue_amount = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == 'pending',
-        Payment.due_date < datetime.now().date()
-    ).scalar() or 0
+    overdue_amount, overdue_count = ReportingRollups.overdue_totals(today)
 
     # Receita por curso
     course_revenue = db.session.query(
@@ -1460,8 +1528,9 @@ def financial_summary():
                          monthly_revenue=monthly_revenue,
                          overdue_payments=overdue_payments,
                          overdue_amount=overdue_amount,
+                         overdue_count=overdue_count,
                          course_revenue=course_revenue,
-                         today=datetime.now().date())
+                         today=today)
 
 @admin.route('/material/<int:material_id>/download')
 @login_required
@@ -1474,7 +1543,7 @@ def download_material(material_id):
 
     # Check if user has access to this material
     if current_user.user_type == 'student':
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             flash('Perfil de estudante não encontrado.', 'danger')
             return redirect(url_for('main.index'))
@@ -1491,7 +1560,7 @@ def download_material(material_id):
             return redirect(url_for('student.student_dashboard'))
 
     elif current_user.user_type == 'teacher':
-        teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+        teacher = current_teacher()
         if not teacher:
             flash('Perfil de professor não encontrado.', 'danger')
             return redirect(url_for('main.index'))
@@ -1502,6 +1571,7 @@ def download_material(material_id):
             flash('Você não tem acesso a este material.', 'danger')
             return redirect(url_for('teacher.teacher_dashboard'))
 
+    count_hit('material_downloads', material.id)
     upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
     return send_from_directory(upload_folder, material.filename, as_attachment=True)
 
@@ -1538,7 +1608,7 @@ def upload_material(course_id):
 
 
     if current_user.user_type == 'teacher':
-        teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+        teacher = current_teacher()
         if not teacher or course.teacher_id != teacher.id:
             flash('Você só pode enviar materiais para seus próprios cursos.', 'danger')
             return redirect(url_for('teacher.teacher_dashboard'))
@@ -1599,7 +1669,7 @@ def preview_material(material_id):
 
     # Same access control as download
     if current_user.user_type == 'student':
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student:
             flash('Perfil de estudante não encontrado.', 'danger')
             return redirect(url_for('main.index'))
@@ -1615,7 +1685,7 @@ def preview_material(material_id):
             return redirect(url_for('student.student_dashboard'))
 
     elif current_user.user_type == 'teacher':
-        teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+        teacher = current_teacher()
         if not teacher:
             flash('Perfil de professor não encontrado.', 'danger')
             return redirect(url_for('main.index'))
@@ -1625,6 +1695,7 @@ def preview_material(material_id):
             flash('Você não tem acesso a este material.', 'danger')
             return redirect(url_for('teacher.teacher_dashboard'))
 
+    count_hit('material_previews', material.id)
     upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
 
     # For preview, serve inline instead of as attachment
@@ -1737,66 +1808,83 @@ def generate_monthly_payments():
     if current_user.user_type not in ['admin', 'secretary']:
         return jsonify({'error': 'Acesso negado'}), 403
 
-    try:
-        import sqlite3
-        import shutil
-        import os
-        from datetime import datetime, date, timedelta
-        from calendar import monthrange
+    from billing_service import BillingService
 
+    try:
         # Parâmetros
         month = int(request.json.get('month', datetime.now().month))
         year = int(request.json.get('year', datetime.now().year))
 
-        # Data de vencimento (dia 10 do mês)
-        due_day = 10
-        due_date = date(year, month, due_day)
-        reference_month = date(year, month, 1)
-
-        # Buscar matrículas ativas
-        active_enrollments = db.session.query(Enrollment, Student, Course).join(
-            Student, Enrollment.student_id == Student.id
-        ).join(
-            Course, Enrollment.course_id == Course.id
-        ).filter(
-            Enrollment.status == 'active'
-        ).all()
-
-        created_payments = 0
-
-        for enrollment, student, course in active_enrollments:
-            # Verificar se já existe pagamento para este mês
-            existing_payment = Payment.query.filter_by(
-                student_id=student.id,
-                reference_month=reference_month
-            ).first()
-
-            if not existing_payment:
-                # Criar novo pagamento
-                payment = Payment()
-                payment.student_id = student.id
-                payment.amount = enrollment.monthly_payment or course.monthly_price
-                payment.due_date = due_date
-                payment.status = 'pending'
-                payment.reference_month = reference_month
-                payment.notes = f'Mensalidade {month:02d}/{year} - {course.name}'
-
-                db.session.add(payment)
-                created_payments += 1
-
-        db.session.commit()
-
-        return jsonify({
+        # Só cria (ou retoma) a execução; o cliente avança os lotes em
+        # /billing-runs/<id>/advance e acompanha em /billing-runs/<id>
+        run = BillingService.start_run(year, month, user_id=current_user.id)
+        progress = BillingService.run_progress(run)
+        progress.update({
             'success': True,
-            'created_payments': created_payments,
-            'message': f'{created_payments} mensalidades geradas para {month:02d}/{year}'
+            'message': f'Faturamento de {month:02d}/{year} iniciado'
         })
 
+        response = jsonify(progress)
+        response.headers['Location'] = url_for('admin.billing_run_progress', run_id=run.id)
+        return response, 202
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Error generating payments: {e}')
         return jsonify({'error': 'Erro ao gerar mensalidades'}), 500
 
+@admin.route('/billing-runs', methods=['POST'])
+@login_required
+def start_billing_run():
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    from billing_service import BillingService
+
+    data = request.get_json() or {}
+    try:
+        month = int(data.get('month', datetime.now().month))
+        year = int(data.get('year', datetime.now().year))
+        date(year, month, 1)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Mês ou ano inválido'}), 400
+
+    run = BillingService.start_run(year, month, user_id=current_user.id)
+    return jsonify(BillingService.run_progress(run)), 201
+
+@admin.route('/billing-runs/<int:run_id>')
+@login_required
+def billing_run_progress(run_id):
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    from billing_service import BillingService
+    from models import BillingRun
+
+    run = BillingRun.query.get_or_404(run_id)
+    return jsonify(BillingService.run_progress(run))
+
+@admin.route('/billing-runs/<int:run_id>/advance', methods=['POST'])
+@login_required
+def advance_billing_run(run_id):
+    if current_user.user_type not in ['admin', 'secretary']:
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    from billing_service import BillingService
+    from models import BillingRun
+
+    run = BillingRun.query.get_or_404(run_id)
+    if run.status == 'failed':
+        return jsonify(BillingService.run_progress(run)), 409
+
+    try:
+        BillingService.process_chunk(run)
+    except Exception as e:
+        current_app.logger.error(f'Error processing billing run {run_id}: {e}')
+        return jsonify(BillingService.run_progress(run)), 500
+
+    return jsonify(BillingService.run_progress(run))
+
 
 @admin.route('/payment/<int:payment_id>/status')
 @login_required
@@ -1917,18 +2005,29 @@ def schedule_experimental_class(class_id):
         flash('Data é obrigatória.', 'danger')
         return redirect(url_for('admin.experimental_classes'))
 
-    exp_class.scheduled_date = datetime.strptime(scheduled_date, '%Y-%m-%dT%H:%M')
-    exp_class.teacher_id = int(teacher_id) if teacher_id else None
-    exp_class.room_id = int(room_id) if room_id else None
-    exp_class.status = 'scheduled'
+    scheduled_date = datetime.strptime(scheduled_date, '%Y-%m-%dT%H:%M')
+    teacher_id = int(teacher_id) if teacher_id else None
+    room_id = int(room_id) if room_id else None
+
+    lock_resources(teacher_id, room_id)
+    conflicts, other_classes = experimental_class_conflicts(exp_class, teacher_id, room_id, scheduled_date)
+    if conflicts or other_classes:
+        for message in describe_conflicts(conflicts):
+            flash(message, 'danger')
+        for other in other_classes:
+            flash(f'Já existe uma aula experimental ({other.name}) às '
+                  f'{other.scheduled_date.strftime("%H:%M")} com o mesmo professor ou sala.', 'danger')
+        return redirect(url_for('admin.experimental_classes'))
 
-    db.session.commit()
+    exp_class.scheduled_date = scheduled_date
+    exp_class.teacher_id = teacher_id
+    exp_class.room_id = room_id
+    exp_class.status = 'scheduled'
 
-    # Enviar email de confirmação
-    try:
-        send_email(
-            subject='Aula Experimental Agendada - Sol Maior',
-            body=f'''
+    # Email de confirmação enviado pela outbox junto com o agendamento
+    OutboxService.enqueue_email(
+        subject='Aula Experimental Agendada - Sol Maior',
+        body=f'''
             Olá {exp_class.name},
 
             Sua aula experimental foi agendada para:
@@ -1937,10 +2036,10 @@ def schedule_experimental_class(class_id):
 
             Aguardamos você!
             ''',
-            recipients=[exp_class.email]
-        )
-    except Exception as e:
-        current_app.logger.error(f'Error sending email: {e}')
+        recipients=[exp_class.email]
+    )
+
+    db.session.commit()
 
     flash('Aula experimental agendada com sucesso!', 'success')
     return redirect(url_for('admin.experimental_classes'))
@@ -1962,56 +2061,42 @@ def export_report(report_type):
         flash('Acesso negado.', 'danger')
         return redirect(url_for('main.index'))
 
-    try:
-        import csv
-        from io import StringIO
-        from flask import make_response
-
-        output = StringIO()
-
-        if report_type == 'students':
-            writer = csv.writer(output)
-            writer.writerow(['Nome', 'Email', 'Telefone', 'Data Nascimento', 'Status'])
-
-            students = db.session.query(Student, User).join(User).all()
-            for student, user in students:
-                writer.writerow([
-                    user.full_name,
-                    user.email,
-                    user.phone or '',
-                    student.birth_date.strftime('%d/%m/%Y') if student.birth_date else '',
-                    'Ativo' if user.is_active else 'Inativo'
-                ])
-
-        elif report_type == 'payments':
-            writer = csv.writer(output)
-            writer.writerow(['Aluno', 'Valor', 'Vencimento', 'Status', 'Mês Referência'])
-
-            payments = db.session.query(Payment, Student, User).join(
-                Student, Payment.student_id == Student.id
-            ).join(User, Student.user_id == User.id).all()
-
-            for payment, student, user in payments:
-                writer.writerow([
-                    user.full_name,
-                    f'R$ {payment.amount:.2f}',
-                    payment.due_date.strftime('%d/%m/%Y'),
-                    payment.status,
-                    payment.reference_month.strftime('%m/%Y')
-                ])
-
-        output.seek(0)
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename={report_type}.csv'
-
-        return response
+    from flask import Response, stream_with_context
+    from csv_export import CSVExporter
 
-    except Exception as e:
-        current_app.logger.error(f'Export error: {e}')
-        flash('Erro ao exportar relatório.', 'danger')
+    if report_type not in CSVExporter.available_reports():
+        flash('Relatório não encontrado.', 'danger')
         return redirect(url_for('admin.reports'))
 
+    # Resposta em streaming: as linhas são lidas e enviadas em lotes
+    response = Response(stream_with_context(CSVExporter.generate(report_type)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={report_type}.csv'
+    return response
+
+@admin.route('/audit-logs')
+@login_required
+def audit_logs():
+    if current_user.user_type != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        entries, next_cursor = AuditLogger.query_logs(
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            user_id=request.args.get('user_id', type=int),
+            action=request.args.get('action') or None,
+            entity_type=request.args.get('entity_type') or None,
+            entity_id=request.args.get('entity_id') or None,
+            limit=max(1, min(request.args.get('limit', 100, type=int), 500)),
+            cursor=request.args.get('cursor') or None
+        )
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos'}), 400
+
+    return jsonify({'entries': entries, 'next_cursor': next_cursor})
+
 # News management routes
 @admin.route('/news')
 @login_required
@@ -2055,6 +2140,7 @@ def news_add():
 
         db.session.add(news_article)
         db.session.commit()
+        invalidate_public_pages()
 
         flash('Notícia criada com sucesso!', 'success')
         return redirect(url_for('admin.news_list'))
@@ -2082,6 +2168,7 @@ def news_edit(news_id):
         news_article.updated_at = datetime.utcnow()
 
         db.session.commit()
+        invalidate_public_pages()
 
         flash('Notícia atualizada com sucesso!', 'success')
         return redirect(url_for('admin.news_list'))
@@ -2099,6 +2186,7 @@ def news_delete(news_id):
 
     db.session.delete(news_article)
     db.session.commit()
+    invalidate_public_pages()
 
     flash('Notícia excluída com sucesso!', 'success')
     return redirect(url_for('admin.news_list'))
@@ -2127,7 +2215,7 @@ def create_payment(payment_id):
 
     # Verificar se o usuário pode acessar este pagamento
     if current_user.user_type == 'student':
-        student = Student.query.filter_by(user_id=current_user.id).first()
+        student = current_student()
         if not student or payment.student_id != student.id:
             flash('Acesso negado.', 'danger')
             return redirect(url_for('main.index'))
@@ -2275,13 +2363,13 @@ def payment_webhook():
                     transaction.payment.payment_date = date.today()
                     transaction.payment.payment_method = 'Mercado Pago'
 
-                    # Enviar notificação por email
+                    # Notificação por email gravada na outbox (mesma transação)
                     try:
-                        student = Student.query.get(transaction.payment.student_id)
-                        send_email(
+                        student_user = transaction.payment.student.user
+                        OutboxService.enqueue_email(
                             subject='Pagamento Aprovado - Escola Sol Maior',
                             body=f'''
-                            Olá {student.name},
+                            Olá {student_user.full_name},
 
                             Seu pagamento foi aprovado com sucesso!
 
@@ -2291,10 +2379,10 @@ def payment_webhook():
 
                             Obrigado por escolher a Escola Sol Maior!
                             ''',
-                            recipients=[student.email]
+                            recipients=[student_user.email]
                         )
                     except Exception as e:
-                        current_app.logger.error(f'Erro ao enviar email de confirmação: {e}')
+                        current_app.logger.error(f'Erro ao registrar email de confirmação: {e}')
 
                 db.session.commit()
                 current_app.logger.info(f"Transação atualizada: {transaction.id}")
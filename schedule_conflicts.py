@@ -0,0 +1,294 @@
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import event, or_, select
+from app import db
+from models import Course, ExperimentalClass, Room, Schedule, TableVersion, Teacher, User
+from table_versions import on_commit
+
+# Detecção de conflitos da grade semanal: uma sala ou um professor não pode
+# ter dois horários ativos que se sobreponham no mesmo dia da semana. Cada
+# par (sala, dia) e (professor, dia) tem uma lista de intervalos ordenada
+# pelo início, com o maior término acumulado ao lado; a consulta é um
+# bisect até o último intervalo que começa antes do fim do novo horário e
+# volta só enquanto algum anterior ainda termina depois do início dele.
+#
+# O índice é carregado da tabela schedules e atualizado ao fim de cada
+# commit deste processo (hook on_commit de table_versions), só com os
+# horários alterados. Antes de cada verificação a versão de schedules
+# (table_versions.py) é lida direto do banco: se outro processo alterou a
+# grade, o índice é recarregado.
+#
+# Quem grava um horário chama lock_resources() antes de verificar: as
+# linhas do professor e da sala ficam travadas até o commit, e uma segunda
+# gravação para o mesmo recurso só verifica depois que a primeira terminou
+# (e já enxerga a versão nova de schedules). No SQLite, usado só em
+# desenvolvimento, FOR UPDATE não existe e a trava não vale.
+#
+# Custos: as listas são por (recurso, dia), com poucas dezenas de horários
+# cada. Incluir ou remover um horário é O(k) no tamanho da lista (o maior
+# término acumulado é recalculado dali em diante), e uma consulta é
+# O(log k) mais os intervalos percorridos para trás, que podem ser todos
+# quando um horário longo cobre o dia. Para listas desse tamanho isso
+# basta; não é uma árvore de intervalos com O(log n) garantido.
+
+DAY_NAMES = ['segunda-feira', 'terça-feira', 'quarta-feira', 'quinta-feira', 'sexta-feira', 'sábado', 'domingo']
+
+Slot = namedtuple('Slot', 'teacher_id room_id day_of_week start_time end_time')
+Conflict = namedtuple('Conflict', 'resource resource_id schedule_id day_of_week start end other_slot',
+                      defaults=(None,))
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+def _clock(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+class IntervalList:
+    """Intervalos (início, fim, id) em minutos, ordenados pelo início"""
+
+    def __init__(self):
+        self.items = []
+        self.max_ends = []   # max_ends[i]: maior fim entre items[0..i]
+
+    def _reindex(self, position):
+        running = self.max_ends[position - 1] if position > 0 else -1
+        del self.max_ends[position:]
+        for start, end, ref_id in self.items[position:]:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def add(self, item):
+        position = bisect_left(self.items, item)
+        self.items.insert(position, item)
+        self._reindex(position)
+
+    def remove(self, item):
+        position = bisect_left(self.items, item)
+        if position < len(self.items) and self.items[position] == item:
+            del self.items[position]
+            self._reindex(position)
+
+    def overlapping(self, start, end):
+        """Intervalos que se sobrepõem a [start, end)"""
+        found = []
+        position = bisect_left(self.items, (end,)) - 1
+        while position >= 0 and self.max_ends[position] > start:
+            item = self.items[position]
+            if item[1] > start:
+                found.append(item)
+            position -= 1
+        return found
+
+class ScheduleIndex:
+    def __init__(self):
+        self.lists = {}     # ('room' | 'teacher', id, dia) -> IntervalList
+        self.slots = {}     # schedule_id -> Slot (em minutos)
+        self.version = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _keys(slot):
+        return (('teacher', slot.teacher_id, slot.day_of_week), ('room', slot.room_id, slot.day_of_week))
+
+    def _add(self, schedule_id, slot):
+        self.slots[schedule_id] = slot
+        for key in self._keys(slot):
+            self.lists.setdefault(key, IntervalList()).add((slot.start_time, slot.end_time, schedule_id))
+
+    def _remove(self, schedule_id):
+        slot = self.slots.pop(schedule_id, None)
+        if slot is None:
+            return
+        for key in self._keys(slot):
+            self.lists[key].remove((slot.start_time, slot.end_time, schedule_id))
+
+    def load(self, rows, version):
+        with self.lock:
+            self.lists, self.slots = {}, {}
+            for schedule_id, teacher_id, room_id, day, start, end, active in rows:
+                self._add(schedule_id, Slot(teacher_id, room_id, day, _minutes(start), _minutes(end)))
+            self.version = version
+
+    def apply_commit(self, rows, version):
+        """
+        Aplica as linhas (id, professor, sala, dia, início, fim, ativo) de um
+        commit deste processo que levou schedules à `version`. A versão do
+        índice só avança se ele estava exatamente na anterior; se outro
+        commit entrou no meio (ou a versão não foi gravada), fica para trás e
+        a próxima verificação recarrega.
+        """
+        with self.lock:
+            if self.version is None:
+                return
+            for schedule_id, teacher_id, room_id, day, start, end, active in rows:
+                self._remove(schedule_id)
+                if active:
+                    self._add(schedule_id, Slot(teacher_id, room_id, day, _minutes(start), _minutes(end)))
+            if version is not None and self.version == version - 1:
+                self.version = version
+
+    def overlapping(self, slot, exclude=()):
+        """Conflitos do horário (em minutos) com a grade, ignorando os ids de `exclude`"""
+        conflicts = []
+        with self.lock:
+            for resource, resource_id, day in self._keys(slot):
+                intervals = self.lists.get((resource, resource_id, day))
+                if resource_id is None or intervals is None:
+                    continue
+                for start, end, schedule_id in intervals.overlapping(slot.start_time, slot.end_time):
+                    if schedule_id not in exclude:
+                        conflicts.append(Conflict(resource, resource_id, schedule_id, day, start, end))
+        return conflicts
+
+_index = ScheduleIndex()
+
+def _schedule_rows(*where):
+    query = select(Schedule.id, Schedule.teacher_id, Schedule.room_id, Schedule.day_of_week,
+                   Schedule.start_time, Schedule.end_time, Schedule.is_active)
+    return db.session.execute(query.where(*where)).all()
+
+def _schedules_version(connection):
+    return connection.execute(
+        select(TableVersion.version).where(TableVersion.table_name == Schedule.__tablename__)
+    ).scalar() or 0
+
+def _current_index():
+    # Versão lida na hora (não a do cache de table_versions): uma verificação
+    # não pode deixar passar um horário gravado por outro processo
+    version = _schedules_version(db.session)
+    if _index.version is None or version > _index.version:
+        _index.load(_schedule_rows(Schedule.is_active == True), version)
+    return _index
+
+def lock_resources(teacher_id, room_id):
+    """
+    Trava as linhas do professor e da sala (SELECT ... FOR UPDATE) até o fim
+    da transação que vai gravar o horário. Sempre professor antes de sala,
+    para duas gravações não se travarem mutuamente.
+    """
+    if teacher_id is not None:
+        db.session.execute(select(Teacher.id).where(Teacher.id == teacher_id).with_for_update())
+    if room_id is not None:
+        db.session.execute(select(Room.id).where(Room.id == room_id).with_for_update())
+
+def _slot(teacher_id, room_id, day_of_week, start_time, end_time):
+    return Slot(teacher_id, room_id, day_of_week, _minutes(start_time), _minutes(end_time))
+
+def schedule_conflicts(teacher_id, room_id, day_of_week, start_time, end_time, exclude_id=None):
+    """Horários ativos que ocupam o professor ou a sala no mesmo dia e período"""
+    slot = _slot(teacher_id, room_id, day_of_week, start_time, end_time)
+    return _current_index().overlapping(slot, exclude={exclude_id})
+
+def find_conflicts(slots, exclude_ids=()):
+    """
+    Verifica uma grade inteira de uma vez (edição em lote). `slots` é uma
+    lista de Slot com horários datetime.time; `exclude_ids` são os horários
+    que a nova grade substitui. Retorna {posição: [Conflict]} com os
+    conflitos contra a grade atual e contra os slots anteriores da lista
+    (schedule_id None e other_slot com a posição do outro).
+    """
+    index = _current_index()
+    exclude = set(exclude_ids)
+    proposed = ScheduleIndex()
+    found = {}
+    for position, slot in enumerate(slots):
+        slot = _slot(*slot)
+        conflicts = index.overlapping(slot, exclude)
+        conflicts += [conflict._replace(schedule_id=None, other_slot=conflict.schedule_id)
+                      for conflict in proposed.overlapping(slot)]
+        if conflicts:
+            found[position] = conflicts
+        proposed._add(position, slot)
+    return found
+
+def experimental_class_conflicts(exp_class, teacher_id, room_id, scheduled_date):
+    """
+    Conflitos de uma aula experimental: a grade semanal no dia da semana da
+    data e as outras aulas experimentais agendadas para o mesmo professor
+    ou sala no mesmo dia. Retorna (conflitos da grade, aulas experimentais).
+    """
+    duration = timedelta(minutes=current_app.config.get('EXPERIMENTAL_CLASS_MINUTES', 60))
+    end = scheduled_date + duration
+    if end.date() != scheduled_date.date():
+        end = scheduled_date.replace(hour=23, minute=59)
+
+    conflicts = schedule_conflicts(teacher_id, room_id, scheduled_date.weekday(),
+                                   scheduled_date.time(), end.time())
+
+    # Poucas por dia: uma consulta pelo dia basta
+    same_resource = []
+    if teacher_id is not None:
+        same_resource.append(ExperimentalClass.teacher_id == teacher_id)
+    if room_id is not None:
+        same_resource.append(ExperimentalClass.room_id == room_id)
+    others = []
+    if same_resource:
+        day_start = scheduled_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        others = ExperimentalClass.query.filter(
+            ExperimentalClass.id != exp_class.id,
+            ExperimentalClass.status == 'scheduled',
+            ExperimentalClass.scheduled_date >= day_start,
+            ExperimentalClass.scheduled_date < day_start + timedelta(days=1),
+            or_(*same_resource),
+        ).all()
+    others = [other for other in others
+              if other.scheduled_date < end and other.scheduled_date + duration > scheduled_date]
+    return conflicts, others
+
+def describe_conflicts(conflicts):
+    """Mensagens para o usuário, uma por conflito com a grade"""
+    ids = {conflict.schedule_id for conflict in conflicts if conflict.schedule_id is not None}
+    names = {}
+    if ids:
+        query = select(Schedule.id, Course.name, Room.name, User.full_name).join(
+            Course, Schedule.course_id == Course.id
+        ).join(
+            Room, Schedule.room_id == Room.id
+        ).join(
+            Teacher, Schedule.teacher_id == Teacher.id
+        ).join(
+            User, Teacher.user_id == User.id
+        ).where(Schedule.id.in_(ids))
+        names = {row[0]: row[1:] for row in db.session.execute(query)}
+
+    messages = []
+    for conflict in conflicts:
+        course, room, teacher = names.get(conflict.schedule_id, ('outro horário da lista', 'escolhida', 'escolhido'))
+        period = (f'na {DAY_NAMES[conflict.day_of_week]} das {_clock(conflict.start)} '
+                  f'às {_clock(conflict.end)} ({course})')
+        if conflict.resource == 'room':
+            messages.append(f'A sala {room} já está ocupada {period}.')
+        else:
+            messages.append(f'O professor {teacher} já tem aula {period}.')
+    return messages
+
+def _schedule_row(schedule):
+    return (schedule.id, schedule.teacher_id, schedule.room_id, schedule.day_of_week,
+            schedule.start_time, schedule.end_time, schedule.is_active)
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Schedule):
+            # Removidos entram como inativos; vale a última versão do horário
+            row = _schedule_row(obj)
+            if obj in session.deleted:
+                row = row[:-1] + (False,)
+            session.info.setdefault('schedule_conflicts', {})[obj.id] = row
+
+def _after_commit(session, versions):
+    # Hook de table_versions: `versions` traz a versão de schedules gravada por este commit
+    changes = session.info.pop('schedule_conflicts', None)
+    if changes:
+        _index.apply_commit(changes.values(), versions.get(Schedule.__tablename__))
+
+def _after_rollback(session):
+    session.info.pop('schedule_conflicts', None)
+
+def register_schedule_conflicts(app):
+    on_commit(_after_commit)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_rollback', _after_rollback)
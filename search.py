@@ -0,0 +1,247 @@
+import logging
+import re
+from collections import namedtuple
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, select, text
+from app import db
+from models import Course, News, Student, Teacher, User
+from utils import fold_text
+
+# Busca textual do painel administrativo sobre pessoas (nome, e-mail,
+# telefone), cursos (nome, instrumento) e notícias (título, conteúdo). O
+# índice invertido fica no próprio banco: tabela virtual FTS5 no SQLite,
+# coluna tsvector com índice GIN no PostgreSQL. Os documentos são gravados
+# no mesmo flush das alterações em User, Course e News; operações em massa
+# que não passam pelo ORM não atualizam o índice, `flask rebuild-search-index`
+# recria tudo.
+#
+# Acentos e maiúsculas não importam ("joao" encontra "João") e cada termo
+# vale como prefixo ("silv" encontra "Silva"); todos os termos precisam
+# aparecer no documento. Cada documento tem um id fixo derivado da origem
+# (id * 4 + código do tipo), então atualizar ou remover é uma busca pela
+# chave, sem varrer o índice.
+
+MAX_TERMS = 8
+SNIPPET_WIDTH = 160
+REBUILD_BATCH = 1000
+
+SearchResult = namedtuple('SearchResult', 'kind id title snippet')
+
+def _user_document(user):
+    digits = ''.join(filter(str.isdigit, user.phone or ''))
+    return user.full_name, ' '.join(filter(None, [user.email, user.phone, digits]))
+
+def _course_document(course):
+    return course.name, course.instrument or ''
+
+def _news_document(news):
+    return news.title, news.content or ''
+
+# tipo: (modelo, código no id do documento, campos indexados, (título, corpo))
+SOURCES = {
+    'user': (User, 1, ('full_name', 'email', 'phone'), _user_document),
+    'course': (Course, 2, ('name', 'instrument'), _course_document),
+    'news': (News, 3, ('title', 'content'), _news_document),
+}
+
+SCHEMA = {
+    'sqlite': (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "kind UNINDEXED, ref_id UNINDEXED, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    ),
+    'postgresql': (
+        'CREATE TABLE IF NOT EXISTS search_index ('
+        ' doc_id BIGINT PRIMARY KEY, kind VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL,'
+        ' title TEXT NOT NULL, body TEXT NOT NULL, document TSVECTOR NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)',
+    ),
+}
+
+STATEMENTS = {
+    'sqlite': {
+        'delete': 'DELETE FROM search_index WHERE rowid = :doc_id',
+        'insert': 'INSERT INTO search_index (rowid, kind, ref_id, title, body) '
+                  'VALUES (:doc_id, :kind, :ref_id, :title, :body)',
+        # bm25: menor é melhor; o título pesa 10x o corpo
+        'search': 'SELECT kind, ref_id, title, body FROM search_index WHERE search_index MATCH :query '
+                  'ORDER BY bm25(search_index, 0, 0, 10.0, 1.0) LIMIT :limit',
+    },
+    'postgresql': {
+        'delete': 'DELETE FROM search_index WHERE doc_id = :doc_id',
+        # O tsvector é montado do texto já sem acentos (config 'simple', sem stemming)
+        'insert': "INSERT INTO search_index (doc_id, kind, ref_id, title, body, document) "
+                  "VALUES (:doc_id, :kind, :ref_id, :title, :body, "
+                  "setweight(to_tsvector('simple', :title_terms), 'A') || "
+                  "setweight(to_tsvector('simple', :body_terms), 'B'))",
+        'search': "SELECT kind, ref_id, title, body FROM search_index, to_tsquery('simple', :query) AS query "
+                  "WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT :limit",
+    },
+}
+
+def _doc_id(code, ref_id):
+    return ref_id * 4 + code
+
+def search_terms(value):
+    """Palavras da busca, sem acentos e em minúsculas"""
+    return re.findall(r'[^\W_]+', fold_text(value))[:MAX_TERMS]
+
+def _match_expression(dialect, terms):
+    if dialect == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+def highlight(value, terms, width=None):
+    """
+    Trecho de `value` em torno da primeira ocorrência dos termos, com as
+    palavras encontradas em <mark>. A comparação é feita no texto sem
+    acentos, que tem o mesmo tamanho, e o trecho sai do texto original.
+    """
+    value = value or ''
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*')
+    matches = list(pattern.finditer(fold_text(value)))
+
+    start, end = 0, len(value)
+    if width is not None and len(value) > width:
+        if matches:
+            start = max(0, matches[0].start() - width // 4)
+            # Começa no início de uma palavra
+            while 0 < start < matches[0].start() and not value[start - 1].isspace():
+                start += 1
+        end = min(len(value), start + width)
+
+    parts = [Markup('…') if start > 0 else Markup('')]
+    position = start
+    for match in matches:
+        if match.start() < start:
+            continue
+        if match.end() > end:
+            break
+        parts.append(escape(value[position:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % value[match.start():match.end()])
+        position = match.end()
+    parts.append(escape(value[position:end]))
+    if end < len(value):
+        parts.append(Markup('…'))
+    return Markup('').join(parts)
+
+class SearchIndex:
+
+    @staticmethod
+    def _documents(kind, items):
+        model, code, fields, document = SOURCES[kind]
+        params = []
+        for item in items:
+            title, body = document(item)
+            params.append({
+                'doc_id': _doc_id(code, item.id), 'kind': kind, 'ref_id': item.id,
+                'title': title or '', 'body': body or '',
+                'title_terms': fold_text(title), 'body_terms': fold_text(body),
+            })
+        return params
+
+    @staticmethod
+    def write(connection, documents, removed=()):
+        """Substitui os documentos informados e remove os ids de `removed`"""
+        statements = STATEMENTS.get(connection.dialect.name)
+        if statements is None:
+            return
+
+        doc_ids = [{'doc_id': doc_id} for doc_id in removed]
+        doc_ids += [{'doc_id': params['doc_id']} for params in documents]
+        if doc_ids:
+            connection.execute(text(statements['delete']), doc_ids)
+        if documents:
+            connection.execute(text(statements['insert']), documents)
+
+    @staticmethod
+    def _changed(obj, fields):
+        state = inspect(obj)
+        return any(state.attrs[field].history.has_changes() for field in fields)
+
+    @staticmethod
+    def _after_flush(session, flush_context):
+        documents, removed = [], []
+        for kind, (model, code, fields, document) in SOURCES.items():
+            changed = [obj for obj in session.new if isinstance(obj, model)]
+            changed += [obj for obj in session.dirty
+                        if isinstance(obj, model) and SearchIndex._changed(obj, fields)]
+            documents += SearchIndex._documents(kind, changed)
+            removed += [_doc_id(code, obj.id) for obj in session.deleted if isinstance(obj, model)]
+
+        if documents or removed:
+            SearchIndex.write(session.connection(), documents, removed)
+
+    @staticmethod
+    def create(connection):
+        """Cria a tabela do índice para o banco em uso"""
+        schema = SCHEMA.get(connection.dialect.name)
+        if schema is None:
+            logging.warning(f'Busca textual indisponível para o banco {connection.dialect.name}')
+            return
+        for ddl in schema:
+            connection.execute(text(ddl))
+
+    @staticmethod
+    def rebuild(connection=None):
+        """Recria todos os documentos a partir de users, courses e news"""
+        connection = connection or db.session.connection()
+        if connection.dialect.name not in STATEMENTS:
+            return
+
+        insert = text(STATEMENTS[connection.dialect.name]['insert'])
+        connection.execute(text('DELETE FROM search_index'))
+        for kind, (model, code, fields, document) in SOURCES.items():
+            query = select(model.id, *(getattr(model, field) for field in fields))
+            for rows in connection.execute(query).partitions(REBUILD_BATCH):
+                connection.execute(insert, SearchIndex._documents(kind, rows))
+
+    @staticmethod
+    def search(value, limit=20):
+        """
+        Documentos mais relevantes para a busca, como SearchResult. Pessoas
+        saem como 'student' ou 'teacher' (com o id do aluno/professor) ou
+        'user' (administração e secretaria).
+        """
+        terms = search_terms(value)
+        connection = db.session.connection()
+        statements = STATEMENTS.get(connection.dialect.name)
+        if not terms or statements is None:
+            return []
+
+        rows = connection.execute(text(statements['search']), {
+            'query': _match_expression(connection.dialect.name, terms), 'limit': limit
+        }).all()
+
+        people = {}
+        user_ids = [row.ref_id for row in rows if row.kind == 'user']
+        if user_ids:
+            query = select(User.id, Student.id, Teacher.id).outerjoin(
+                Student, Student.user_id == User.id
+            ).outerjoin(
+                Teacher, Teacher.user_id == User.id
+            ).where(User.id.in_(user_ids))
+            for user_id, student_id, teacher_id in db.session.execute(query):
+                if student_id:
+                    people[user_id] = ('student', student_id)
+                elif teacher_id:
+                    people[user_id] = ('teacher', teacher_id)
+                else:
+                    people[user_id] = ('user', user_id)
+
+        results = []
+        for row in rows:
+            kind, ref_id = row.kind, row.ref_id
+            if kind == 'user':
+                if ref_id not in people:
+                    continue
+                kind, ref_id = people[ref_id]
+            results.append(SearchResult(kind, ref_id, highlight(row.title, terms),
+                                        highlight(row.body, terms, SNIPPET_WIDTH)))
+        return results
+
+def register_search(app):
+    """Liga a atualização do índice de busca aos flushes da sessão"""
+    if event.contains(db.session, 'after_flush', SearchIndex._after_flush):
+        return
+    event.listen(db.session, 'after_flush', SearchIndex._after_flush)
@@ -0,0 +1,171 @@
+from collections import namedtuple
+from sqlalchemy import func
+from app import db
+from models import User, Student, Teacher, Course, Enrollment, Payment
+
+# Serializadores das respostas da API. Cada recurso declara seus campos uma
+# vez (nome, coluna e conversão); a partir deles são gerados a consulta só
+# com as colunas pedidas (linhas simples, sem objetos do ORM nem identity
+# map) e uma função linha -> dict compilada para cada conjunto de campos.
+# O parâmetro ?fields=id,name restringe os campos e também o SELECT.
+
+RESOURCES = {}
+
+Field = namedtuple('Field', 'name column kind')
+
+def field(name, column, kind=None):
+    """kind: None (valor como está), 'date' (isoformat) ou 'money' (float)"""
+    return Field(name, column, kind)
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _money(value):
+    return float(value) if value is not None else None
+
+CONVERTERS = {'date': '_iso', 'money': '_money'}
+
+def _compile(names, kinds):
+    """Função que monta o dict direto pelos índices da linha, sem laço por campo"""
+    items = []
+    for index, (name, kind) in enumerate(zip(names, kinds)):
+        value = f'row[{index}]'
+        if kind:
+            value = f'{CONVERTERS[kind]}({value})'
+        items.append(f'{name!r}: {value}')
+
+    source = f"def serialize(row):\n    return {{{', '.join(items)}}}\n"
+    namespace = {'_iso': _iso, '_money': _money}
+    exec(compile(source, '<serializer>', 'exec'), namespace)
+    return namespace['serialize']
+
+class Resource:
+    def __init__(self, name, fields, select_from, joins=(), keys=('id',), default=None):
+        """
+        select_from/joins: tabela base e (alvo, condição) dos joins.
+        keys: campos sempre selecionados (ordenação, cursor, agrupamento),
+        mesmo quando não fazem parte da resposta.
+        default: campos da resposta quando ?fields não é informado.
+        """
+        self.name = name
+        self.fields = {f.name: f for f in fields}
+        self.select_from = select_from
+        self.joins = joins
+        self.keys = keys
+        self.default = tuple(default or self.fields)
+        self._serializers = {}
+        RESOURCES[name] = self
+
+    def parse_fields(self, value=None):
+        """
+        Campos pedidos em ?fields (separados por vírgula), sem repetição e na
+        ordem de declaração: permutações do mesmo pedido usam o mesmo
+        serializador, então o cache tem no máximo um por subconjunto de
+        campos. Levanta ValueError para campos desconhecidos.
+        """
+        if not value:
+            return self.default
+
+        requested = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = sorted(requested - self.fields.keys())
+        if unknown or not requested:
+            raise ValueError(f"Campos inválidos: {', '.join(unknown) or value}")
+        return tuple(name for name in self.fields if name in requested)
+
+    def query(self, fields=None):
+        """Consulta só com as colunas dos campos (e das chaves), rotuladas com o nome do campo"""
+        fields = fields or self.default
+        names = fields + tuple(key for key in self.keys if key not in fields)
+        query = db.session.query(*(self.fields[name].column.label(name) for name in names))
+        query = query.select_from(self.select_from)
+        for target, onclause in self.joins:
+            query = query.join(target, onclause)
+        return query
+
+    def serializer(self, fields=None):
+        fields = fields or self.default
+        serialize = self._serializers.get(fields)
+        if serialize is None:
+            serialize = _compile(fields, [self.fields[name].kind for name in fields])
+            self._serializers[fields] = serialize
+        return serialize
+
+    def dump(self, rows, fields=None):
+        serialize = self.serializer(fields)
+        return [serialize(row) for row in rows]
+
+STUDENT_FIELDS = [
+    field('id', Student.id),
+    field('name', User.full_name),
+    field('email', User.email),
+    field('phone', User.phone),
+    field('birth_date', Student.birth_date, 'date'),
+    field('registration_date', Student.registration_date, 'date'),
+    field('is_active', User._is_active),
+]
+STUDENT_JOINS = [(User, Student.user_id == User.id)]
+
+STUDENT = Resource('student', STUDENT_FIELDS, Student, STUDENT_JOINS)
+
+STUDENT_DETAIL = Resource('student_detail', STUDENT_FIELDS + [
+    field('address', Student.address),
+    field('emergency_contact', Student.emergency_contact),
+    field('emergency_phone', Student.emergency_phone),
+], Student, STUDENT_JOINS)
+
+STUDENT_ENROLLMENT = Resource('student_enrollment', [
+    field('id', Enrollment.id),
+    field('course_name', Course.name),
+    field('course_instrument', Course.instrument),
+    field('enrollment_date', Enrollment.enrollment_date, 'date'),
+    field('status', Enrollment.status),
+    field('monthly_payment', func.coalesce(Enrollment.monthly_payment, Course.monthly_price), 'money'),
+    field('student_id', Enrollment.student_id),
+], Enrollment, [(Course, Enrollment.course_id == Course.id)], keys=('student_id',),
+    default=('id', 'course_name', 'course_instrument', 'enrollment_date', 'status', 'monthly_payment'))
+
+STUDENT_PAYMENT = Resource('student_payment', [
+    field('id', Payment.id),
+    field('amount', Payment.amount, 'money'),
+    field('due_date', Payment.due_date, 'date'),
+    field('payment_date', Payment.payment_date, 'date'),
+    field('status', Payment.status),
+    field('reference_month', Payment.reference_month, 'date'),
+    field('student_id', Payment.student_id),
+], Payment, keys=('student_id',),
+    default=('id', 'amount', 'due_date', 'payment_date', 'status', 'reference_month'))
+
+PAYMENT = Resource('payment', [
+    field('id', Payment.id),
+    field('student_name', User.full_name),
+    field('student_email', User.email),
+    field('amount', Payment.amount, 'money'),
+    field('due_date', Payment.due_date, 'date'),
+    field('payment_date', Payment.payment_date, 'date'),
+    field('status', Payment.status),
+    field('payment_method', Payment.payment_method),
+    field('reference_month', Payment.reference_month, 'date'),
+], Payment, [(Student, Payment.student_id == Student.id), (User, Student.user_id == User.id)],
+    keys=('due_date', 'id'))
+
+TEACHER = Resource('teacher', [
+    field('id', Teacher.id),
+    field('name', User.full_name),
+    field('email', User.email),
+    field('phone', User.phone),
+    field('specialization', Teacher.specialization),
+    field('hourly_rate', Teacher.hourly_rate, 'money'),
+    field('hire_date', Teacher.hire_date, 'date'),
+    field('is_active', User._is_active),
+], Teacher, [(User, Teacher.user_id == User.id)])
+
+COURSE = Resource('course', [
+    field('id', Course.id),
+    field('name', Course.name),
+    field('description', Course.description),
+    field('instrument', Course.instrument),
+    field('level', Course.level),
+    field('monthly_price', Course.monthly_price, 'money'),
+    field('max_students', Course.max_students),
+    field('teacher_id', Course.teacher_id),
+], Course)
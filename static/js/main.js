@@ -14,6 +14,8 @@
         initializePopovers();
         initializeForms();
         initializeTableSearch();
+        initializeLoadMore();
+        initializeStudentLookup();
         initializeAnimations();
         initializeNotifications();
         initializePhoneMasks();
@@ -102,6 +104,100 @@
         });
     }
 
+    // Server-paginated lists: "Carregar mais" appends the next page of rows
+    function initializeLoadMore() {
+        document.querySelectorAll('[data-load-more]').forEach(function(button) {
+            button.addEventListener('click', function(event) {
+                event.preventDefault();
+                if (button.classList.contains('disabled')) {
+                    return;
+                }
+                button.classList.add('disabled');
+
+                fetch(button.getAttribute('data-load-more'), { headers: { 'Accept': 'application/json' } })
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error('HTTP ' + response.status);
+                        }
+                        return response.json();
+                    })
+                    .then(data => {
+                        document.querySelector(button.getAttribute('data-target')).insertAdjacentHTML('beforeend', data.html);
+
+                        if (!data.next_cursor) {
+                            button.remove();
+                            return;
+                        }
+                        ['data-load-more', 'href'].forEach(function(attribute) {
+                            const url = new URL(button.getAttribute(attribute), window.location.origin);
+                            url.searchParams.set('cursor', data.next_cursor);
+                            button.setAttribute(attribute, url.pathname + url.search);
+                        });
+                        button.classList.remove('disabled');
+                    })
+                    .catch(error => {
+                        console.error('Error:', error);
+                        // Falls back to the plain link (next page as a full reload)
+                        window.location.href = button.getAttribute('href');
+                    });
+            });
+        });
+    }
+
+    // Student pickers: options come from the lookup endpoint as the user types
+    function initializeStudentLookup() {
+        document.querySelectorAll('select[data-student-lookup]').forEach(function(select) {
+            const input = document.createElement('input');
+            input.type = 'search';
+            input.className = 'form-control mb-2';
+            input.placeholder = 'Digite o nome ou e-mail do aluno...';
+            input.autocomplete = 'off';
+            select.parentNode.insertBefore(input, select);
+
+            let timer = null;
+            let lastQuery = '';
+            input.addEventListener('input', function() {
+                clearTimeout(timer);
+                timer = setTimeout(function() {
+                    const query = input.value.trim();
+                    if (query.length < 2 || query === lastQuery) {
+                        return;
+                    }
+                    lastQuery = query;
+
+                    const url = new URL(select.getAttribute('data-student-lookup'), window.location.origin);
+                    url.searchParams.set('q', query);
+                    fetch(url.pathname + url.search, { headers: { 'Accept': 'application/json' } })
+                        .then(response => response.json())
+                        .then(data => {
+                            if (query !== lastQuery) {
+                                return;
+                            }
+                            // Keeps the placeholder and the current selection
+                            Array.from(select.options).forEach(function(option, index) {
+                                if (index > 0 && !option.selected) {
+                                    option.remove();
+                                }
+                            });
+                            (data.students || []).forEach(function(student) {
+                                if (String(student.id) === select.value) {
+                                    return;
+                                }
+                                const option = new Option(`${student.name} (${student.email})`, student.id);
+                                option.dataset.email = student.email || '';
+                                option.dataset.phone = student.phone || '';
+                                select.add(option);
+                            });
+                            if (!data.students || data.students.length === 0) {
+                                window.SolMaior.showToast('Nenhum aluno encontrado', 'info');
+                            }
+                        })
+                        .catch(error => console.error('Error:', error));
+                }, 200);
+            });
+        });
+    }
+
     // Animation utilities
     function initializeAnimations() {
         // Intersection Observer for scroll animations
@@ -0,0 +1,184 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import event, or_, select
+from app import db
+from models import Student, User
+from table_versions import on_commit, table_versions
+from utils import fold_text
+
+# Índice em memória para a busca de alunos ativos nos formulários (seleção
+# de aluno em pagamentos e matrículas). Cada palavra do nome e o e-mail,
+# sem acentos e em minúsculas, viram chaves de uma lista ordenada
+# (chave, id do aluno); a busca por prefixo é um bisect seguido de uma
+# leitura sequencial, sem consultar o banco.
+#
+# Alterações em User e Student feitas por este processo são aplicadas no
+# índice ao fim do commit (hook on_commit de table_versions), só para os
+# alunos afetados, com inserções e remoções por chave na própria lista
+# (sem copiá-la). As de outros processos aparecem nas versões das tabelas
+# (table_versions.py): se users ou students avançaram além dos commits
+# aplicados aqui, o índice é recarregado inteiro, no máximo uma vez a cada
+# STUDENT_LOOKUP_RELOAD_INTERVAL segundos; as alterações de outros workers
+# nesse intervalo entram juntas na recarga seguinte.
+
+WATCHED_TABLES = ('users', 'students')
+
+def _words(value):
+    return re.findall(r'[^\W_]+', fold_text(value))
+
+class StudentIndex:
+    def __init__(self):
+        self.keys = []      # [(chave, student_id)], ordenada
+        self.entries = {}   # student_id -> (nome, e-mail, telefone, palavras, chaves)
+        self.versions = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _entry(name, email, phone):
+        words = _words(name)
+        email = (email or '').lower()
+        keys = tuple(sorted(set(words + ([email] if email else []))))
+        return name, email, phone, words + [email], keys
+
+    @staticmethod
+    def _remove(keys, entries, student_id):
+        entry = entries.pop(student_id, None)
+        if entry is None:
+            return
+        for key in entry[4]:
+            position = bisect_left(keys, (key, student_id))
+            if position < len(keys) and keys[position] == (key, student_id):
+                del keys[position]
+
+    def apply_commit(self, rows, deleted, versions):
+        """
+        Aplica um commit deste processo: as linhas (student_id, nome, e-mail,
+        telefone, ativo) dos alunos alterados, os ids removidos e as versões
+        de users/students gravadas por ele. Cada chave é removida ou incluída
+        na lista ordenada sob a trava, que as buscas também usam. Cada versão só avança se o índice estava exatamente na anterior; se
+        outro commit entrou no meio, a próxima busca recarrega.
+        """
+        with self.lock:
+            if self.versions is None:
+                return
+            for student_id in deleted:
+                self._remove(self.keys, self.entries, student_id)
+            for student_id, name, email, phone, active in rows:
+                self._remove(self.keys, self.entries, student_id)
+                if active:
+                    entry = self._entry(name, email, phone)
+                    self.entries[student_id] = entry
+                    for key in entry[4]:
+                        insort(self.keys, (key, student_id))
+            self.versions = tuple(
+                committed if committed is not None and seen == committed - 1 else seen
+                for seen, committed in zip(self.versions, versions)
+            )
+
+    def load(self, rows, versions):
+        entries = {}
+        keys = []
+        for student_id, name, email, phone, active in rows:
+            entry = self._entry(name, email, phone)
+            entries[student_id] = entry
+            keys.extend((key, student_id) for key in entry[4])
+        keys.sort()
+        with self.lock:
+            self.entries, self.keys, self.versions = entries, keys, versions
+            self.loaded_at = time.monotonic()
+
+    def search(self, value, limit=10):
+        """[(student_id, nome, e-mail, telefone)] cujas palavras começam com os termos, por nome"""
+        # E-mail: prefixo do endereço inteiro
+        terms = [value.strip().lower()] if '@' in value else _words(value)
+        if not terms:
+            return []
+
+        found = []
+        with self.lock:
+            keys, entries = self.keys, self.entries
+
+            # Percorre só as chaves do termo com menos ocorrências; os demais são conferidos na entrada
+            ranges = [(bisect_left(keys, (term + '\uffff',)) - bisect_left(keys, (term,)), index)
+                      for index, term in enumerate(terms)]
+            _, lead_index = min(ranges)
+            lead = terms[lead_index]
+            others = terms[:lead_index] + terms[lead_index + 1:]
+
+            seen = set()
+            position = bisect_left(keys, (lead,))
+            while position < len(keys) and len(found) < limit:
+                key, student_id = keys[position]
+                if not key.startswith(lead):
+                    break
+                position += 1
+                entry = entries.get(student_id)
+                if entry is None or student_id in seen:
+                    continue
+                seen.add(student_id)
+                if all(any(word.startswith(term) for word in entry[3]) for term in others):
+                    found.append((student_id, entry[0], entry[1], entry[2]))
+
+        return sorted(found, key=lambda item: fold_text(item[1]))
+
+_index = StudentIndex()
+
+def _student_rows(*where, connection=None):
+    query = select(Student.id, User.full_name, User.email, User.phone, User._is_active).join(
+        User, Student.user_id == User.id
+    )
+    return (connection or db.session).execute(query.where(*where)).all()
+
+def _current_index():
+    versions = table_versions(*WATCHED_TABLES)
+    if _index.versions is None:
+        _index.load(_student_rows(User._is_active == True), versions)
+    elif any(current > seen for current, seen in zip(versions, _index.versions)):
+        # Alterações de outros processos: uma recarga por intervalo cobre todas
+        interval = current_app.config.get('STUDENT_LOOKUP_RELOAD_INTERVAL', 30)
+        if time.monotonic() - _index.loaded_at >= interval:
+            _index.load(_student_rows(User._is_active == True), versions)
+    return _index
+
+def lookup_students(value, limit=10):
+    """Alunos ativos cujo nome ou e-mail começa com os termos digitados"""
+    return _current_index().search(value, limit)
+
+def _after_flush(session, flush_context):
+    affected = session.info.setdefault('student_lookup', {'users': set(), 'students': set()})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            affected['users'].add(obj.id)
+        elif isinstance(obj, Student):
+            affected['students'].add(obj.id)
+            if obj in session.deleted:
+                affected.setdefault('deleted', set()).add(obj.id)
+
+def _after_commit(session, versions):
+    # Hook de table_versions: só as tabelas alteradas por este commit têm
+    # versão em `versions`; as outras não avançam
+    affected = session.info.pop('student_lookup', None)
+    if not affected or _index.versions is None or not set(WATCHED_TABLES) & set(versions):
+        return
+
+    rows = []
+    if affected['users'] or affected['students']:
+        # A sessão não executa SQL depois do commit: lê numa conexão própria
+        with db.engine.connect() as connection:
+            rows = _student_rows(
+                or_(User.id.in_(affected['users']), Student.id.in_(affected['students'])), connection=connection
+            )
+    _index.apply_commit(rows, affected.get('deleted', ()), tuple(versions.get(table) for table in WATCHED_TABLES))
+
+def _after_rollback(session):
+    session.info.pop('student_lookup', None)
+
+def register_student_lookup(app):
+    on_commit(_after_commit)
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_rollback', _after_rollback)
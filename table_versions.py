@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, make_response, request
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import TableVersion
+
+# Versão por tabela: cada transação que altera uma tabela incrementa a linha
+# dela em table_versions na própria transação, então dados e versão são
+# gravados juntos ou nenhum dos dois. O incremento é a última instrução
+# antes do COMMIT (depois do flush final), e a trava da linha dura só o
+# COMMIT, não as escritas da transação.
+#
+# Índices em memória que acompanham tabelas (student_lookup.py,
+# schedule_conflicts.py) se inscrevem com on_commit() e recebem, depois de
+# cada commit, as versões gravadas por ele.
+#
+# O ETag de um recurso da API é derivado das versões das tabelas que ele
+# lê; cada processo guarda as versões em memória e as relê no máximo a cada
+# TABLE_VERSION_REFRESH segundos, então um If-None-Match que ainda vale
+# custa só uma comparação.
+#
+# São contadas as alterações feitas pela sessão: objetos do flush e
+# INSERT/UPDATE/DELETE executados com db.session.execute().
+
+_versions = {}
+_versions_state = {'loaded_at': None}
+_versions_lock = threading.Lock()
+_commit_hooks = []
+
+def on_commit(hook):
+    """
+    Registra hook(session, versions), chamado depois de cada commit da
+    sessão com as versões gravadas por ele ({tabela: versão}, vazio se o
+    commit não alterou tabelas). Pode ser usado como decorator.
+    """
+    if hook not in _commit_hooks:
+        _commit_hooks.append(hook)
+    return hook
+
+def _refresh_versions():
+    refresh = current_app.config.get('TABLE_VERSION_REFRESH', 1)
+    loaded_at = _versions_state['loaded_at']
+    if loaded_at is not None and time.monotonic() - loaded_at < refresh:
+        return
+
+    rows = db.session.query(TableVersion.table_name, TableVersion.version).all()
+    with _versions_lock:
+        _versions.clear()
+        _versions.update(rows)
+        _versions_state['loaded_at'] = time.monotonic()
+
+def table_versions(*tables):
+    """Versões atuais das tabelas (0 para tabelas nunca alteradas)"""
+    _refresh_versions()
+    return tuple(_versions.get(table, 0) for table in tables)
+
+def _bump(connection, tables):
+    """Incrementa as versões das tabelas. Retorna {tabela: versão gravada}."""
+    table = TableVersion.__table__
+    dialect = connection.dialect.name
+    insert = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}.get(dialect)
+    rows = [{'table_name': name, 'version': 1} for name in sorted(tables)]
+
+    if insert is None:
+        for row in rows:
+            updated = connection.execute(
+                table.update().where(table.c.table_name == row['table_name']).values(version=table.c.version + 1)
+            )
+            if updated.rowcount == 0:
+                connection.execute(table.insert(), row)
+    else:
+        stmt = insert(table)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['table_name'], set_={'version': table.c.version + 1}
+        ), rows)
+
+    # As linhas continuam travadas por esta transação: os valores lidos são os gravados aqui
+    return dict(connection.execute(
+        select(table.c.table_name, table.c.version).where(table.c.table_name.in_(tables))
+    ).all())
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+def _after_flush(session, flush_context):
+    changed = _changed_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            changed.add(table.name)
+
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _changed_tables(orm_execute_state.session).add(table.name)
+
+def _before_commit(session):
+    # O commit ainda pode fazer um último flush; faz antes para contá-lo
+    session.flush()
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        # Um erro aqui faz o commit falhar: dados e versões voltam juntos
+        session.info['table_versions'] = _bump(session.connection(), changed)
+
+def _after_commit(session):
+    versions = session.info.pop('table_versions', None) or {}
+    if versions:
+        # Este processo vê a própria alteração na próxima requisição
+        _versions_state['loaded_at'] = None
+
+    for hook in _commit_hooks:
+        try:
+            hook(session, versions)
+        except Exception:
+            # O commit já foi feito; o índice do hook fica atrás e recarrega
+            logging.exception(f'Table version hook error in {hook.__module__}.{hook.__name__}')
+
+def _after_rollback(session):
+    session.info.pop('changed_tables', None)
+    session.info.pop('table_versions', None)
+
+def etag(*tables, vary=None):
+    """
+    ETag da view derivado da URL e das versões das tabelas lidas por ela
+    (e do valor de `vary()`, para respostas que dependem de algo além das
+    tabelas, como a data). Um If-None-Match igual ao ETag atual responde
+    304 sem executar a view.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = f'{request.full_path}:{table_versions(*tables)}'
+            if vary is not None:
+                key += f':{vary()}'
+            current = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+            # ETag fraco nas duas respostas: identifica a versão dos dados, não
+            # os bytes (com gzip o corpo muda e o middleware exigiria W/"...")
+            if request.if_none_match.contains_weak(current):
+                response = make_response('', 304)
+                response.set_etag(current, weak=True)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(current, weak=True)
+            return response
+        return decorated
+    return decorator
+
+def register_table_versions(app):
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'do_orm_execute', _do_orm_execute)
+        event.listen(db.session, 'before_commit', _before_commit)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
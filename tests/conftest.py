@@ -0,0 +1,121 @@
+"""
+Configuração comum dos testes: banco temporário e fábricas de registros.
+
+O banco é um SQLite num diretório temporário, definido em DATABASE_URL
+antes da coleta (os módulos de teste importam app, que lê a variável ao
+ser importado). TEST_DATABASE_URL troca o banco, por exemplo para rodar
+os testes num PostgreSQL de teste.
+
+Uso:
+    python -m pytest
+"""
+import itertools
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+import pytest
+
+def pytest_configure(config):
+    config.test_database_dir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(config.test_database_dir, 'test.db')
+    # Chave com o tamanho mínimo para HS256 (tokens da API)
+    os.environ.setdefault('SESSION_SECRET', 'chave-de-teste-com-32-bytes-ou-mais')
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config.test_database_dir, ignore_errors=True)
+
+@pytest.fixture(autouse=True)
+def app_context():
+    from app import app, db
+
+    app.config.update(MAIL_SUPPRESS_SEND=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        yield app
+        db.session.rollback()
+
+# ----------------------------------------------------------------------
+# Fábricas: cada chamada cria um registro novo (flush, sem commit)
+# ----------------------------------------------------------------------
+
+_ids = itertools.count(1)
+
+@pytest.fixture
+def make_user():
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from models import User
+
+    def make(user_type='student', active=True, password='x'):
+        number = next(_ids)
+        user = User(username=f'{user_type}{number}', email=f'{user_type}{number}@example.com',
+                    password_hash=generate_password_hash(password), user_type=user_type,
+                    full_name=f'Pessoa {number}', is_active=active)
+        db.session.add(user)
+        db.session.flush()
+        return user
+    return make
+
+@pytest.fixture
+def make_student(make_user):
+    from app import db
+    from models import Student
+
+    def make(active=True):
+        student = Student(user_id=make_user('student', active).id)
+        db.session.add(student)
+        db.session.flush()
+        return student
+    return make
+
+@pytest.fixture
+def make_teacher(make_user):
+    from app import db
+    from models import Teacher
+
+    def make():
+        teacher = Teacher(user_id=make_user('teacher').id)
+        db.session.add(teacher)
+        db.session.flush()
+        return teacher
+    return make
+
+@pytest.fixture
+def make_course(make_teacher):
+    from app import db
+    from models import Course
+
+    def make(active=True, teacher=None):
+        course = Course(name=f'Curso {next(_ids)}', monthly_price=200, max_students=50,
+                        teacher_id=(teacher or make_teacher()).id, is_active=active)
+        db.session.add(course)
+        db.session.flush()
+        return course
+    return make
+
+@pytest.fixture
+def make_room():
+    from app import db
+    from models import Room
+
+    def make():
+        room = Room(name=f'Sala {next(_ids)}')
+        db.session.add(room)
+        db.session.flush()
+        return room
+    return make
+
+@pytest.fixture
+def make_payment():
+    from app import db
+    from models import Payment
+
+    def make(student, status='pending', due_date=None):
+        payment = Payment(student_id=student.id, amount=100, status=status,
+                          due_date=due_date or date.today() + timedelta(days=30),
+                          reference_month=date(2000 + next(_ids) % 900, 1, 1))
+        db.session.add(payment)
+        db.session.flush()
+        return payment
+    return make
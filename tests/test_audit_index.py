@@ -0,0 +1,89 @@
+"""
+Índice dos logs de auditoria: filtros e paginação por cursor sobre os
+arquivos diários, e o índice continuando válido depois da compactação,
+do arquivamento mensal e da retenção (audit_rotation.py).
+"""
+import json
+import os
+from datetime import date
+import pytest
+from audit_index import AuditIndex
+from audit_rotation import AuditRotation
+
+DAYS = ['20260110', '20260120', '20260205', '20260215']
+
+@pytest.fixture
+def log_dir(tmp_path):
+    """Quatro dias de log, seis registros por dia, arquivos já ociosos"""
+    for day in DAYS:
+        with open(tmp_path / f'audit_{day}.log', 'w') as log_file:
+            for i in range(6):
+                log_file.write(json.dumps({
+                    'timestamp': f'{day}T10:00:0{i}', 'user_id': i % 3, 'action': 'update' if i % 2 else 'create',
+                    'entity_type': 'student', 'entity_id': i
+                }) + '\n')
+        os.utime(tmp_path / f'audit_{day}.log', (0, 0))
+    return str(tmp_path)
+
+def timestamps(entries):
+    return [entry['timestamp'] for entry in entries]
+
+def test_filters(log_dir):
+    index = AuditIndex(log_dir)
+
+    entries, cursor = index.query(user_id=1, action='update', limit=100)
+    assert cursor is None
+    assert timestamps(entries) == [f'{day}T10:00:01' for day in reversed(DAYS)]
+    assert all(entry['user_id'] == 1 and entry['action'] == 'update' for entry in entries)
+
+    entries, _ = index.query(start_date=date(2026, 2, 1), end_date=date(2026, 2, 5), entity_id=3, limit=100)
+    assert timestamps(entries) == ['20260205T10:00:03']
+
+def test_cursor_pagination_newest_first(log_dir):
+    index = AuditIndex(log_dir)
+    everything, _ = index.query(limit=100)
+    assert timestamps(everything) == sorted(timestamps(everything), reverse=True)
+
+    pages, cursor = [], None
+    while True:
+        entries, cursor = index.query(limit=5, cursor=cursor)
+        pages += entries
+        if cursor is None:
+            break
+    assert pages == everything
+
+def test_new_lines_are_indexed(log_dir):
+    index = AuditIndex(log_dir)
+    assert len(index.query(limit=100)[0]) == 24
+
+    with open(os.path.join(log_dir, 'audit_20260215.log'), 'a') as log_file:
+        log_file.write(json.dumps({'timestamp': '20260215T23:00:00', 'user_id': 9, 'action': 'delete'}) + '\n')
+    assert timestamps(index.query(user_id=9)[0]) == ['20260215T23:00:00']
+
+def test_rotation_keeps_results(log_dir):
+    index = AuditIndex(log_dir)
+    before, _ = index.query(limit=100)
+
+    today = date(2026, 4, 1)
+    AuditRotation.compress_closed_days(log_dir, today)
+    AuditRotation.archive_closed_months(log_dir, today)
+    assert sorted(os.listdir(log_dir)) == ['audit_202601.zip', 'audit_202602.zip', 'audit_index.sqlite3']
+
+    assert index.query(limit=100)[0] == before
+    # Um índice novo lê os mesmos registros direto dos arquivos mensais
+    index.rebuild()
+    assert index.query(limit=100)[0] == before
+
+def test_retention_keeps_archived_days(log_dir):
+    today = date(2026, 4, 1)
+    AuditRotation.compress_closed_days(log_dir, today)
+    AuditRotation.archive_closed_months(log_dir, today)
+    index = AuditIndex(log_dir)
+    index.query(limit=100)
+
+    # Limite em 10/02: janeiro inteiro expirou; fevereiro continua no arquivo mensal
+    removed = AuditRotation.apply_retention(log_dir, today, (today - date(2026, 2, 10)).days)
+
+    assert removed == ['audit_202601.zip']
+    entries, _ = index.query(limit=100)
+    assert {entry['timestamp'][:8] for entry in entries} == {'20260205', '20260215'}
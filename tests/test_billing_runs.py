@@ -0,0 +1,86 @@
+"""
+Execuções de faturamento em lotes (BillingRun): cada faixa de matrículas
+em sua transação, sem mensalidades duplicadas, retomando a execução não
+concluída do mês e avançadas pelo cliente no endpoint legado.
+"""
+import itertools
+from datetime import date
+from app import app, db
+from billing_service import BillingService
+from models import Enrollment, Payment
+
+# Um mês de referência por teste: o banco é compartilhado entre os testes
+_months = itertools.count(1)
+
+def next_month():
+    number = next(_months)
+    return 2050 + number // 12, number % 12 + 1
+
+def enroll(make_student, course, count):
+    enrollments = [Enrollment(student_id=make_student().id, course_id=course.id,
+                              status='active', monthly_payment=150) for _ in range(count)]
+    db.session.add_all(enrollments)
+    db.session.commit()
+    return enrollments
+
+def payments_for(enrollments, year, month):
+    return Payment.query.filter(
+        Payment.enrollment_id.in_([enrollment.id for enrollment in enrollments]),
+        Payment.reference_month == date(year, month, 1)
+    ).all()
+
+def test_run_processes_every_chunk_once(make_student, make_course):
+    enrollments = enroll(make_student, make_course(), 5)
+    year, month = next_month()
+
+    run = BillingService.start_run(year, month, chunk_size=2)
+    chunks = 1
+    while not BillingService.process_chunk(run):
+        chunks += 1
+
+    assert run.status == 'completed'
+    assert chunks > 1
+    assert run.processed_enrollments == run.total_enrollments
+    payments = payments_for(enrollments, year, month)
+    assert sorted(payment.enrollment_id for payment in payments) == sorted(e.id for e in enrollments)
+    assert all(payment.due_date == date(year, month, BillingService.DUE_DAY) for payment in payments)
+
+def test_second_run_creates_nothing(make_student, make_course):
+    enrollments = enroll(make_student, make_course(), 3)
+    year, month = next_month()
+
+    BillingService.run_to_completion(BillingService.start_run(year, month))
+    again = BillingService.run_to_completion(BillingService.start_run(year, month))
+
+    assert again.created_payments == 0
+    assert len(payments_for(enrollments, year, month)) == 3
+
+def test_start_run_resumes_unfinished_run(make_student, make_course):
+    enroll(make_student, make_course(), 3)
+    year, month = next_month()
+
+    run = BillingService.start_run(year, month, chunk_size=1)
+    BillingService.process_chunk(run)
+    assert run.status == 'running'
+
+    assert BillingService.start_run(year, month).id == run.id
+
+def test_legacy_endpoint_only_starts_the_run(make_user, make_student, make_course):
+    enrollments = enroll(make_student, make_course(), 2)
+    admin_id = make_user('admin').id
+    db.session.commit()
+    year, month = next_month()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+    response = client.post('/admin/generate-monthly-payments', json={'year': year, 'month': month})
+
+    assert response.status_code == 202
+    assert response.json['status'] == 'pending'
+    assert response.headers['Location'] == f"/admin/billing-runs/{response.json['id']}"
+    assert payments_for(enrollments, year, month) == []
+
+    while client.post(f"/admin/billing-runs/{response.json['id']}/advance").json['status'] != 'completed':
+        pass
+    assert len(payments_for(enrollments, year, month)) == 2
@@ -0,0 +1,162 @@
+"""
+Invalidação de caches por versão de tabela: o incremento de
+table_versions no commit, os hooks on_commit, o ETag das views da API, a
+identidade do usuário em cache e a revogação de tokens da API.
+"""
+import pytest
+from sqlalchemy import event, update
+from app import app, db
+import table_versions
+from identity import load_identity
+from models import Room, User
+from table_versions import on_commit
+
+@pytest.fixture(autouse=True)
+def fresh_versions(monkeypatch):
+    # Hooks registrados no teste não sobrevivem a ele; versões relidas sempre
+    monkeypatch.setattr(table_versions, '_commit_hooks', list(table_versions._commit_hooks))
+    monkeypatch.setitem(app.config, 'TABLE_VERSION_REFRESH', 0)
+
+def other_process(*statements):
+    """Altera o banco como outro worker: outra conexão, mesma regra de versão"""
+    with db.engine.begin() as connection:
+        tables = set()
+        for statement in statements:
+            connection.execute(statement)
+            tables.add(statement.table.name)
+        table_versions._bump(connection, tables)
+
+def api_headers(client, email):
+    response = client.post('/api/v1/auth/token', json={'email': email, 'password': 'x'})
+    return {'Authorization': f"Bearer {response.json['token']}"}
+
+def test_commit_bumps_changed_tables_only(make_room):
+    rooms, users = table_versions.table_versions('rooms', 'users')
+    make_room()
+    db.session.commit()
+    assert table_versions.table_versions('rooms', 'users') == (rooms + 1, users)
+
+def test_rollback_does_not_bump(make_room):
+    before = table_versions.table_versions('rooms')
+    make_room()
+    db.session.rollback()
+    db.session.commit()
+    assert table_versions.table_versions('rooms') == before
+
+def test_bulk_statement_bumps(make_room):
+    make_room()
+    db.session.commit()
+    before, = table_versions.table_versions('rooms')
+
+    db.session.execute(update(Room).values(is_available=True))
+    db.session.commit()
+    assert table_versions.table_versions('rooms') == (before + 1,)
+
+def test_hook_receives_committed_versions(make_room):
+    seen = []
+    on_commit(lambda session, versions: seen.append(versions))
+
+    make_room()
+    db.session.commit()
+    assert seen == [{'rooms': table_versions.table_versions('rooms')[0]}]
+
+    db.session.commit()
+    assert seen[-1] == {}
+
+def test_hook_error_does_not_undo_commit(make_room):
+    @on_commit
+    def broken(session, versions):
+        raise RuntimeError('índice quebrado')
+
+    room_id = make_room().id
+    db.session.commit()
+    assert db.session.get(Room, room_id) is not None
+
+def test_bump_failure_fails_the_commit(monkeypatch, make_room):
+    def unavailable(connection, tables):
+        raise RuntimeError('table_versions indisponível')
+    monkeypatch.setattr(table_versions, '_bump', unavailable)
+    before = table_versions.table_versions('rooms')
+
+    room = make_room()
+    name = room.name
+    with pytest.raises(RuntimeError):
+        db.session.commit()
+    db.session.rollback()
+
+    monkeypatch.undo()
+    assert Room.query.filter_by(name=name).count() == 0
+    assert table_versions.table_versions('rooms') == before
+
+def test_etag_revalidation(make_user, make_course):
+    email = make_user('admin').email
+    make_course()
+    db.session.commit()
+    client = app.test_client()
+    headers = api_headers(client, email)
+
+    first = client.get('/api/v1/courses', headers=headers)
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag.startswith('W/')
+
+    cached = client.get('/api/v1/courses', headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+
+    make_course()
+    db.session.commit()
+    changed = client.get('/api/v1/courses', headers={**headers, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+def test_identity_follows_other_process(make_user):
+    user_id = make_user('admin').id
+    db.session.commit()
+    assert load_identity(user_id).user_type == 'admin'
+
+    other_process(update(User.__table__).where(User.id == user_id).values(user_type='secretary'))
+    db.session.expunge_all()
+    assert load_identity(user_id).user_type == 'secretary'
+
+def test_identity_cache_skips_database(make_student):
+    user_id = make_student().user_id
+    db.session.commit()
+    load_identity(user_id)
+    db.session.expunge_all()
+
+    statements = []
+    def count(*args):
+        statements.append(args)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        user = load_identity(user_id)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    # Só a leitura das versões (TABLE_VERSION_REFRESH = 0)
+    assert len(statements) == 1
+    assert user.id == user_id
+
+def test_token_revoked_on_privilege_change(make_user):
+    user = make_user('admin')
+    db.session.commit()
+    client = app.test_client()
+    headers = api_headers(client, user.email)
+
+    user.full_name = 'Outro Nome'
+    db.session.commit()
+    assert client.get('/api/v1/courses', headers=headers).status_code == 200
+
+    user.user_type = 'secretary'
+    db.session.commit()
+    assert client.get('/api/v1/courses', headers=headers).status_code == 401
+
+def test_token_revoked_on_deactivation(make_user):
+    user = make_user('admin')
+    db.session.commit()
+    client = app.test_client()
+    headers = api_headers(client, user.email)
+
+    user.is_active = False
+    db.session.commit()
+    assert client.get('/api/v1/courses', headers=headers).status_code == 401
@@ -0,0 +1,117 @@
+"""
+Contadores do dashboard (rollup_dashboard_counters) contra as contagens
+reais: depois de cada tipo de alteração, DashboardCounters.current() deve
+ser igual a DashboardCounters.live_counts().
+
+Uso:
+    python -m pytest tests/test_dashboard_counters.py
+"""
+from datetime import date, timedelta
+from app import db
+from models import Enrollment, Payment, User
+from rollups import COUNTER_COLUMNS, DashboardCounters
+
+def assert_counters_match():
+    db.session.expire_all()
+    counters = DashboardCounters.current()
+    stored = {name: getattr(counters, name) for name in COUNTER_COLUMNS}
+    assert stored == DashboardCounters.live_counts()
+
+def test_add_student(make_student):
+    make_student()
+    make_student(active=False)
+    db.session.commit()
+    assert_counters_match()
+
+def test_deactivate_and_reactivate_user(make_student):
+    student = make_student()
+    db.session.commit()
+
+    student.user.is_active = False
+    db.session.commit()
+    assert_counters_match()
+
+    # Objeto expirado: o valor anterior precisa ser carregado no set
+    db.session.expire_all()
+    db.session.get(User, student.user_id).is_active = True
+    db.session.commit()
+    assert_counters_match()
+
+def test_cascade_delete(make_student, make_payment):
+    student = make_student()
+    make_payment(student)
+    make_payment(student, status='paid')
+    db.session.commit()
+    assert_counters_match()
+
+    # User -> Student -> Payment (delete-orphan)
+    db.session.delete(student.user)
+    db.session.commit()
+    assert_counters_match()
+
+def test_payment_status_change(make_student, make_payment):
+    student = make_student()
+    payment = make_payment(student)
+    db.session.commit()
+
+    payment.status = 'paid'
+    db.session.commit()
+    assert_counters_match()
+
+    payment.status = 'pending'
+    db.session.commit()
+    assert_counters_match()
+
+def test_course_toggle(make_course):
+    course = make_course()
+    make_course(active=False)
+    db.session.commit()
+    assert_counters_match()
+
+    course.is_active = False
+    db.session.commit()
+    assert_counters_match()
+
+    course.is_active = True
+    db.session.commit()
+    assert_counters_match()
+
+def test_billing_insert_select(make_student, make_course):
+    from billing_service import BillingService
+
+    course = make_course()
+    for _ in range(3):
+        db.session.add(Enrollment(student_id=make_student().id, course_id=course.id,
+                                  status='active', monthly_payment=180))
+    db.session.commit()
+
+    created = BillingService.generate_monthly_payments(2031, 5)
+    db.session.commit()
+    assert created >= 3
+    assert_counters_match()
+
+def test_overdue_bulk_update(make_student, make_payment):
+    from notification_service import NotificationService
+
+    student = make_student()
+    make_payment(student, due_date=date.today() - timedelta(days=5))
+    make_payment(student, due_date=date.today() - timedelta(days=1))
+    db.session.commit()
+    assert_counters_match()
+
+    NotificationService.check_and_send_payment_reminders()
+    assert Payment.query.filter(Payment.status == 'pending', Payment.due_date < date.today()).count() == 0
+    assert_counters_match()
+
+def test_reconcile_repairs_drift(make_student, make_payment):
+    student = make_student()
+    make_payment(student)
+    db.session.commit()
+
+    # DELETE direto na tabela não passa pelos eventos de flush
+    db.session.execute(Payment.__table__.delete().where(Payment.student_id == student.id))
+    db.session.commit()
+    drift = DashboardCounters.reconcile()
+    db.session.commit()
+    assert 'pending_payments' in drift
+    assert_counters_match()
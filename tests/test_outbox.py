@@ -0,0 +1,89 @@
+"""
+Outbox de e-mails: a mensagem nasce na transação do negócio, o worker
+reserva e envia em lote, e as falhas voltam com backoff até virarem
+dead letter. Inclui o envio real com DEBUG ligado.
+"""
+from datetime import datetime, timedelta
+import pytest
+from app import app, db
+import outbox_service
+import utils
+from models import OutboxEmail
+from outbox_service import OutboxService
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+    OutboxEmail.query.delete()
+    db.session.commit()
+
+def failing(messages):
+    return [{'recipients': message['recipients'], 'success': False, 'error': 'recusado'} for message in messages]
+
+def test_enqueue_follows_the_business_transaction():
+    OutboxService.enqueue_email('Descartado', 'corpo', 'a@example.com')
+    db.session.rollback()
+    assert OutboxEmail.query.count() == 0
+
+    OutboxService.enqueue_email('Gravado', 'corpo', 'a@example.com')
+    db.session.commit()
+    assert OutboxEmail.query.one().status == 'pending'
+
+def test_process_batch_sends_everything():
+    for i in range(5):
+        OutboxService.enqueue_email(f'Aviso {i}', 'corpo', [f'aluno{i}@example.com'])
+    db.session.commit()
+
+    assert OutboxService.process_batch(threads=2, batch_size=10) == (5, 0)
+    assert {message.status for message in OutboxEmail.query} == {'sent'}
+    assert OutboxService.process_batch() == (0, 0)
+
+def test_failure_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(outbox_service, 'send_bulk_emails', failing)
+    OutboxService.enqueue_email('Aviso', 'corpo', 'a@example.com')
+    db.session.commit()
+
+    assert OutboxService.process_batch() == (0, 1)
+    message = OutboxEmail.query.one()
+    assert (message.status, message.attempts, message.last_error) == ('pending', 1, 'recusado')
+    assert message.next_attempt_at > datetime.utcnow()
+
+    # Ainda no backoff: nada a enviar
+    assert OutboxService.process_batch() == (0, 0)
+
+def test_dead_letter_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(outbox_service, 'send_bulk_emails', failing)
+    monkeypatch.setitem(app.config, 'OUTBOX_MAX_ATTEMPTS', 2)
+    OutboxService.enqueue_email('Aviso', 'corpo', 'a@example.com')
+    db.session.commit()
+
+    OutboxService.process_batch()
+    message = OutboxEmail.query.one()
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    OutboxService.process_batch()
+
+    assert OutboxEmail.query.one().status == 'dead'
+
+def test_expired_lease_is_claimed_again():
+    message = OutboxService.enqueue_email('Aviso', 'corpo', 'a@example.com')
+    message.status = 'sending'
+    message.claim_token = 'worker-interrompido'
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert [claimed.id for claimed in OutboxService.claim_batch(10)] == [message.id]
+    assert OutboxService.claim_batch(10) == []
+
+def test_smtp_failure_is_reported_with_debug_on(monkeypatch):
+    monkeypatch.setitem(app.config, 'DEBUG', True)
+    monkeypatch.setitem(app.config, 'MAIL_SUPPRESS_SEND', False)
+
+    def refuse(self, msg):
+        raise ConnectionRefusedError('servidor fora do ar')
+    monkeypatch.setattr(utils._SMTPSession, 'send', refuse)
+    monkeypatch.setattr(utils.mail, 'send', lambda msg: refuse(None, msg))
+
+    assert utils.send_email('Aviso', 'corpo', 'a@example.com') is False
+    results = utils.send_bulk_emails([{'subject': 'Aviso', 'body': 'corpo', 'recipients': ['a@example.com']}], retries=0)
+    assert results[0]['success'] is False
+    assert 'servidor fora do ar' in results[0]['error']
@@ -0,0 +1,127 @@
+"""
+Conflitos da grade semanal: a lista de intervalos contra uma busca
+completa, a verificação de uma grade inteira e o índice em memória
+acompanhando os commits deste e de outros processos.
+"""
+import random
+from datetime import time
+import pytest
+from sqlalchemy import insert
+from app import app, db
+import table_versions
+from models import Schedule
+from schedule_conflicts import IntervalList, Slot, _index, find_conflicts, schedule_conflicts
+
+@pytest.fixture
+def resources(make_course, make_room):
+    course, room = make_course(), make_room()
+    db.session.commit()
+    return course, course.teacher_id, room.id
+
+def add_schedule(course, teacher_id, room_id, day, start, end):
+    schedule = Schedule(course_id=course.id, teacher_id=teacher_id, room_id=room_id,
+                        day_of_week=day, start_time=start, end_time=end, is_active=True)
+    db.session.add(schedule)
+    db.session.commit()
+    return schedule
+
+def test_interval_list_matches_brute_force():
+    rng = random.Random(7)
+    intervals = IntervalList()
+    present = set()
+    for ref_id in range(300):
+        start = rng.randrange(0, 1380)
+        item = (start, start + rng.randrange(1, 240), ref_id)
+        intervals.add(item)
+        present.add(item)
+        if rng.random() < 0.3:
+            removed = rng.choice(sorted(present))
+            intervals.remove(removed)
+            present.discard(removed)
+
+        start = rng.randrange(0, 1400)
+        end = start + rng.randrange(1, 120)
+        expected = {item for item in present if item[0] < end and item[1] > start}
+        assert set(intervals.overlapping(start, end)) == expected
+
+def test_touching_intervals_do_not_conflict(resources):
+    course, teacher_id, room_id = resources
+    add_schedule(course, teacher_id, room_id, 0, time(8), time(9))
+
+    assert schedule_conflicts(teacher_id, room_id, 0, time(9), time(10)) == []
+    assert schedule_conflicts(teacher_id, room_id, 1, time(8), time(9)) == []
+
+def test_teacher_and_room_conflicts(resources, make_teacher, make_room):
+    course, teacher_id, room_id = resources
+    schedule = add_schedule(course, teacher_id, room_id, 2, time(14), time(16))
+
+    by_teacher = schedule_conflicts(teacher_id, make_room().id, 2, time(15), time(17))
+    by_room = schedule_conflicts(make_teacher().id, room_id, 2, time(13), time(14, 30))
+    assert [(c.resource, c.schedule_id) for c in by_teacher] == [('teacher', schedule.id)]
+    assert [(c.resource, c.schedule_id) for c in by_room] == [('room', schedule.id)]
+
+    # Editar o próprio horário não conflita com ele mesmo
+    assert schedule_conflicts(teacher_id, room_id, 2, time(14), time(17), exclude_id=schedule.id) == []
+
+def test_find_conflicts_checks_the_list_itself(resources, make_room):
+    course, teacher_id, room_id = resources
+    replaced = add_schedule(course, teacher_id, room_id, 3, time(8), time(10))
+    kept = add_schedule(course, teacher_id, room_id, 3, time(18), time(19))
+
+    found = find_conflicts([
+        Slot(teacher_id, room_id, 3, time(8), time(10)),
+        Slot(teacher_id, make_room().id, 3, time(9), time(11)),
+        Slot(teacher_id, room_id, 3, time(18, 30), time(20)),
+    ], exclude_ids=[replaced.id])
+
+    assert set(found) == {1, 2}
+    assert [(c.schedule_id, c.other_slot) for c in found[1]] == [(None, 0)]
+    assert {c.schedule_id for c in found[2]} == {kept.id}
+
+def test_index_follows_commits(resources):
+    course, teacher_id, room_id = resources
+    schedule = add_schedule(course, teacher_id, room_id, 4, time(10), time(11))
+    assert len(schedule_conflicts(teacher_id, room_id, 4, time(10), time(11))) == 2
+
+    version = _index.version
+    schedule.start_time, schedule.end_time = time(12), time(13)
+    db.session.commit()
+    assert _index.version == version + 1
+    assert schedule_conflicts(teacher_id, room_id, 4, time(10), time(11)) == []
+
+    schedule.is_active = False
+    db.session.commit()
+    assert schedule_conflicts(teacher_id, room_id, 4, time(12), time(13)) == []
+
+def test_change_from_other_process_reloads(resources):
+    course, teacher_id, room_id = resources
+    assert schedule_conflicts(teacher_id, room_id, 5, time(9), time(10)) == []
+
+    # Outro worker grava um horário: o índice deste processo não viu o commit
+    with db.engine.begin() as connection:
+        connection.execute(insert(Schedule), {
+            'course_id': course.id, 'teacher_id': teacher_id, 'room_id': room_id,
+            'day_of_week': 5, 'start_time': time(9), 'end_time': time(10), 'is_active': True
+        })
+        table_versions._bump(connection, {'schedules'})
+
+    assert len(schedule_conflicts(teacher_id, room_id, 5, time(9, 30), time(11))) == 2
+
+def test_conflicting_schedule_is_rejected_by_route(resources, make_user):
+    course, teacher_id, room_id = resources
+    add_schedule(course, teacher_id, room_id, 6, time(8), time(9))
+    admin_id = make_user('admin').id
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+    def post(start, end):
+        client.post('/admin/schedule/add', data={
+            'course_id': course.id, 'teacher_id': teacher_id, 'room_id': room_id,
+            'day_of_week': 6, 'start_time': start, 'end_time': end
+        })
+        return Schedule.query.filter_by(room_id=room_id, day_of_week=6).count()
+
+    assert post('08:30', '09:30') == 1
+    assert post('09:00', '10:00') == 2
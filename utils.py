@@ -1,6 +1,11 @@
 import os
+import threading
+import time
+import unicodedata
+from functools import lru_cache
 from flask import current_app
 from flask_mail import Message
+from sqlalchemy import event
 from app import mail
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'mp3', 'mp4', 'doc', 'docx'}
@@ -9,6 +14,14 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _build_message(subject, body, recipients, sender=None):
+    return Message(
+        subject=subject,
+        sender=sender or current_app.config['MAIL_DEFAULT_SENDER'],
+        recipients=recipients if isinstance(recipients, list) else [recipients],
+        body=body
+    )
+
 def send_email(subject, body, recipients, sender=None):
     """Send email notification"""
     try:
@@ -17,20 +30,123 @@ def send_email(subject, body, recipients, sender=None):
             current_app.logger.info(f'Email suprimido - Para: {recipients}, Assunto: {subject}')
             return True
 
-        msg = Message(
-            subject=subject,
-            sender=sender or current_app.config['MAIL_DEFAULT_SENDER'],
-            recipients=recipients if isinstance(recipients, list) else [recipients],
-            body=body
-        )
+        msg = _build_message(subject, body, recipients, sender)
         mail.send(msg)
         return True
     except Exception as e:
+        # Falha real também em DEBUG: para só simular o envio, use MAIL_SUPPRESS_SEND
         current_app.logger.error(f'Error sending email: {e}')
-        # Em desenvolvimento, considerar como sucesso para não quebrar o fluxo
-        if current_app.config.get('DEBUG', False):
-            current_app.logger.info(f'Email simulado em modo debug - Para: {recipients}')
-            return True
+        return False
+
+class _SMTPSession:
+    """Conexão SMTP reaproveitada entre mensagens, reaberta sob demanda"""
+
+    def __init__(self):
+        self.connection = None
+
+    def send(self, msg):
+        if self.connection is None:
+            self.connection = mail.connect()
+            self.connection.__enter__()
+        self.connection.send(msg)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.__exit__(None, None, None)
+            except Exception:
+                pass  # Servidor já encerrou a conexão
+            self.connection = None
+
+def send_bulk_emails(messages, batch_size=None, max_per_second=None, retries=1):
+    """
+    Envia várias mensagens reaproveitando a conexão SMTP.
+
+    Args:
+        messages: iterável de dicts com subject, body, recipients e sender (opcional)
+        batch_size: mensagens por conexão (padrão: MAIL_BATCH_SIZE)
+        max_per_second: limite de envio (padrão: MAIL_MAX_PER_SECOND; 0 = sem limite)
+        retries: novas tentativas por mensagem, cada uma em uma conexão nova
+
+    Returns:
+        list: um dict por mensagem, na mesma ordem, com recipients, success e error
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('MAIL_BATCH_SIZE', 50)
+    max_per_second = config.get('MAIL_MAX_PER_SECOND', 0) if max_per_second is None else max_per_second
+    min_interval = 1.0 / max_per_second if max_per_second else 0
+    suppress = config.get('MAIL_SUPPRESS_SEND', False)
+
+    results = []
+    smtp = _SMTPSession()
+    sent_on_connection = 0
+    last_sent_at = 0.0
+
+    try:
+        for message in messages:
+            recipients = message['recipients']
+
+            if suppress:
+                current_app.logger.info(f'Email suprimido - Para: {recipients}, Assunto: {message["subject"]}')
+                results.append({'recipients': recipients, 'success': True, 'error': None})
+                continue
+
+            # Lotes limitados por conexão (provedores limitam mensagens por sessão)
+            if sent_on_connection >= batch_size:
+                smtp.close()
+                sent_on_connection = 0
+
+            error = None
+            for attempt in range(retries + 1):
+                if min_interval:
+                    wait = last_sent_at + min_interval - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                try:
+                    msg = _build_message(message['subject'], message['body'], recipients, message.get('sender'))
+                    last_sent_at = time.monotonic()
+                    smtp.send(msg)
+                    sent_on_connection += 1
+                    error = None
+                    break
+                except Exception as e:
+                    error = str(e)
+                    current_app.logger.warning(f'Falha ao enviar e-mail para {recipients} (tentativa {attempt + 1}): {e}')
+                    # Reconectar antes da próxima tentativa/mensagem
+                    smtp.close()
+                    sent_on_connection = 0
+
+            results.append({'recipients': recipients, 'success': error is None, 'error': error})
+    finally:
+        smtp.close()
+
+    return results
+
+class QueryCounter:
+    """
+    Conta os comandos SQL executados pela thread atual no engine.
+
+    Uso:
+        with QueryCounter(db.engine) as counter:
+            ...
+        counter.count
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self._thread_id = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self._thread_id:
+            self.count += 1
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._before_cursor_execute)
         return False
 
 def get_file_size(file_path):
@@ -59,6 +175,15 @@ def format_phone(phone):
     else:
         return phone
 
+@lru_cache(maxsize=4096)
+def _fold_char(char):
+    base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c)).lower()
+    return base if len(base) == 1 else char
+
+def fold_text(text):
+    """Minúsculas e sem acentos ('João Ávila' -> 'joao avila'), com o mesmo tamanho do texto original"""
+    return ''.join(_fold_char(char) for char in text or '')
+
 # Template filters
 def register_template_filters(app):
     @app.template_filter('currency')